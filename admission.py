@@ -0,0 +1,194 @@
+"""
+Admission control for LLM-bound requests.
+
+An AdmissionController bounds how many requests may be waiting on an upstream
+model at once. Requests beyond that wait in a queue of bounded depth for at
+most queue_timeout seconds, and each caller (user, or client address for
+anonymous chat) may hold at most per_user running-or-queued places. A freed
+slot is handed to waiting callers round-robin by user, so one user's burst
+cannot starve everyone else. Whatever cannot be admitted fails fast with
+Rejected -- 429 for a per-user quota, 503 when saturated -- carrying a
+Retry-After estimate. Cheap routes never touch a controller, so they keep
+their workers and their latency under LLM-heavy load.
+
+acquire() blocks the calling thread while queued; acquire_async() is the same
+queue for asyncio callers (asgi.py). Controllers passed to register() are
+reported by get_stats().
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+
+HOLD_EWMA_ALPHA = 0.2
+
+
+class Rejected(Exception):
+    def __init__(self, message, status, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Ticket:
+    def __init__(self, user):
+        self.user = user
+        self.started = time.monotonic()
+        self.granted = False
+        self.released = False
+        self.wake = None  # set while queued; called under the controller lock when the slot is granted
+
+
+class AdmissionController:
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout, per_user):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.per_user = per_user
+        self.stats = {"admitted": 0, "queued": 0, "rejected_user": 0, "rejected_full": 0, "timed_out": 0}
+        self._active = 0
+        self._queued = 0
+        self._outstanding = Counter()  # user -> running + queued
+        self._waiting = OrderedDict()  # user -> deque of Tickets; iteration order is the round-robin turn
+        self._hold_ewma = None
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """Whole seconds until the queue ahead is likely to have drained (at least 1)."""
+        hold = self._hold_ewma or 1.0
+        return max(1, math.ceil(hold * (self._queued + 1) / self.max_concurrent))
+
+    def _enter(self, ticket):
+        """Grant ticket a slot (True), queue it (False) or raise Rejected. Caller holds the lock."""
+        user = ticket.user
+        if self._outstanding[user] >= self.per_user:
+            self.stats["rejected_user"] += 1
+            raise Rejected(f"Too many {self.name} requests in progress for this user", 429, self.retry_after())
+        if self._active < self.max_concurrent and not self._queued:
+            self._active += 1
+            self._outstanding[user] += 1
+            self.stats["admitted"] += 1
+            ticket.granted = True
+            return True
+        if self._queued >= self.max_queue:
+            self.stats["rejected_full"] += 1
+            raise Rejected(f"The {self.name} service is busy, please retry shortly", 503, self.retry_after())
+        self._waiting.setdefault(user, deque()).append(ticket)
+        self._queued += 1
+        self._outstanding[user] += 1
+        self.stats["queued"] += 1
+        return False
+
+    def _leave_queue(self, ticket):
+        """Drop a still-queued ticket. Caller holds the lock."""
+        queue = self._waiting[ticket.user]
+        queue.remove(ticket)
+        if not queue:
+            del self._waiting[ticket.user]
+        self._queued -= 1
+        self._release_user(ticket.user)
+
+    def _timed_out(self, ticket):
+        with self._lock:
+            if ticket.granted:  # possibly granted just as the wait timed out
+                return ticket
+            self._leave_queue(ticket)
+            self.stats["timed_out"] += 1
+        raise Rejected(f"Timed out waiting for a {self.name} slot", 503, self.retry_after())
+
+    def acquire(self, user):
+        """Take a slot for user, waiting in the fair queue if needed. Raises Rejected."""
+        ticket = Ticket(user)
+        granted = threading.Event()
+        ticket.wake = granted.set
+        with self._lock:
+            if self._enter(ticket):
+                return ticket
+        granted.wait(self.queue_timeout)
+        return self._timed_out(ticket)
+
+    async def acquire_async(self, user):
+        """acquire() for asyncio callers: the wait in the queue holds no thread."""
+        loop = asyncio.get_running_loop()
+        ticket = Ticket(user)
+        granted = loop.create_future()
+        ticket.wake = lambda: loop.call_soon_threadsafe(_resolve, granted)
+        with self._lock:
+            if self._enter(ticket):
+                return ticket
+        try:
+            await asyncio.wait_for(granted, self.queue_timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:  # the client went away while queued
+            with self._lock:
+                if not ticket.granted:
+                    self._leave_queue(ticket)
+            self.release(ticket)
+            raise
+        return self._timed_out(ticket)
+
+    def release(self, ticket):
+        """Give a slot back, handing it straight to the next user in turn if anyone is waiting."""
+        with self._lock:
+            if ticket.released or not ticket.granted:
+                return
+            ticket.released = True
+            hold = time.monotonic() - ticket.started
+            self._hold_ewma = hold if self._hold_ewma is None else (
+                HOLD_EWMA_ALPHA * hold + (1 - HOLD_EWMA_ALPHA) * self._hold_ewma)
+            self._release_user(ticket.user)
+
+            if not self._waiting:
+                self._active -= 1
+                return
+            user, queue = next(iter(self._waiting.items()))
+            waiter = queue.popleft()
+            if queue:
+                self._waiting.move_to_end(user)  # next time it is someone else's turn
+            else:
+                del self._waiting[user]
+            self._queued -= 1
+            self.stats["admitted"] += 1
+            waiter.granted = True
+            waiter.started = time.monotonic()
+            waiter.wake()
+
+    def _release_user(self, user):
+        self._outstanding[user] -= 1
+        if self._outstanding[user] <= 0:
+            del self._outstanding[user]
+
+    def get_stats(self):
+        with self._lock:
+            return dict(
+                self.stats,
+                active=self._active,
+                queued_now=self._queued,
+                users_waiting=len(self._waiting),
+                max_concurrent=self.max_concurrent,
+                max_queue=self.max_queue,
+                queue_timeout=self.queue_timeout,
+                per_user=self.per_user,
+                avg_hold_seconds=round(self._hold_ewma, 3) if self._hold_ewma is not None else None,
+            )
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+_controllers = []
+
+
+def register(controller):
+    """Include a controller in get_stats()."""
+    _controllers.append(controller)
+    return controller
+
+
+def get_stats():
+    return {c.name: c.get_stats() for c in _controllers}
@@ -1,11 +1,95 @@
-from flask import Flask, render_template, request, jsonify, session, redirect, flash, send_from_directory, url_for
+from flask import Flask, render_template, request, jsonify, session, redirect, flash, url_for, make_response, Response, stream_with_context, g
+import click
+import admission
+import assets
 import backend
+import doc_index
+import images
+import jobs
+import llm_gateway
+import metrics
+import retrieval
 import os
+import time
+import hashlib
+import json
+import functools
+import threading
+from datetime import datetime, timezone
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
 app.secret_key = "supersecretkey"  # change to env variable in production
 
+# Hand each request's pooled SQLite connection back once the request ends
+app.teardown_appcontext(backend.release_conn)
+
+# Keep the docs/ full-text index current (only new or changed PDFs are re-read),
+# then load the chat retrieval index built from it
+def _index_docs():
+    try:
+        stats = doc_index.reindex_docs()
+        if stats["indexed"] or stats["removed"]:
+            print(f"🔎 Docs index: {len(stats['indexed'])} indexed, {len(stats['removed'])} removed")
+        retrieval.load_or_build()
+    except Exception as e:
+        print("⚠️ Docs indexing failed:", e)
+    finally:
+        backend.release_conn()
+
+_services_started = False
+_services_lock = threading.Lock()
+
+def start_background_services():
+    """
+    Server-start hook, once per serving process: resume stale analysis jobs and
+    refresh the docs indexes. Not run on import, so `flask` CLI commands and
+    scripts leave the live server's jobs alone. Called by `python app.py`,
+    asgi.py's lifespan startup and server() (gunicorn "app:server()").
+    """
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        _services_started = True
+    jobs.start()
+    threading.Thread(target=_index_docs, daemon=True).start()
+
+def server():
+    """WSGI application factory for production servers: `gunicorn "app:server()"`."""
+    start_background_services()
+    return app
+
+# =========================
+# Request metrics (served at /metrics)
+# =========================
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "cmat_http_request_duration_seconds", "Time to produce a response (streams: until it starts)",
+    ("method", "route"))
+HTTP_RESPONSES = metrics.counter("cmat_http_responses_total", "Responses by route and status code",
+                                 ("method", "route", "status"))
+
+def observe_request(method, route, status, seconds):
+    HTTP_REQUEST_SECONDS.observe(seconds, method=method, route=route)
+    HTTP_RESPONSES.inc(method=method, route=route, status=str(status))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop("request_started", None)
+    if started is not None:
+        # the URL rule, not the path, so /news/<int:news_id> is one series
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        observe_request(request.method, route, response.status_code, time.perf_counter() - started)
+    return response
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 # =========================
 # Static / Upload Config
 # =========================
@@ -17,14 +101,123 @@ app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def process_uploaded_image(image_path):
+    """Generate resized derivatives for a freshly saved upload; never fails the upload."""
+    try:
+        images.process_image(image_path)
+    except Exception as e:
+        print(f"⚠️ Could not build image variants for {image_path}:", e)
+
+app.jinja_env.globals["image_srcset"] = images.image_srcset
+
+@app.cli.command("backfill-images")
+def backfill_images():
+    """Build resized WebP variants for every image in static/images."""
+    processed, before, after = images.backfill()
+    print(f"✅ {processed} images processed: {before / 1e6:.1f} MB originals -> {after / 1e6:.1f} MB at smallest width")
+
+
+# =========================
+# Fingerprinted assets
+# =========================
+# url_for("static"/"download_file", filename=...) gains ?v=<content hash>;
+# both endpoints serve through assets.send_asset (immutable caching + gzip/br).
+ASSET_ENDPOINTS = {"static": "static", "download_file": "docs"}
+
+@app.url_defaults
+def fingerprint_asset_urls(endpoint, values):
+    root = ASSET_ENDPOINTS.get(endpoint)
+    if root and "filename" in values and "v" not in values:
+        version = assets.fingerprint(root, values["filename"])
+        if version:
+            values["v"] = version
+
+def serve_static(filename):
+    return assets.send_asset("static", filename)
+
+app.view_functions["static"] = serve_static
+
+@app.cli.command("build-assets")
+def build_assets():
+    """Hash static/ and docs/ and write gzip/brotli variants of text assets."""
+    manifest = assets.build()
+    compressed = sum(1 for entry in manifest.values() if entry["encodings"])
+    print(f"✅ {len(manifest)} assets fingerprinted, {compressed} precompressed -> {assets.BUILD_DIR}")
+
+
+# =========================
+# Conditional GET (ETag / Last-Modified)
+# =========================
+# Pages and APIs built from news/projects only change when those tables do, so
+# they are keyed on backend.get_data_version(). The ETag also covers the path,
+# query and the logged-in user/role (the nav differs). Rendered pages also
+# depend on the templates and the ?v= fingerprints of static files, so they
+# add RENDER_VERSION: CMAT_APP_VERSION if set, else a content hash of
+# templates/ and static/. It is the same in every worker and across restarts,
+# and changes whenever a deploy changes what a page would render.
+def _render_version():
+    version = os.getenv("CMAT_APP_VERSION")
+    h = hashlib.sha1()
+    newest = 0.0
+    for folder in ("templates", "static"):
+        top = os.path.join(app.root_path, folder)
+        for dirpath, dirs, files in os.walk(top):
+            # derived image variants are regenerated from the originals
+            dirs[:] = sorted(d for d in dirs
+                             if os.path.relpath(os.path.join(dirpath, d), top) != images.DERIVED_DIR)
+            for name in sorted(files):
+                path = os.path.join(dirpath, name)
+                newest = max(newest, os.path.getmtime(path))
+                if not version:
+                    h.update(os.path.relpath(path, app.root_path).encode("utf-8"))
+                    with open(path, "rb") as f:
+                        h.update(hashlib.sha1(f.read()).digest())
+    return version or h.hexdigest()[:12], newest
+
+RENDER_VERSION, RENDER_MTIME = _render_version()
+
+def conditional_on(*datasets, templated=True):
+    """ETag/Last-Modified for a view; templated=False for JSON APIs that render no template."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if session.get("_flashes"):
+                return view(*args, **kwargs)  # one-off messages must render
+
+            version, updated_at = backend.get_data_version(*datasets)
+            parts = [request.full_path, version, str(session.get("user")), str(session.get("role"))]
+            if templated:
+                parts.append(RENDER_VERSION)
+                updated_at = max(updated_at, RENDER_MTIME)
+            etag = hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+            last_modified = datetime.fromtimestamp(int(updated_at), timezone.utc)
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                not_modified = bool(request.if_modified_since and request.if_modified_since >= last_modified)
+
+            response = app.response_class(status=304) if not_modified else make_response(view(*args, **kwargs))
+            if response.status_code in (200, 304):
+                response.set_etag(etag)
+                response.last_modified = last_modified
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
 
 # =========================
 # Navigation + Content
 # =========================
+HOME_NEWS_LIMIT = 12
+
 @app.route("/")
+@conditional_on("news")
 def home():
-    news = backend.get_news()   # fetch from DB
-    return render_template("index.html", page="home", news=news)
+    news = backend.get_news_page(limit=HOME_NEWS_LIMIT)["items"]   # latest cards only
+    return render_template("index.html", page="home", news=news, news_count=backend.count_news())
 
 # Legacy /about now merges into Home – keep the route but redirect so old links work
 @app.route("/about")
@@ -33,6 +226,7 @@ def about():
 
 # New GIS Projects page (moved “Featured Projects” here)
 @app.route("/gis-projects")
+@conditional_on("projects")
 def gis_projects():
     projects = backend.get_projects()
     return render_template("index.html", page="gis_projects", projects=projects)
@@ -55,10 +249,43 @@ def budget():
 def atlas():
     return render_template("index.html", page="atlas")
 
-# API to serve projects (unchanged)
+# API to serve projects. Without parameters it returns the full list as before;
+# ?bbox=min_lon,min_lat,max_lon,max_lat returns only projects in that viewport;
+# ?limit/?cursor return one keyset page: {"items": [...], "next_cursor": ...}
 @app.route("/api/projects")
+@conditional_on("projects", templated=False)
 def api_projects():
-    return jsonify(backend.get_projects())
+    if "bbox" in request.args:
+        try:
+            bbox = backend.parse_bbox(request.args["bbox"])
+            return jsonify(backend.get_projects_in_bbox(*bbox, limit=request.args.get("limit")))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    if "limit" not in request.args and "cursor" not in request.args:
+        return jsonify(backend.get_projects())
+    try:
+        return jsonify(backend.get_projects_page(request.args.get("limit"), request.args.get("cursor")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+# Zoomed-out map view: per-cell counts, summed budget and mean completion
+@app.route("/api/projects/clusters")
+@conditional_on("projects", templated=False)
+def api_project_clusters():
+    try:
+        zoom = int(request.args.get("zoom", 6))
+        bbox = backend.parse_bbox(request.args["bbox"]) if "bbox" in request.args else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(backend.get_project_clusters(zoom, bbox))
+
+@app.route("/api/news")
+@conditional_on("news", templated=False)
+def api_news():
+    try:
+        return jsonify(backend.get_news_page(request.args.get("limit"), request.args.get("cursor")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 
 # =========================
@@ -86,6 +313,7 @@ def add_news():
         filepath = os.path.join(app.config["UPLOAD_FOLDER"], filename)
         image_file.save(filepath)
         image_path = f"images/{filename}"
+        process_uploaded_image(image_path)
 
     backend.add_news(title, content, image_path, session["user"])
     flash("✅ News posted successfully!", "success")
@@ -100,6 +328,7 @@ def delete_news(news_id):
     return redirect(url_for("admin_news"))
 
 @app.route("/news/<int:news_id>")
+@conditional_on("news")
 def news_detail(news_id):
     news_item = backend.get_news_by_id(news_id)
     if not news_item:
@@ -137,6 +366,7 @@ def add_project():
         filename = secure_filename(image_file.filename)
         image_file.save(os.path.join(app.config["UPLOAD_FOLDER"], filename))
         image_path = f"images/{filename}"
+        process_uploaded_image(image_path)
     else:
         image_path = "images/default.jpg"
 
@@ -172,6 +402,7 @@ def update_project(project_id):
         filename = secure_filename(image_file.filename)
         image_file.save(os.path.join(app.config["UPLOAD_FOLDER"], filename))
         image_path = f"images/{filename}"
+        process_uploaded_image(image_path)
     else:
         image_path = request.form.get("current_image")
 
@@ -199,11 +430,35 @@ def delete_project(project_id):
 
 
 # =========================
-# Docs (unchanged)
+# Docs (download + full-text search)
 # =========================
 @app.route("/docs/<path:filename>")
 def download_file(filename):
-    return send_from_directory("docs", filename)
+    return assets.send_asset("docs", filename)
+
+@app.route("/api/docs/search")
+def search_docs():
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify({"error": "q is required"}), 400
+    try:
+        limit = int(request.args.get("limit", 10))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    results = doc_index.search_docs(q, limit)
+    for r in results:
+        r["url"] = url_for("download_file", filename=r["doc"]) + f"#page={r['page']}"
+    return jsonify({"query": q, "results": results})
+
+@app.cli.command("index-docs")
+@click.option("--force", is_flag=True, help="Re-index every PDF, even if unchanged.")
+def index_docs(force):
+    """Build or refresh the full-text and chat retrieval indexes over docs/*.pdf."""
+    stats = doc_index.reindex_docs(force=force)
+    print(f"✅ Docs index: {len(stats['indexed'])} indexed, {stats['unchanged']} unchanged, "
+          f"{len(stats['removed'])} removed, {len(stats['failed'])} failed")
+    index = retrieval.build_index()
+    print(f"✅ Retrieval index: {len(index['passages'])} passages -> {retrieval.INDEX_PATH}")
 
 
 # =========================
@@ -220,7 +475,8 @@ def upload_page():
 def survey():
     return redirect("/budget")
 
-# Analyze endpoint stays the same (used by Budget page)
+# Analyze endpoint (used by Budget page): queues a background job and returns
+# immediately; the page polls /api/jobs/<id> for progress and the result.
 @app.route("/upload/analyze", methods=["POST"])
 def analyze_document():
     if "user" not in session:
@@ -233,21 +489,70 @@ def analyze_document():
         return jsonify({"error": "Empty filename"}), 400
 
     try:
-        text = backend.extract_text_from_pdf(file)
-        data = backend.ai_extract_budget_info(text)
-        graph_data = backend.prepare_graph_data(data)
-
-        if data and "user" in session:
-            backend.save_survey_data(session["user"], data)
-
+        job_id = jobs.submit_analysis(session["user"], file)
         return jsonify({
             "success": True,
-            "raw": data,
-            "graphs": graph_data
-        })
+            "job_id": job_id,
+            "status_url": url_for("job_status", job_id=job_id)
+        }), 202
+    except admission.Rejected as e:
+        return admission_rejected(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Budget line items read straight from the PDF's table layout (no model call)
+@app.route("/api/budget/tables", methods=["POST"])
+def budget_tables():
+    if "user" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    file = request.files.get("pdf")
+    if not file or file.filename == "":
+        return jsonify({"error": "No file uploaded"}), 400
+
+    try:
+        table = backend.extract_budget_tables(file)
+    except Exception as e:
+        return jsonify({"error": f"Could not read PDF: {e}"}), 400
+    return jsonify({
+        "years": [k for k in table if k.isdigit()],
+        "items": backend.budget_table_records(table),
+        "totals": backend.budget_table_totals(table)
+    })
+
+@app.route("/api/jobs/<job_id>")
+def job_status(job_id):
+    if "user" not in session:
+        return jsonify({"error": "Unauthorized"}), 401
+
+    job = jobs.get_job(job_id)
+    if not job or (job["username"] != session["user"] and session.get("role") != "admin"):
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+# AI extraction cache counters (for monitoring) + admin flush
+@app.route("/api/ai-cache/stats")
+def ai_cache_stats():
+    return jsonify(backend.get_ai_cache_stats())
+
+@app.route("/admin/ai-cache/clear", methods=["POST"])
+def clear_ai_cache():
+    if "user" not in session or session.get("role") != "admin":
+        return jsonify({"error": "Unauthorized"}), 401
+    backend.clear_ai_cache()
+    return jsonify({"success": True})
+
+@app.route("/api/chat-cache/stats")
+def chat_cache_stats():
+    return jsonify(backend.get_chat_cache_stats())
+
+@app.route("/admin/chat-cache/clear", methods=["POST"])
+def clear_chat_cache():
+    if "user" not in session or session.get("role") != "admin":
+        return jsonify({"error": "Unauthorized"}), 401
+    backend.clear_chat_cache()
+    return jsonify({"success": True})
+
 # Survey API unchanged (used by Budget page)
 @app.route("/api/survey", methods=["GET", "POST"])
 def survey_api():
@@ -341,65 +646,183 @@ def logout():
 
 
 # =========================
-# Chat API (unchanged)
+# Chat API (grounded in docs/ via retrieval.py)
 # =========================
-@app.route("/api/chat", methods=["POST"])
-def chat():
-    user_message = request.json.get("message")
-    if not user_message:
-        return jsonify({"error": "Message required"}), 400
-
+CHAT_SYSTEM_PROMPT = (
+    "You are a helpful assistant specialized in climate policy, "
+    "finance, and adaptation in Zambia. Always give clear, accurate, "
+    "and structured answers."
+)
+
+chat_flight = llm_gateway.register_flight(llm_gateway.SingleFlight("chat"))
+
+# Bounded concurrency for upstream chat calls (see admission.py); cache hits skip it.
+# Queued requests still occupy a server thread, so concurrency + queue should stay
+# well below the WSGI server's thread count.
+chat_admission = admission.register(admission.AdmissionController(
+    "chat",
+    max_concurrent=int(os.getenv("CMAT_CHAT_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("CMAT_CHAT_QUEUE", "16")),
+    queue_timeout=float(os.getenv("CMAT_CHAT_QUEUE_TIMEOUT", "10")),
+    per_user=int(os.getenv("CMAT_CHAT_PER_USER", "2")),
+))
+
+# Behind a reverse proxy every request arrives from the proxy's address, which
+# would make all anonymous chat share one per-user quota. Set CMAT_PROXY_HOPS to
+# the number of trusted proxies in front of the app to take the client address
+# from X-Forwarded-For instead (entries added by the client itself are ignored).
+PROXY_HOPS = int(os.getenv("CMAT_PROXY_HOPS", "0"))
+
+def client_address():
+    if PROXY_HOPS:
+        forwarded = [a.strip() for a in request.headers.get("X-Forwarded-For", "").split(",") if a.strip()]
+        if len(forwarded) >= PROXY_HOPS:
+            return forwarded[-PROXY_HOPS]
+    return request.remote_addr
+
+def client_identity():
+    """Fairness key for admission control: the logged-in user, else the client address."""
+    return session.get("user") or client_address() or "anonymous"
+
+def admission_rejected(e):
+    response = jsonify({"error": str(e)})
+    response.status_code = e.status
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+def build_chat_prompt(user_message):
+    """System prompt with the top retrieved passages appended, plus their sources."""
+    context, passages = retrieval.build_context(retrieval.retrieve(user_message))
+    if not context:
+        return CHAT_SYSTEM_PROMPT, []
     system_prompt = (
-        "You are a helpful assistant specialized in climate policy, "
-        "finance, and adaptation in Zambia. Always give clear, accurate, "
-        "and structured answers."
+        CHAT_SYSTEM_PROMPT
+        + " Use the numbered excerpts from Zambian policy documents below where relevant and cite them"
+        " as [n]. If they do not cover the question, say so and answer from general knowledge.\n\n"
+        + context
     )
-
-    # Try OpenAI first
+    sources = [
+        {"doc": p["doc"], "page": p["page"],
+         "url": url_for("download_file", filename=p["doc"]) + f"#page={p['page']}"}
+        for p in passages
+    ]
+    return system_prompt, sources
+
+def prepare_chat(user_message):
+    """
+    Cache lookup, then the grounded prompt (needs a request context for url_for).
+    Returns (cached answer or None, messages, sources, context_tag); shared with asgi.py.
+    """
+    # Repeated questions are answered from the chat cache (tagged with the retrieval index)
+    context_tag = retrieval.index_signature()
+    cached = backend.chat_cache_get(user_message, context_tag)
+    if cached:
+        return cached, None, None, context_tag
+
+    system_prompt, sources = build_chat_prompt(user_message)
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_message}
+    ]
+    return None, messages, sources, context_tag
+
+def chat_flight_key(user_message, context_tag):
+    """Concurrent askers of the same (normalized) question share one upstream call."""
+    return backend.chat_cache_key(backend.normalize_question(user_message), backend.chat_cache_tag(context_tag))
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_chat(user_message, messages, sources, context_tag):
+    """SSE body: a sources event, then token events as the provider emits them, then done/error."""
+    yield sse_event("sources", sources)
+    provider, parts = None, []
     try:
-        client = backend.get_client()
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            temperature=0.4
-        )
-        reply = response.choices[0].message["content"]
-        return jsonify({"reply": reply})
+        for provider, delta in llm_gateway.stream_chat(messages):
+            parts.append(delta)
+            yield sse_event("token", {"text": delta})
+        yield sse_event("done", {"provider": provider})
     except Exception as e:
-        print("⚠️ OpenAI chat failed, falling back to DeepSeek:", e)
+        print("❌ Chat stream failed:", e)
+        yield sse_event("error", {"error": "Both OpenAI and DeepSeek failed" if provider is None else "Reply interrupted"})
+        return
+    if parts:
+        backend.chat_cache_put(user_message, "".join(parts), sources, context_tag)
+
+def stream_cached_chat(cached):
+    yield sse_event("sources", cached["sources"])
+    yield sse_event("token", {"text": cached["reply"]})
+    yield sse_event("done", {"provider": "cache"})
+
+def sse_response(body):
+    response = Response(stream_with_context(body), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # don't let a reverse proxy buffer the stream
+    return response
+
+@app.route("/api/chat", methods=["POST"])
+def chat():
+    payload = request.get_json(silent=True)
+    user_message = payload.get("message") if isinstance(payload, dict) else None
+    if not user_message or not isinstance(user_message, str):
+        return jsonify({"error": "Message required"}), 400
+
+    # Streaming mode: {"stream": true} or Accept: text/event-stream
+    streaming = payload.get("stream") or request.accept_mimetypes.best == "text/event-stream"
+
+    cached, messages, sources, context_tag = prepare_chat(user_message)
+    if cached:
+        if streaming:
+            return sse_response(stream_cached_chat(cached))
+        return jsonify({"reply": cached["reply"], "sources": cached["sources"], "cached": True})
+
+    identity = client_identity()
+    if streaming:
+        # the slot is held until the stream finishes, not just until the view returns
+        try:
+            ticket = chat_admission.acquire(identity)
+        except admission.Rejected as e:
+            return admission_rejected(e)
+        response = sse_response(stream_chat(user_message, messages, sources, context_tag))
+        response.call_on_close(lambda: chat_admission.release(ticket))
+        return response
+
+    # Fastest healthy provider (OpenAI/DeepSeek) with failover, see llm_gateway.py.
+    # Only the shared upstream call needs an admission slot.
+    def answer():
+        ticket = chat_admission.acquire(identity)
+        try:
+            result = llm_gateway.chat_completion(messages, temperature=0.4)
+        finally:
+            chat_admission.release(ticket)
+        if result["content"]:
+            backend.chat_cache_put(user_message, result["content"], sources, context_tag)
+        return {"reply": result["content"], "sources": sources}
 
-    # Fallback DeepSeek
     try:
-        import requests
-        deepseek_key = os.getenv("DEEPSEEK_API_KEY")
-        if not deepseek_key:
-            return jsonify({"error": "No DeepSeek API key configured"}), 500
-
-        headers = {"Authorization": f"Bearer {deepseek_key}", "Content-Type": "application/json"}
-        payload = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            "temperature": 0.4
-        }
-
-        r = requests.post("https://api.deepseek.com/chat/completions", headers=headers, json=payload, timeout=30)
-        r.raise_for_status()
-        data = r.json()
-        reply = data.get("choices", [{}])[0].get("message", {}).get("content", "⚠️ No reply content")
-        return jsonify({"reply": reply})
-    except Exception as e:
-        print("❌ DeepSeek chat failed:", e)
+        answered = chat_flight.do(chat_flight_key(user_message, context_tag), answer)
+    except admission.Rejected as e:
+        return admission_rejected(e)
+    except llm_gateway.LLMError as e:
+        print("❌ Chat failed:", e)
         return jsonify({"error": "Both OpenAI and DeepSeek failed"}), 500
+    return jsonify({"reply": answered["reply"] or "⚠️ No reply content", "sources": answered["sources"]})
+
+
+@app.route("/api/llm/stats")
+def llm_stats():
+    return jsonify(llm_gateway.get_stats())
 
+@app.route("/api/admission/stats")
+def admission_stats():
+    return jsonify({**admission.get_stats(), "analysis": jobs.get_admission_stats()})
 
 # =========================
 # Run
 # =========================
+# Threaded dev server; `uvicorn asgi:app` serves the same app with /api/chat on asyncio
 if __name__ == "__main__":
+    # with the reloader only the child process (WERKZEUG_RUN_MAIN) serves requests
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_services()
     app.run(debug=True)
@@ -0,0 +1,226 @@
+"""
+ASGI entry point: the upstream-bound routes on asyncio, everything else on Flask.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+POST /api/chat is served natively on the event loop through the async LLM
+gateway (llm_gateway.achat_completion / astream_chat), so a request waiting
+on the model holds no thread and one process can keep hundreds of upstream
+calls in flight. /upload/analyze stays a Flask view (it only spools the PDF
+and queues a job), but in this mode the jobs themselves run on the loop
+(jobs.attach_loop), awaiting their model calls the same way. Every other route
+is the unchanged Flask app behind a2wsgi's thread pool.
+
+The blocking bits of a chat request (cache lookup, retrieval, session cookie,
+url_for) run in a worker thread inside a Flask request context built from the
+ASGI scope, so both serving modes share app.prepare_chat() and answer alike.
+Native routes report to the same request metrics as the Flask views (/metrics).
+"""
+import asyncio
+import io
+import json
+import os
+import time
+
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from flask import request
+
+import admission
+import app as views
+import backend
+import jobs
+import llm_gateway
+
+flask_app = views.app
+wsgi = WSGIMiddleware(flask_app, workers=int(os.getenv("CMAT_ASGI_WSGI_THREADS", "16")))
+
+# Waiting here costs a coroutine rather than a server thread, so the limits are
+# set by what the providers tolerate, not by a worker count
+chat_admission = admission.register(admission.AdmissionController(
+    "chat_async",
+    max_concurrent=int(os.getenv("CMAT_ASYNC_CHAT_CONCURRENCY", "256")),
+    max_queue=int(os.getenv("CMAT_ASYNC_CHAT_QUEUE", "512")),
+    queue_timeout=float(os.getenv("CMAT_CHAT_QUEUE_TIMEOUT", "10")),
+    per_user=int(os.getenv("CMAT_CHAT_PER_USER", "2")),
+))
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+    elif scope["type"] == "http" and scope["path"] == "/api/chat" and scope["method"] == "POST":
+        await observed(chat, "/api/chat", scope, receive, send)
+    else:
+        await wsgi(scope, receive, send)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            jobs.attach_loop(asyncio.get_running_loop())
+            await backend.run_blocking(views.start_background_services)
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            jobs.attach_loop(None)
+            await llm_gateway.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+# =========================
+# ASGI response helpers
+# =========================
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def send_json(send, status, body, headers=()):
+    data = json.dumps(body).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode()),
+                    *headers],
+    })
+    await send({"type": "http.response.body", "body": data})
+
+
+async def send_rejected(send, e):
+    await send_json(send, e.status, {"error": str(e)}, [(b"retry-after", str(e.retry_after).encode())])
+
+
+async def wait_disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def send_sse(receive, send, events):
+    """Stream an async iterable of SSE frames; stops early if the client hangs up."""
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache"),
+                    (b"x-accel-buffering", b"no")],
+    })
+    disconnected = asyncio.ensure_future(wait_disconnect(receive))
+    try:
+        async for event in events:
+            if disconnected.done():
+                break
+            await send({"type": "http.response.body", "body": event.encode("utf-8"), "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        disconnected.cancel()
+        await events.aclose()
+
+
+async def observed(handler, route, scope, receive, send):
+    """Run a native handler, recording it in app.py's request metrics at the start of its response."""
+    start, responded = time.perf_counter(), False
+
+    async def send_observed(message):
+        nonlocal responded
+        if message["type"] == "http.response.start":
+            responded = True
+            views.observe_request(scope["method"], route, message["status"], time.perf_counter() - start)
+        await send(message)
+
+    try:
+        await handler(scope, receive, send_observed)
+    except Exception:
+        if not responded:  # the server answers 500
+            views.observe_request(scope["method"], route, 500, time.perf_counter() - start)
+        raise
+
+
+async def iterate(items):
+    for item in items:
+        yield item
+
+
+# =========================
+# Chat API (async twin of app.chat)
+# =========================
+def prepare(scope, body, payload):
+    """Flask-side half of /api/chat, run in a worker thread."""
+    with flask_app.request_context(build_environ(scope, io.BytesIO(body))):
+        streaming = payload.get("stream") or request.accept_mimetypes.best == "text/event-stream"
+        return views.client_identity(), streaming, views.prepare_chat(payload["message"])
+
+
+async def stream_chat(user_message, messages, sources, context_tag):
+    """SSE frames: sources, tokens as the provider emits them, then done/error (see app.stream_chat)."""
+    yield views.sse_event("sources", sources)
+    provider, parts = None, []
+    try:
+        async for provider, delta in llm_gateway.astream_chat(messages):
+            parts.append(delta)
+            yield views.sse_event("token", {"text": delta})
+        yield views.sse_event("done", {"provider": provider})
+    except Exception as e:
+        print("❌ Chat stream failed:", e)
+        yield views.sse_event("error", {"error": "Both OpenAI and DeepSeek failed" if provider is None else "Reply interrupted"})
+        return
+    if parts:
+        await backend.run_blocking(backend.chat_cache_put, user_message, "".join(parts), sources, context_tag)
+
+
+async def chat(scope, receive, send):
+    body = await read_body(receive)
+    try:
+        payload = json.loads(body or b"null")
+    except ValueError:
+        payload = None
+    if not isinstance(payload, dict) or not payload.get("message") or not isinstance(payload["message"], str):
+        await send_json(send, 400, {"error": "Message required"})
+        return
+    user_message = payload["message"]
+
+    identity, streaming, (cached, messages, sources, context_tag) = await backend.run_blocking(
+        prepare, scope, body, payload)
+    if cached:
+        if streaming:
+            await send_sse(receive, send, iterate(views.stream_cached_chat(cached)))
+        else:
+            await send_json(send, 200, {"reply": cached["reply"], "sources": cached["sources"], "cached": True})
+        return
+
+    if streaming:
+        try:
+            ticket = await chat_admission.acquire_async(identity)
+        except admission.Rejected as e:
+            await send_rejected(send, e)
+            return
+        try:
+            await send_sse(receive, send, stream_chat(user_message, messages, sources, context_tag))
+        finally:
+            chat_admission.release(ticket)
+        return
+
+    async def answer():
+        ticket = await chat_admission.acquire_async(identity)
+        try:
+            result = await llm_gateway.achat_completion(messages, temperature=0.4)
+        finally:
+            chat_admission.release(ticket)
+        if result["content"]:
+            await backend.run_blocking(backend.chat_cache_put, user_message, result["content"], sources, context_tag)
+        return {"reply": result["content"], "sources": sources}
+
+    try:
+        answered = await views.chat_flight.do_async(views.chat_flight_key(user_message, context_tag), answer)
+    except admission.Rejected as e:
+        await send_rejected(send, e)
+        return
+    except llm_gateway.LLMError as e:
+        print("❌ Chat failed:", e)
+        await send_json(send, 500, {"error": "Both OpenAI and DeepSeek failed"})
+        return
+    await send_json(send, 200, {"reply": answered["reply"] or "⚠️ No reply content", "sources": answered["sources"]})
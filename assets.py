@@ -0,0 +1,168 @@
+"""
+Fingerprinted, precompressed static assets.
+
+`flask --app app build-assets` hashes every file under static/ and docs/,
+writes gzip (and, with the optional brotli package, br) copies of text assets
+to build/assets/, and records both in build/assets/manifest.json. app.py adds
+the content hash as ?v=<hash> to every url_for("static") / url_for("download_file")
+URL; send_asset() serves those with far-future immutable caching and picks
+the best precompressed variant the client's Accept-Encoding allows. Without a
+build, hashes are computed lazily and files are served uncompressed. Manifest
+entries record the source's mtime and size; a file changed since the build
+(an edited stylesheet, an image re-uploaded under the same name) falls back to
+the lazy hash and is served uncompressed until the next build.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import threading
+
+from flask import abort, request, send_file
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # br variants are skipped without the optional package
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_ROOTS = {"static": os.path.join(BASE_DIR, "static"), "docs": os.path.join(BASE_DIR, "docs")}
+BUILD_DIR = os.path.join(BASE_DIR, "build", "assets")
+MANIFEST_PATH = os.path.join(BUILD_DIR, "manifest.json")
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml", "application/xml")
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+HASH_LENGTH = 12
+
+# preferred first; the extension is the suffix of the precompressed copy
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+_manifest = None
+_lazy_hashes = {}  # (root, filename) -> (mtime, size, hash)
+_lock = threading.Lock()
+
+
+def _file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()[:HASH_LENGTH]
+
+
+def _is_compressible(filename):
+    mimetype = mimetypes.guess_type(filename)[0] or ""
+    return mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+def load_manifest():
+    global _manifest
+    with _lock:
+        if _manifest is None:
+            try:
+                with open(MANIFEST_PATH, encoding="utf-8") as f:
+                    _manifest = json.load(f)
+            except (OSError, ValueError):
+                _manifest = {}
+        return _manifest
+
+
+def build(min_saving=0.1):
+    """
+    Hash all files under ASSET_ROOTS and precompress text assets.
+    A compressed copy is kept only if it saves at least min_saving of the size.
+    Returns the manifest: {"<root>/<filename>": {"hash", "mtime", "size", "encodings"}}.
+    """
+    global _manifest
+    manifest = {}
+    for root, folder in ASSET_ROOTS.items():
+        for dirpath, _, files in os.walk(folder):
+            for name in sorted(files):
+                path = os.path.join(dirpath, name)
+                filename = os.path.relpath(path, folder).replace(os.sep, "/")
+                st = os.stat(path)
+                entry = {"hash": _file_hash(path), "mtime": st.st_mtime, "size": st.st_size, "encodings": []}
+
+                if _is_compressible(filename):
+                    with open(path, "rb") as f:
+                        data = f.read()
+                    out_base = os.path.join(BUILD_DIR, root, filename)
+                    os.makedirs(os.path.dirname(out_base), exist_ok=True)
+                    variants = {"gzip": gzip.compress(data, 9, mtime=0)}
+                    if brotli is not None:
+                        variants["br"] = brotli.compress(data, quality=11)
+                    for encoding, suffix in ENCODINGS:
+                        blob = variants.get(encoding)
+                        if blob is not None and len(blob) <= len(data) * (1 - min_saving):
+                            with open(out_base + suffix, "wb") as f:
+                                f.write(blob)
+                            entry["encodings"].append(encoding)
+
+                manifest[f"{root}/{filename}"] = entry
+
+    os.makedirs(BUILD_DIR, exist_ok=True)
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    with _lock:
+        _manifest = manifest
+    return manifest
+
+
+def _current_entry(root, filename, st):
+    """The manifest entry for an asset, or None if missing or the file changed since the build."""
+    entry = load_manifest().get(f"{root}/{filename}")
+    if entry and (entry.get("mtime"), entry.get("size")) == (st.st_mtime, st.st_size):
+        return entry
+    return None
+
+
+def fingerprint(root, filename):
+    """Content hash for an asset (from the manifest if still current, else computed and cached by mtime)."""
+    path = safe_join(ASSET_ROOTS[root], filename)
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    entry = _current_entry(root, filename, st)
+    if entry:
+        return entry["hash"]
+
+    cached = _lazy_hashes.get((root, filename))
+    if cached and cached[:2] == (st.st_mtime, st.st_size):
+        return cached[2]
+    digest = _file_hash(path)
+    _lazy_hashes[(root, filename)] = (st.st_mtime, st.st_size, digest)
+    return digest
+
+
+def send_asset(root, filename):
+    """Serve an asset with Accept-Encoding negotiation and immutable caching for fingerprinted URLs."""
+    path = safe_join(ASSET_ROOTS[root], filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    entry = _current_entry(root, filename, os.stat(path)) or {}
+    served, encoding = path, None
+    for enc, suffix in ENCODINGS:
+        candidate = os.path.join(BUILD_DIR, root, filename) + suffix
+        if enc in entry.get("encodings", []) and request.accept_encodings[enc] > 0 and os.path.isfile(candidate):
+            served, encoding = candidate, enc
+            break
+
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    response = send_file(os.path.abspath(served), mimetype=mimetype, conditional=True)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if entry.get("encodings"):
+        response.vary.add("Accept-Encoding")
+
+    version = request.args.get("v")
+    if version and version == fingerprint(root, filename):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
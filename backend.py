@@ -1,103 +1,431 @@
 import fitz  # PyMuPDF
 import pandas as pd
+import numpy as np
 import re
 import json
+import asyncio
 import os
 from dotenv import load_dotenv
-from openai import OpenAI, RateLimitError, AuthenticationError
 import sqlite3
 from flask_bcrypt import Bcrypt
-import requests
+import queue
+import threading
+import time
+import unicodedata
+import hashlib
+import base64
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+import pdf_pages
+import llm_gateway
+import bisect
+from functools import lru_cache, wraps
 
 bcrypt = Bcrypt()
 
-DB_PATH = "cmat.db"
+DB_PATH = os.getenv("CMAT_DB_PATH", "cmat.db")
+
+# ---- SQLite Connection Layer ----
+# Connections are pooled and checked out per thread: the first query in a
+# request borrows one, and release_conn() (wired to Flask's app-context
+# teardown in app.py) hands it back. This avoids a connect/teardown on every
+# backend call while keeping each connection on a single thread at a time.
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",     # ~16 MB page cache
+    "PRAGMA mmap_size=268435456",   # 256 MB memory-mapped I/O
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+SQLITE_POOL_SIZE = int(os.getenv("CMAT_SQLITE_POOL_SIZE", "8"))
+SQLITE_STATEMENT_CACHE = 256
+
+_pool = queue.LifoQueue()
+_pool_path = DB_PATH
+_pool_lock = threading.Lock()
+_local = threading.local()
+
+# Statement timings for /metrics, labelled with the function that ran them:
+# functions that query the database are wrapped in @timed_queries, which names
+# their statements "module.function" (e.g. "jobs._claim"); anything else is
+# "other". For a SELECT, execute() covers planning and the first step -- rows
+# fetched afterwards are not counted.
+SQLITE_QUERY_SECONDS = metrics.histogram(
+    "cmat_sqlite_query_duration_seconds", "SQLite statement and transaction-end time by calling function",
+    ("function", "op"), buckets=metrics.FAST_BUCKETS)
+
+
+class _TimedConnection(sqlite3.Connection):
+    def execute(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().execute(*args)
+        finally:
+            _observe_query("execute", start)
+
+    def executemany(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(*args)
+        finally:
+            _observe_query("executemany", start)
+
+    def executescript(self, *args):
+        start = time.perf_counter()
+        try:
+            return super().executescript(*args)
+        finally:
+            _observe_query("executescript", start)
+
+    def __exit__(self, exc_type, exc, tb):
+        start = time.perf_counter()
+        try:
+            return super().__exit__(exc_type, exc, tb)
+        finally:
+            _observe_query("rollback" if exc_type else "commit", start)
+
+
+def timed_queries(fn):
+    """Label the SQLite statements fn runs (including its commit) as "module.function" in /metrics."""
+    label = f"{fn.__module__}.{fn.__name__}"
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        outer = getattr(_local, "query_label", None)
+        _local.query_label = label
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.query_label = outer
+    return wrapper
+
+
+def _observe_query(op, start):
+    SQLITE_QUERY_SECONDS.observe(time.perf_counter() - start,
+                                 function=getattr(_local, "query_label", None) or "other", op=op)
+
+
+def _open_conn():
+    conn = sqlite3.connect(
+        DB_PATH,
+        check_same_thread=False,
+        cached_statements=SQLITE_STATEMENT_CACHE,
+        factory=_TimedConnection,
+    )
+    for pragma in SQLITE_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _drain_pool():
+    while True:
+        try:
+            _pool.get_nowait().close()
+        except queue.Empty:
+            return
 
+
+def get_conn():
+    """
+    Return the connection checked out by the current thread,
+    borrowing one from the pool (or opening one) on first use.
+    """
+    global _pool_path
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        return conn
+
+    with _pool_lock:
+        if _pool_path != DB_PATH:
+            # DB_PATH was repointed (scripts/benchmarks) – drop stale connections
+            _drain_pool()
+            _pool_path = DB_PATH
+    try:
+        conn = _pool.get_nowait()
+    except queue.Empty:
+        conn = _open_conn()
+    _local.conn = conn
+    return conn
+
+
+def release_conn(exc=None):
+    """Return the current thread's connection to the pool (safe to call repeatedly)."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        return
+    _local.conn = None
+    if conn.in_transaction:
+        conn.rollback()
+    if _pool_path == DB_PATH and _pool.qsize() < SQLITE_POOL_SIZE:
+        _pool.put(conn)
+    else:
+        conn.close()
+
+
+def close_all_connections():
+    """Close pooled connections and the current thread's checked-out one."""
+    release_conn()
+    with _pool_lock:
+        _drain_pool()
+
+
+async def run_blocking(fn, *args):
+    """Await fn(*args) on asyncio's thread pool; the pool thread hands its connection back afterwards."""
+    def call():
+        try:
+            return fn(*args)
+        finally:
+            release_conn()
+    return await asyncio.to_thread(call)
+
+
+@contextmanager
+def transaction(immediate=False):
+    """
+    Yield the thread's connection inside a transaction (commit on success, rollback on error).
+    immediate=True takes the write lock up front, so reads made inside it cannot go stale
+    before the transaction's writes land.
+    """
+    conn = get_conn()
+    with conn:
+        if immediate:
+            conn.execute("BEGIN IMMEDIATE")
+        yield conn
+
+
+@timed_queries
 def init_db():
     """Initialize SQLite database with required tables."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # News table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS news (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            content TEXT,
-            image TEXT,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-            posted_by TEXT
-        )
-    """)
-
-    # Users table (single definition)
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            role TEXT NOT NULL DEFAULT 'mp'
-        )
-    """)
-
-    # Events table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            title TEXT NOT NULL,
-            start TEXT NOT NULL,
-            end TEXT NOT NULL,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        )
-    """)
-
-    # Survey table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS survey_data (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            indicator TEXT NOT NULL,
-            value TEXT,
-            FOREIGN KEY(user_id) REFERENCES users(id)
-        )
-    """)
-
-    # Projects table
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS projects (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT,
-            image TEXT,
-            latitude REAL,
-            longitude REAL,
-            start_date TEXT,
-            end_date TEXT,
-            budget REAL,
-            status TEXT,
-            completion_percentage REAL
-        )
-    """)
+    with transaction() as c:
+        # News table
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS news (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                content TEXT,
+                image TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                posted_by TEXT
+            )
+        """)
+
+        # Users table (single definition)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT UNIQUE NOT NULL,
+                password TEXT NOT NULL,
+                role TEXT NOT NULL DEFAULT 'mp'
+            )
+        """)
+
+        # Events table
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                start TEXT NOT NULL,
+                end TEXT NOT NULL,
+                FOREIGN KEY(user_id) REFERENCES users(id)
+            )
+        """)
+
+        # Survey table
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS survey_data (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                indicator TEXT NOT NULL,
+                value TEXT,
+                FOREIGN KEY(user_id) REFERENCES users(id)
+            )
+        """)
+
+        # Projects table
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS projects (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                title TEXT NOT NULL,
+                description TEXT,
+                image TEXT,
+                latitude REAL,
+                longitude REAL,
+                start_date TEXT,
+                end_date TEXT,
+                budget REAL,
+                status TEXT,
+                completion_percentage REAL
+            )
+        """)
+
+        # Spatial index over project coordinates (kept in sync by add/update/delete_project)
+        c.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS projects_rtree USING rtree(
+                id, min_lat, max_lat, min_lon, max_lon
+            )
+        """)
+        c.execute("""
+            INSERT INTO projects_rtree (id, min_lat, max_lat, min_lon, max_lon)
+            SELECT id, latitude, latitude, longitude, longitude FROM projects
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+              AND id NOT IN (SELECT id FROM projects_rtree)
+        """)
+
+        # Per-zoom grid clusters of projects for the map (see project clusters section)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS project_clusters (
+                zoom INTEGER NOT NULL,
+                cell_x INTEGER NOT NULL,
+                cell_y INTEGER NOT NULL,
+                count INTEGER NOT NULL,
+                lat_sum REAL NOT NULL,
+                lon_sum REAL NOT NULL,
+                budget_sum REAL NOT NULL,
+                completion_sum REAL NOT NULL,
+                completion_count INTEGER NOT NULL,
+                PRIMARY KEY (zoom, cell_x, cell_y)
+            )
+        """)
+        if not c.execute("SELECT 1 FROM project_clusters LIMIT 1").fetchone():
+            _rebuild_project_clusters(c)
+
+        # One row per (user, indicator) so survey saves can UPSERT. Older databases may
+        # hold duplicates from the delete/re-insert era: keep the latest before indexing.
+        has_unique = c.execute(
+            "SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_survey_user_indicator'"
+        ).fetchone()
+        if not has_unique:
+            c.execute("""
+                DELETE FROM survey_data WHERE id NOT IN (
+                    SELECT MAX(id) FROM survey_data GROUP BY user_id, indicator
+                )
+            """)
+            c.execute("CREATE UNIQUE INDEX idx_survey_user_indicator ON survey_data(user_id, indicator)")
+
+        # Change counters behind ETag/Last-Modified (bumped by news/project writes)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS data_versions (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        c.executemany("INSERT OR IGNORE INTO data_versions (name, version, updated_at) VALUES (?, 0, ?)",
+                      [(name, time.time()) for name in DATA_VERSION_NAMES])
+
+        # Resized image derivatives (see images.py)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS image_variants (
+                image TEXT PRIMARY KEY,
+                variants TEXT NOT NULL,
+                source_mtime REAL NOT NULL
+            )
+        """)
+
+        # Full-text index over the policy PDFs in docs/ (see doc_index.py)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS doc_files (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL,
+                sha256 TEXT NOT NULL,
+                pages INTEGER NOT NULL,
+                indexed_at REAL NOT NULL
+            )
+        """)
+        c.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS doc_pages USING fts5(
+                path UNINDEXED, page UNINDEXED, body, tokenize='porter unicode61'
+            )
+        """)
+
+        # Newest-first listing / keyset pagination over news
+        c.execute("CREATE INDEX IF NOT EXISTS idx_news_created ON news(created_at DESC, id DESC)")
+
+        # AI extraction cache (content-addressed, see ai_extract_budget_info)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS ai_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_ai_cache_accessed ON ai_cache(accessed_at)")
+
+        # Chat answers keyed by normalized question (see chat_cache_get)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS chat_cache (
+                key TEXT PRIMARY KEY,
+                tag TEXT NOT NULL,
+                question TEXT NOT NULL,
+                reply TEXT NOT NULL,
+                sources TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        c.execute("CREATE INDEX IF NOT EXISTS idx_chat_cache_accessed ON chat_cache(accessed_at)")
+
+        # Background analysis jobs (see jobs.py)
+        c.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                filename TEXT,
+                status TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                progress INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                owner TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        # owner (host:pid:token of the worker running it) arrived after the first jobs table
+        if "owner" not in {row[1] for row in c.execute("PRAGMA table_info(jobs)")}:
+            c.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+
+
+# ---- Data Versions ----
+# A change counter per dataset; every write bumps it in the same transaction so
+# read-heavy pages can answer conditional GETs without re-querying content.
+DATA_VERSION_NAMES = ("news", "projects")
 
-    conn.commit()
-    conn.close()
 
+def _bump_data_version(c, name):
+    c.execute("UPDATE data_versions SET version = version + 1, updated_at = ? WHERE name = ?",
+              (time.time(), name))
 
+
+@timed_queries
+def get_data_version(*names):
+    """Return (version tag, last updated unix time) across the named datasets."""
+    marks = ",".join("?" * len(names))
+    rows = get_conn().execute(
+        f"SELECT name, version, updated_at FROM data_versions WHERE name IN ({marks}) ORDER BY name", names
+    ).fetchall()
+    tag = "-".join(f"{r[0]}{r[1]}" for r in rows)
+    return tag, max((r[2] for r in rows), default=0.0)
+
+
+@timed_queries
 def get_news():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id, title, content, image, created_at, posted_by FROM news ORDER BY created_at DESC")
-    rows = c.fetchall()
-    conn.close()
+    rows = get_conn().execute(
+        "SELECT id, title, content, image, created_at, posted_by FROM news ORDER BY created_at DESC"
+    ).fetchall()
     return [{"id": r[0], "title": r[1], "content": r[2], "image": r[3], "created_at": r[4], "posted_by": r[5]} for r in rows]
 
+@timed_queries
 def get_news_by_id(news_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id, title, content, image, created_at, posted_by FROM news WHERE id=?", (news_id,))
-    row = c.fetchone()
-    conn.close()
+    row = get_conn().execute(
+        "SELECT id, title, content, image, created_at, posted_by FROM news WHERE id=?", (news_id,)
+    ).fetchone()
     if row:
         return {
             "id": row[0],
@@ -109,53 +437,205 @@ def get_news_by_id(news_id):
         }
     return None
 
+@timed_queries
 def add_news(title, content, image, posted_by):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO news (title, content, image, posted_by) VALUES (?, ?, ?, ?)", 
-              (title, content, image, posted_by))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        c.execute("INSERT INTO news (title, content, image, posted_by) VALUES (?, ?, ?, ?)",
+                  (title, content, image, posted_by))
+        _bump_data_version(c, "news")
     return True
 
+@timed_queries
 def delete_news(news_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM news WHERE id=?", (news_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        c.execute("DELETE FROM news WHERE id=?", (news_id,))
+        _bump_data_version(c, "news")
+    return True
+
+
+@timed_queries
+def save_image_variants(image, variants, source_mtime):
+    with transaction() as c:
+        c.execute("INSERT OR REPLACE INTO image_variants (image, variants, source_mtime) VALUES (?, ?, ?)",
+                  (image, json.dumps(variants), source_mtime))
     return True
 
+@timed_queries
+def get_image_variants(image=None):
+    """Variants for one image ({variants, source_mtime} or None), or {image: variants} for all."""
+    conn = get_conn()
+    if image is not None:
+        row = conn.execute("SELECT variants, source_mtime FROM image_variants WHERE image=?", (image,)).fetchone()
+        return {"variants": json.loads(row[0]), "source_mtime": row[1]} if row else None
+    return {r[0]: json.loads(r[1]) for r in conn.execute("SELECT image, variants FROM image_variants")}
+
+
+# ---- Keyset Pagination ----
+# List views page with an opaque cursor over the sort key (news: created_at, id;
+# projects: id) instead of OFFSET, and select only the columns a card needs.
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+NEWS_EXCERPT_CHARS = 200
+
+
+def encode_cursor(*key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, *types):
+    """
+    Inverse of encode_cursor; types are the expected type(s) of each key part.
+    Raises ValueError on a malformed cursor, so nothing unexpected reaches SQL.
+    """
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, list) or len(key) != len(types) or not all(
+            isinstance(k, t) and not isinstance(k, bool) for k, t in zip(key, types)):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def _page_limit(limit):
+    return max(1, min(int(limit or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE))
+
+
+@timed_queries
+def count_news():
+    return get_conn().execute("SELECT COUNT(*) FROM news").fetchone()[0]
 
 
+@timed_queries
+def get_news_page(limit=None, cursor=None):
+    """Newest-first news cards (content trimmed to an excerpt). Returns {items, next_cursor}."""
+    limit = _page_limit(limit)
+    sql = f"""
+        SELECT id, title, substr(content, 1, {NEWS_EXCERPT_CHARS}), image, created_at, posted_by
+        FROM news
+    """
+    params = []
+    if cursor:
+        created_at, news_id = decode_cursor(cursor, (str, type(None)), int)
+        sql += " WHERE (created_at, id) < (?, ?)"
+        params += [created_at, news_id]
+    sql += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    rows = get_conn().execute(sql, params + [limit + 1]).fetchall()
+
+    items = [{"id": r[0], "title": r[1], "excerpt": r[2], "image": r[3], "created_at": r[4], "posted_by": r[5]} for r in rows[:limit]]
+    next_cursor = encode_cursor(rows[limit - 1][4], rows[limit - 1][0]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+PROJECT_LIST_FIELDS = ("id", "title", "image", "latitude", "longitude", "start_date", "end_date",
+                       "budget", "status", "completion_percentage")
+
+
+@timed_queries
+def get_projects_page(limit=None, cursor=None):
+    """Projects in id order without the description blob. Returns {items, next_cursor}."""
+    limit = _page_limit(limit)
+    sql = f"SELECT {', '.join(PROJECT_LIST_FIELDS)} FROM projects"
+    params = []
+    if cursor:
+        (project_id,) = decode_cursor(cursor, int)
+        sql += " WHERE id > ?"
+        params.append(project_id)
+    sql += " ORDER BY id LIMIT ?"
+    rows = get_conn().execute(sql, params + [limit + 1]).fetchall()
+
+    items = [dict(zip(PROJECT_LIST_FIELDS, r)) for r in rows[:limit]]
+    next_cursor = encode_cursor(rows[limit - 1][0]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+SURVEY_UPSERT_SQL = """
+    INSERT INTO survey_data (user_id, indicator, value) VALUES (?, ?, ?)
+    ON CONFLICT(user_id, indicator) DO UPDATE SET value=excluded.value
+"""
+
+
+def _survey_value(value):
+    """Normalize a value to what the TEXT column stores, so unchanged values compare equal."""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)  # nested AI output (Sectors, Climate Projects)
+    if value is None:
+        return None
+    return str(value)
+
+
+def _diff_survey_rows(user_id, existing, data):
+    """Rows to upsert and (user_id, indicator) pairs to delete to turn existing into data."""
+    upserts, deletes = [], []
+    for indicator, value in data.items():
+        value = _survey_value(value)
+        if indicator not in existing or existing[indicator] != value:
+            upserts.append((user_id, indicator, value))
+    for indicator in existing:
+        if indicator not in data:
+            deletes.append((user_id, indicator))
+    return upserts, deletes
+
+
+@timed_queries
 def save_survey_data(username, data):
-    """Save survey responses (dict of indicator:value)."""
+    """Save survey responses (dict of indicator:value), replacing the user's previous set."""
     user_id = get_user_id(username)
     if not user_id:
         return False
 
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # Remove old entries for clean overwrite
-    c.execute("DELETE FROM survey_data WHERE user_id=?", (user_id,))
-    for indicator, value in data.items():
-        c.execute("INSERT INTO survey_data (user_id, indicator, value) VALUES (?, ?, ?)",
-                  (user_id, indicator, value))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        existing = dict(c.execute("SELECT indicator, value FROM survey_data WHERE user_id=?", (user_id,)).fetchall())
+        upserts, deletes = _diff_survey_rows(user_id, existing, data)
+        c.executemany(SURVEY_UPSERT_SQL, upserts)
+        c.executemany("DELETE FROM survey_data WHERE user_id=? AND indicator=?", deletes)
     return True
 
 
+@timed_queries
+def save_survey_data_bulk(surveys, batch_size=500):
+    """
+    Save many users' survey responses ({username: {indicator: value}}) in one
+    transaction, writing only changed indicators. Unknown usernames are skipped.
+    Returns {"users": n, "written": rows upserted, "deleted": rows removed}.
+    """
+    usernames = list(surveys)
+    stats = {"users": 0, "written": 0, "deleted": 0}
+    with transaction() as c:
+        for i in range(0, len(usernames), batch_size):
+            batch = usernames[i:i + batch_size]
+            marks = ",".join("?" * len(batch))
+            ids = dict(c.execute(f"SELECT username, id FROM users WHERE username IN ({marks})", batch).fetchall())
+            existing = {}
+            for user_id, indicator, value in c.execute(
+                f"SELECT user_id, indicator, value FROM survey_data WHERE user_id IN ({','.join('?' * len(ids))})",
+                list(ids.values())
+            ):
+                existing.setdefault(user_id, {})[indicator] = value
+
+            upserts, deletes = [], []
+            for username in batch:
+                user_id = ids.get(username)
+                if not user_id:
+                    continue
+                u, d = _diff_survey_rows(user_id, existing.get(user_id, {}), surveys[username])
+                upserts += u
+                deletes += d
+                stats["users"] += 1
+            c.executemany(SURVEY_UPSERT_SQL, upserts)
+            c.executemany("DELETE FROM survey_data WHERE user_id=? AND indicator=?", deletes)
+            stats["written"] += len(upserts)
+            stats["deleted"] += len(deletes)
+    return stats
+
+
+@timed_queries
 def get_survey_data(username):
     """Fetch saved survey data for user."""
     user_id = get_user_id(username)
     if not user_id:
         return {}
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT indicator, value FROM survey_data WHERE user_id=?", (user_id,))
-    rows = c.fetchall()
-    conn.close()
+    rows = get_conn().execute("SELECT indicator, value FROM survey_data WHERE user_id=?", (user_id,)).fetchall()
     return {r[0]: r[1] for r in rows}
 
 def process_survey_results(data: dict):
@@ -213,100 +693,75 @@ def prepare_graph_data(data: dict):
 
 
 
+@timed_queries
 def create_user(username, password, role="mp"):
     """Register a new user with hashed password + role (default MP)."""
     hashed = bcrypt.generate_password_hash(password).decode("utf-8")
     try:
-        conn = sqlite3.connect(DB_PATH)
-        c = conn.cursor()
-        c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
-                  (username, hashed, role))
-        conn.commit()
-        conn.close()
+        with transaction() as c:
+            c.execute("INSERT INTO users (username, password, role) VALUES (?, ?, ?)",
+                      (username, hashed, role))
         return True
     except sqlite3.IntegrityError:
         return False  # username exists
 
 
+@timed_queries
 def verify_user(username, password):
     """
     Check username + password against DB.
     Returns the user's role if valid, otherwise None.
     """
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT password, role FROM users WHERE username = ?", (username,))
-    row = c.fetchone()
-    conn.close()
+    row = get_conn().execute("SELECT password, role FROM users WHERE username = ?", (username,)).fetchone()
     if row and bcrypt.check_password_hash(row[0], password):
         return row[1]  # return role
     return None
 
 
+@timed_queries
 def get_user_id(username):
     """Fetch user_id for a given username."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id FROM users WHERE username = ?", (username,))
-    row = c.fetchone()
-    conn.close()
+    row = get_conn().execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()
     return row[0] if row else None
 
 
+@timed_queries
 def add_event(username, title, start, end):
     user_id = get_user_id(username)
     if not user_id:
         return False
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("INSERT INTO events (user_id, title, start, end) VALUES (?, ?, ?, ?)",
-              (user_id, title, start, end))
-    conn.commit()
-    conn.close()
+
+    with transaction() as c:
+        c.execute("INSERT INTO events (user_id, title, start, end) VALUES (?, ?, ?, ?)",
+                  (user_id, title, start, end))
     return True
 
 
+@timed_queries
 def get_events(username):
     user_id = get_user_id(username)
     if not user_id:
         return []
-    
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT id, title, start, end FROM events WHERE user_id = ?", (user_id,))
-    rows = c.fetchall()
-    conn.close()
+
+    rows = get_conn().execute("SELECT id, title, start, end FROM events WHERE user_id = ?", (user_id,)).fetchall()
     return [{"id": r[0], "title": r[1], "start": r[2], "end": r[3]} for r in rows]
 
+@timed_queries
 def delete_event(username, event_id):
     """Delete an event if it belongs to the given username."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # Find user_id for the username
-    c.execute("SELECT id FROM users WHERE username=?", (username,))
-    user = c.fetchone()
-    if not user:
-        conn.close()
+    user_id = get_user_id(username)
+    if not user_id:
         return False
 
-    user_id = user[0]
-
     # Delete only if the event belongs to this user
-    c.execute("DELETE FROM events WHERE id=? AND user_id=?", (event_id, user_id))
-    conn.commit()
-    deleted = c.rowcount > 0  # True if any row was deleted
-    conn.close()
-    return deleted
+    with transaction() as c:
+        cur = c.execute("DELETE FROM events WHERE id=? AND user_id=?", (event_id, user_id))
+    return cur.rowcount > 0  # True if any row was deleted
 
 
+@timed_queries
 def get_projects():
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("SELECT * FROM projects")
-    rows = c.fetchall()
-    conn.close()
+    rows = get_conn().execute("SELECT * FROM projects").fetchall()
 
     return [
         {
@@ -326,40 +781,198 @@ def get_projects():
     ]
 
 
+def _sync_project_rtree(c, project_id, latitude, longitude):
+    """Mirror a project's coordinates into projects_rtree (inside the caller's transaction)."""
+    if latitude is None or longitude is None:
+        c.execute("DELETE FROM projects_rtree WHERE id=?", (project_id,))
+    else:
+        c.execute("""
+            INSERT OR REPLACE INTO projects_rtree (id, min_lat, max_lat, min_lon, max_lon)
+            VALUES (?, ?, ?, ?, ?)
+        """, (project_id, latitude, latitude, longitude, longitude))
+
+
+@timed_queries
 def add_project(title, description, image, latitude, longitude, start_date, end_date, budget, status, completion_percentage):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO projects (title, description, image, latitude, longitude, start_date, end_date, budget, status, completion_percentage)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (title, description, image, latitude, longitude, start_date, end_date, budget, status, completion_percentage))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        cur = c.execute("""
+            INSERT INTO projects (title, description, image, latitude, longitude, start_date, end_date, budget, status, completion_percentage)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (title, description, image, latitude, longitude, start_date, end_date, budget, status, completion_percentage))
+        _sync_project_rtree(c, cur.lastrowid, latitude, longitude)
+        _apply_project_clusters(c, (latitude, longitude, budget, completion_percentage), +1)
+        _bump_data_version(c, "projects")
     return True
 
 
+@timed_queries
 def update_project(project_id, title, description, image, latitude, longitude, start_date, end_date, budget, status, completion_percentage):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        UPDATE projects
-        SET title=?, description=?, image=?, latitude=?, longitude=?, start_date=?, end_date=?, budget=?, status=?, completion_percentage=?
-        WHERE id=?
-    """, (title, description, image, latitude, longitude, start_date, end_date, budget, status, completion_percentage, project_id))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        old = _project_cluster_fields(c, project_id)
+        c.execute("""
+            UPDATE projects
+            SET title=?, description=?, image=?, latitude=?, longitude=?, start_date=?, end_date=?, budget=?, status=?, completion_percentage=?
+            WHERE id=?
+        """, (title, description, image, latitude, longitude, start_date, end_date, budget, status, completion_percentage, project_id))
+        _sync_project_rtree(c, project_id, latitude, longitude)
+        if old:
+            _apply_project_clusters(c, old, -1)
+            _apply_project_clusters(c, (latitude, longitude, budget, completion_percentage), +1)
+        _bump_data_version(c, "projects")
     return True
 
 
+@timed_queries
 def delete_project(project_id):
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("DELETE FROM projects WHERE id=?", (project_id,))
-    conn.commit()
-    conn.close()
+    with transaction() as c:
+        old = _project_cluster_fields(c, project_id)
+        c.execute("DELETE FROM projects WHERE id=?", (project_id,))
+        c.execute("DELETE FROM projects_rtree WHERE id=?", (project_id,))
+        if old:
+            _apply_project_clusters(c, old, -1)
+        _bump_data_version(c, "projects")
+    return True
+
+
+def parse_bbox(value):
+    """Parse 'min_lon,min_lat,max_lon,max_lat' (GeoJSON order). Raises ValueError."""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in value.split(","))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise ValueError("bbox min must not exceed max")
+    return min_lon, min_lat, max_lon, max_lat
+
+
+@timed_queries
+def get_projects_in_bbox(min_lon, min_lat, max_lon, max_lat, limit=None):
+    """Projects whose coordinates fall inside the box, via the R*Tree (list columns only)."""
+    # R*Tree stores 32-bit floats and rounds boxes outward, so re-check exact coordinates
+    sql = f"""
+        SELECT {', '.join('p.' + f for f in PROJECT_LIST_FIELDS)}
+        FROM projects_rtree r JOIN projects p ON p.id = r.id
+        WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?
+          AND p.latitude BETWEEN ? AND ? AND p.longitude BETWEEN ? AND ?
+        ORDER BY p.id
+    """
+    params = [min_lat, max_lat, min_lon, max_lon, min_lat, max_lat, min_lon, max_lon]
+    if limit:
+        sql += " LIMIT ?"
+        params.append(int(limit))
+    rows = get_conn().execute(sql, params).fetchall()
+    return [dict(zip(PROJECT_LIST_FIELDS, r)) for r in rows]
+
+
+
+
+# ---- Project Clusters ----
+# The map asks for clusters instead of raw markers when zoomed out. Projects are
+# bucketed into an equal-degree grid per zoom level (cells halve each level);
+# each cell keeps running sums so add/update/delete_project can adjust the
+# affected cells incrementally, inside the same transaction.
+CLUSTER_MAX_ZOOM = 14
+CLUSTER_CELLS_PER_TILE = 4  # grid cells across one map tile at a given zoom
+
+
+def cluster_cell_size(zoom):
+    return 360.0 / (2 ** zoom * CLUSTER_CELLS_PER_TILE)
+
+
+def _cluster_cell(zoom, latitude, longitude):
+    # same arithmetic as CAST(x / size AS INTEGER) in _rebuild_project_clusters; x // size
+    # can differ from it by one cell for coordinates on a boundary
+    size = cluster_cell_size(zoom)
+    return int((longitude + 180.0) / size), int((latitude + 90.0) / size)
+
+
+def _project_cluster_fields(c, project_id):
+    return c.execute(
+        "SELECT latitude, longitude, budget, completion_percentage FROM projects WHERE id=?", (project_id,)
+    ).fetchone()
+
+
+def _apply_project_clusters(c, fields, sign):
+    """Add (sign=+1) or remove (sign=-1) one project's contribution at every zoom level."""
+    latitude, longitude, budget, completion = fields
+    if latitude is None or longitude is None:
+        return
+    has_completion = completion is not None
+    rows = []
+    for zoom in range(CLUSTER_MAX_ZOOM + 1):
+        cell_x, cell_y = _cluster_cell(zoom, latitude, longitude)
+        rows.append((zoom, cell_x, cell_y, sign, sign * latitude, sign * longitude,
+                     sign * (budget or 0), sign * (completion or 0), sign * has_completion))
+    c.executemany("""
+        INSERT INTO project_clusters (zoom, cell_x, cell_y, count, lat_sum, lon_sum, budget_sum, completion_sum, completion_count)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(zoom, cell_x, cell_y) DO UPDATE SET
+            count = count + excluded.count,
+            lat_sum = lat_sum + excluded.lat_sum,
+            lon_sum = lon_sum + excluded.lon_sum,
+            budget_sum = budget_sum + excluded.budget_sum,
+            completion_sum = completion_sum + excluded.completion_sum,
+            completion_count = completion_count + excluded.completion_count
+    """, rows)
+    if sign < 0:
+        c.execute("DELETE FROM project_clusters WHERE count <= 0")
+
+
+def _rebuild_project_clusters(c):
+    c.execute("DELETE FROM project_clusters")
+    for zoom in range(CLUSTER_MAX_ZOOM + 1):
+        size = cluster_cell_size(zoom)
+        c.execute("""
+            INSERT INTO project_clusters
+            SELECT ?, CAST((longitude + 180.0) / ? AS INTEGER), CAST((latitude + 90.0) / ? AS INTEGER),
+                   COUNT(*), SUM(latitude), SUM(longitude), TOTAL(budget),
+                   TOTAL(completion_percentage), COUNT(completion_percentage)
+            FROM projects
+            WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+            GROUP BY 2, 3
+        """, (zoom, size, size))
+
+
+@timed_queries
+def rebuild_project_clusters():
+    """Recompute every cluster from the projects table (e.g. after bulk imports)."""
+    with transaction() as c:
+        _rebuild_project_clusters(c)
+        _bump_data_version(c, "projects")
     return True
 
 
+@timed_queries
+def get_project_clusters(zoom, bbox=None):
+    """
+    Clusters for a zoom level, optionally limited to bbox (min_lon, min_lat, max_lon, max_lat).
+    Each: {lat, lon (centroid), count, budget (sum), completion (mean or None)}.
+    """
+    zoom = max(0, min(int(zoom), CLUSTER_MAX_ZOOM))
+    sql = """
+        SELECT count, lat_sum, lon_sum, budget_sum, completion_sum, completion_count
+        FROM project_clusters WHERE zoom=?
+    """
+    params = [zoom]
+    if bbox:
+        min_lon, min_lat, max_lon, max_lat = bbox
+        min_x, min_y = _cluster_cell(zoom, min_lat, min_lon)
+        max_x, max_y = _cluster_cell(zoom, max_lat, max_lon)
+        sql += " AND cell_x BETWEEN ? AND ? AND cell_y BETWEEN ? AND ?"
+        params += [min_x, max_x, min_y, max_y]
+    rows = get_conn().execute(sql, params).fetchall()
+    return [
+        {
+            "lat": r[1] / r[0],
+            "lon": r[2] / r[0],
+            "count": r[0],
+            "budget": r[3],
+            "completion": (r[4] / r[5]) if r[5] else None
+        }
+        for r in rows
+    ]
+
+
 
 
 # Load environment variables
@@ -374,48 +987,60 @@ CMAT_INDICATORS = {
     "Sectors": ["Energy", "Agriculture", "Health", "Transport", "Water"],
 }
 
-# ---- OpenAI Client Setup ----
-API_KEYS = [
-    os.getenv("OPENAI_API_KEY_1"),
-    os.getenv("OPENAI_API_KEY_2")
+# Keyword vocabulary for local (non-AI) budget extraction
+BUDGET_KEYWORDS = [
+    "total budget",
+    "total public investment in climate initiatives",
+    "percentage of national budget allocated to climate adaptation",
+    "private sector investment mobilized",
+    "adaptation",
+    "mitigation",
+    "energy",
+    "agriculture",
+    "health",
+    "transport",
+    "water"
 ]
 
-# ---- DeepSeek Key ----
-DEEPSEEK_KEY = os.getenv("DEEPSEEK_API_KEY")
+# ---- PDF Extraction ----
+PDF_PAGE_SECONDS = metrics.histogram(
+    "cmat_pdf_extract_page_seconds", "PDF text extraction time per page (each document's average)", ("source",),
+    buckets=metrics.FAST_BUCKETS)
+
+
+def observe_pdf_extraction(source, seconds, pages):
+    """Record a document's extraction time as `pages` observations of its per-page average."""
+    if pages:
+        PDF_PAGE_SECONDS.observe(seconds / pages, count=pages, source=source)
 
-current_key_index = 0
-client = OpenAI(api_key=API_KEYS[current_key_index])
 
-def get_client():
+def extract_pages_from_pdf(uploaded_file, max_pages=None, parallel=None):
     """
-    Returns a working OpenAI client.
-    If quota/auth errors happen, rotate to the next key.
+    Extracts raw text from a PDF, one string per page.
+    Accepts a path on disk or a file object; file objects are spooled to a
+    temp file first so the PDF is read from disk rather than held in memory.
     """
-    global client, current_key_index
+    if isinstance(uploaded_file, (str, os.PathLike)):
+        return _timed_extract_pages(uploaded_file, max_pages, parallel)
+
+    path = pdf_pages.spool_to_tempfile(uploaded_file)
     try:
-        return client
-    except (RateLimitError, AuthenticationError):
-        current_key_index = (current_key_index + 1) % len(API_KEYS)
-        if API_KEYS[current_key_index]:
-            client = OpenAI(api_key=API_KEYS[current_key_index])
-            print(f"⚠️ Switched to backup OpenAI key #{current_key_index+1}")
-            return client
-        else:
-            raise AuthenticationError("No valid OpenAI keys available.")
-    
+        return _timed_extract_pages(path, max_pages, parallel)
+    finally:
+        os.remove(path)
+
+
+def _timed_extract_pages(path, max_pages, parallel):
+    start = time.perf_counter()
+    pages = pdf_pages.extract_pages(path, max_pages, parallel)
+    observe_pdf_extraction("upload", time.perf_counter() - start, len(pages))
+    return pages
 
-# ---- PDF Extraction ----
 def extract_text_from_pdf(uploaded_file, max_pages=None):
     """
     Extracts raw text from a PDF file object.
     """
-    text = []
-    with fitz.open(stream=uploaded_file.read(), filetype="pdf") as doc:
-        for page_num, page in enumerate(doc):
-            if max_pages and page_num >= max_pages:
-                break
-            text.append(page.get_text("text") or "")
-    return "\n".join(text)
+    return "\n".join(extract_pages_from_pdf(uploaded_file, max_pages))
 
 def _extract_json_from_text(s: str):
     """Try to find the first JSON object in a string and parse it."""
@@ -439,11 +1064,135 @@ def _extract_json_from_text(s: str):
         except Exception:
             return None
 
+# ---- AI Extraction Cache ----
+# Results are keyed by a hash of the document text plus the prompt version and
+# models, so re-uploads of the same budget PDF skip the LLM round trip. Bump
+# BUDGET_PROMPT_VERSION whenever the extraction prompt changes.
+OPENAI_MODEL = llm_gateway.OPENAI_MODEL
+DEEPSEEK_MODEL = llm_gateway.DEEPSEEK_MODEL
+BUDGET_PROMPT_VERSION = "1"
+AI_CACHE_MAX_ENTRIES = int(os.getenv("CMAT_AI_CACHE_MAX_ENTRIES", "500"))
+AI_CACHE_TTL = float(os.getenv("CMAT_AI_CACHE_TTL", str(30 * 24 * 3600)))  # seconds
+
+ai_cache_stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+_ai_cache_stats_lock = threading.Lock()
+
+
+def _bump_ai_cache_stat(name, n=1):
+    with _ai_cache_stats_lock:
+        ai_cache_stats[name] += n
+
+
+def ai_cache_key(text: str):
+    """Content address for an extraction: sha256 over prompt version, models and text."""
+    h = hashlib.sha256()
+    for part in (BUDGET_PROMPT_VERSION, OPENAI_MODEL, DEEPSEEK_MODEL):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    h.update((text or "").encode("utf-8"))
+    return h.hexdigest()
+
+
+@timed_queries
+def ai_cache_get(key):
+    """Return the cached extraction for key, or None on miss/expiry."""
+    now = time.time()
+    conn = get_conn()
+    row = conn.execute("SELECT value, created_at FROM ai_cache WHERE key=?", (key,)).fetchone()
+    if row and now - row[1] <= AI_CACHE_TTL:
+        with conn:
+            conn.execute("UPDATE ai_cache SET accessed_at=? WHERE key=?", (now, key))
+        _bump_ai_cache_stat("hits")
+        return json.loads(row[0])
+    if row:
+        with conn:
+            conn.execute("DELETE FROM ai_cache WHERE key=?", (key,))
+        _bump_ai_cache_stat("expired")
+    _bump_ai_cache_stat("misses")
+    return None
+
+
+@timed_queries
+def ai_cache_put(key, value):
+    """Store an extraction and evict least-recently-used entries beyond AI_CACHE_MAX_ENTRIES."""
+    now = time.time()
+    with transaction() as c:
+        c.execute(
+            "INSERT OR REPLACE INTO ai_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now, now),
+        )
+        evicted = c.execute("""
+            DELETE FROM ai_cache WHERE key IN (
+                SELECT key FROM ai_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+            )
+        """, (AI_CACHE_MAX_ENTRIES,)).rowcount
+    _bump_ai_cache_stat("stores")
+    if evicted:
+        _bump_ai_cache_stat("evictions", evicted)
+
+
+@timed_queries
+def clear_ai_cache():
+    with transaction() as c:
+        c.execute("DELETE FROM ai_cache")
+    return True
+
+
+@timed_queries
+def get_ai_cache_stats():
+    """Hit/miss counters for this process plus the current on-disk entry count."""
+    with _ai_cache_stats_lock:
+        stats = dict(ai_cache_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else None
+    stats["entries"] = get_conn().execute("SELECT COUNT(*) FROM ai_cache").fetchone()[0]
+    stats["max_entries"] = AI_CACHE_MAX_ENTRIES
+    stats["ttl_seconds"] = AI_CACHE_TTL
+    return stats
+
+
+_extraction_flight = llm_gateway.register_flight(llm_gateway.SingleFlight("ai_extract_budget_info"))
+
+
 def ai_extract_budget_info(text: str):
     """
-    Uses AI to analyze PDF text and extract structured budget data.
-    Returns a dict (may contain nested dicts/lists) or {} on failure.
+    Cached front for _ai_extract_budget_info_uncached().
+    Only successfully parsed results are cached; failures are retried next time.
+    Concurrent calls for the same text (the same PDF uploaded by several users
+    at once) wait on one extraction instead of each calling the LLM.
     """
+    key = ai_cache_key(text)
+    return _extraction_flight.do(key, lambda: _ai_extract_budget_info_cached(key, text))
+
+
+def _ai_extract_budget_info_cached(key, text):
+    cached = ai_cache_get(key)
+    if cached is not None:
+        return cached
+
+    result = _ai_extract_budget_info_uncached(text)
+    if result and "raw_reply" not in result:
+        ai_cache_put(key, result)
+    return result
+
+
+async def ai_extract_budget_info_async(text: str):
+    """ai_extract_budget_info() for asyncio callers: cache I/O in a thread, the model call awaited."""
+    key = ai_cache_key(text)
+    return await _extraction_flight.do_async(key, lambda: _ai_extract_budget_info_cached_async(key, text))
+
+
+async def _ai_extract_budget_info_cached_async(key, text):
+    cached = await run_blocking(ai_cache_get, key)
+    if cached is not None:
+        return cached
+
+    result = await _ai_extract_budget_info_uncached_async(text)
+    if result and "raw_reply" not in result:
+        await run_blocking(ai_cache_put, key, result)
+    return result
+
+def _budget_extraction_messages(text: str):
     prompt = f"""
     You are a financial data analyst. From the following budget document, extract structured data.
 
@@ -472,73 +1221,507 @@ def ai_extract_budget_info(text: str):
     {text}
     """
 
-    # Try OpenAI with rotation
-    for _ in range(max(1, len(API_KEYS))):
+    return [
+        {"role": "system", "content": "You are a financial data analyst."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _parse_budget_reply(result, tried):
+    """JSON extracted from a completion, or None after noting its provider in tried."""
+    parsed = _extract_json_from_text(result["content"] or "")
+    if parsed:
+        return parsed
+    print(f"⚠️ {result['provider']} returned text but no JSON could be extracted. Raw snippet:",
+          (result["content"] or "")[:300])
+    tried.append(result["provider"])
+    return None
+
+
+def _ai_extract_budget_info_uncached(text: str):
+    """
+    Uses AI to analyze PDF text and extract structured budget data.
+    Returns a dict (may contain nested dicts/lists) or {} on failure.
+    """
+    # Fastest healthy provider first (see llm_gateway); a reply without parseable
+    # JSON gets one more try on the other provider before giving up
+    messages = _budget_extraction_messages(text)
+    tried, reply = [], ""
+    for _ in range(2):
         try:
-            client = get_client()
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": "You are a financial data analyst."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0
-            )
-            content = None
-            # robustly extract content
-            try:
-                content = response.choices[0].message.get("content") or response.choices[0].message["content"]
-            except Exception:
-                # try older/alternate fields
-                content = getattr(response.choices[0], "text", None)
-
-            parsed = _extract_json_from_text(content or "")
-            if parsed:
-                return parsed
-            else:
-                print("⚠️ OpenAI returned text but no JSON could be extracted. Raw snippet:", (content or "")[:300])
-                # continue to fallback or next key
-                continue
-        except (RateLimitError, AuthenticationError) as e:
-            print("⚠️ OpenAI key failed, rotating...", e)
-            # rotate will be handled in get_client() on next call
-            continue
-        except Exception as e:
-            print("⚠️ OpenAI extraction error:", e)
+            result = llm_gateway.chat_completion(messages, temperature=0, exclude=tried)
+        except llm_gateway.LLMError as e:
+            print("❌ AI extraction failed:", e)
             break
+        reply = result["content"] or ""
+        parsed = _parse_budget_reply(result, tried)
+        if parsed:
+            return parsed
+
+    return {"raw_reply": reply} if reply else {}
 
-    # Fallback: DeepSeek
-    try:
-        deepseek_key = os.getenv("DEEPSEEK_API_KEY")
-        if not deepseek_key:
-            print("❌ No DeepSeek API key configured.")
-            return {}
-
-        headers = {"Authorization": f"Bearer {deepseek_key}", "Content-Type": "application/json"}
-        payload = {
-            "model": "deepseek-chat",
-            "messages": [
-                {"role": "system", "content": "You are a financial data analyst."},
-                {"role": "user", "content": prompt}
-            ],
-            "temperature": 0
-        }
 
-        r = requests.post("https://api.deepseek.com/chat/completions", headers=headers, json=payload, timeout=30)
-        r.raise_for_status()
-        data = r.json()
-        reply = data.get("choices", [{}])[0].get("message", {}).get("content", "")
-        parsed = _extract_json_from_text(reply or "")
+async def _ai_extract_budget_info_uncached_async(text: str):
+    messages = _budget_extraction_messages(text)
+    tried, reply = [], ""
+    for _ in range(2):
+        try:
+            result = await llm_gateway.achat_completion(messages, temperature=0, exclude=tried)
+        except llm_gateway.LLMError as e:
+            print("❌ AI extraction failed:", e)
+            break
+        reply = result["content"] or ""
+        parsed = _parse_budget_reply(result, tried)
         if parsed:
             return parsed
-        else:
-            print("⚠️ DeepSeek returned non-JSON or JSON not parsable. Raw reply stored.")
-            return {"raw_reply": reply}
-    except Exception as e:
-        print("❌ DeepSeek extraction failed:", e)
+
+    return {"raw_reply": reply} if reply else {}
+
+
+
+# ---- Chat Response Cache ----
+# Common questions ("What is Zambia's NDC target?") are answered from SQLite
+# instead of a paid LLM round trip. Keys hash the normalized question together
+# with a tag naming the prompt version, models and retrieval index, so answers
+# go stale automatically when any of those change. With CMAT_CHAT_CACHE_FUZZY=1
+# a miss also checks cached questions for a near-duplicate (token-set Jaccard).
+CHAT_PROMPT_VERSION = "1"
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CMAT_CHAT_CACHE_MAX_ENTRIES", "1000"))
+CHAT_CACHE_TTL = float(os.getenv("CMAT_CHAT_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+CHAT_CACHE_FUZZY = os.getenv("CMAT_CHAT_CACHE_FUZZY", "0") == "1"
+CHAT_CACHE_FUZZY_THRESHOLD = 0.8
+_QUESTION_STOP_WORDS = frozenset(
+    "a an and are can could do does for how i in is it me of on please tell the to us what whats which who why "
+    "with would you".split()
+)
+
+chat_cache_stats = {"hits": 0, "fuzzy_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+_chat_fuzzy_index = None  # {key: (tag, frozenset of content words)}, loaded lazily
+_chat_cache_lock = threading.Lock()
+
+
+def _bump_chat_cache_stat(name, n=1):
+    with _chat_cache_lock:
+        chat_cache_stats[name] += n
+
+
+def normalize_question(text: str):
+    """Fold case, possessives, punctuation and whitespace: "Zambia's  NDC?" -> "zambia ndc"."""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = re.sub(r"['’`]s\b", "", text)
+    text = re.sub(r"['’`]", "", text)
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+def _question_terms(normalized):
+    return frozenset(w for w in normalized.split() if w not in _QUESTION_STOP_WORDS)
+
+
+def chat_cache_tag(context_tag=""):
+    return f"{CHAT_PROMPT_VERSION}|{OPENAI_MODEL}|{DEEPSEEK_MODEL}|{context_tag}"
+
+
+def chat_cache_key(normalized, tag):
+    return hashlib.sha256(f"{tag}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+@timed_queries
+def _load_chat_fuzzy_index():
+    global _chat_fuzzy_index
+    with _chat_cache_lock:
+        if _chat_fuzzy_index is None:
+            rows = get_conn().execute("SELECT key, tag, question FROM chat_cache").fetchall()
+            _chat_fuzzy_index = {key: (tag, _question_terms(q)) for key, tag, q in rows}
+        return _chat_fuzzy_index
+
+
+def _nearest_cached_question(normalized, tag):
+    terms = _question_terms(normalized)
+    if not terms:
+        return None
+    best_key, best_score = None, CHAT_CACHE_FUZZY_THRESHOLD
+    for key, (entry_tag, entry_terms) in list(_load_chat_fuzzy_index().items()):
+        if entry_tag != tag or not entry_terms:
+            continue
+        score = len(terms & entry_terms) / len(terms | entry_terms)
+        if score >= best_score:
+            best_key, best_score = key, score
+    return best_key
+
+
+@timed_queries
+def _chat_cache_fetch(key, now):
+    conn = get_conn()
+    row = conn.execute("SELECT reply, sources, created_at FROM chat_cache WHERE key=?", (key,)).fetchone()
+    if row and now - row[2] <= CHAT_CACHE_TTL:
+        with conn:
+            conn.execute("UPDATE chat_cache SET accessed_at=? WHERE key=?", (now, key))
+        return {"reply": row[0], "sources": json.loads(row[1])}
+    if row:
+        with conn:
+            conn.execute("DELETE FROM chat_cache WHERE key=?", (key,))
+        _bump_chat_cache_stat("expired")
+    with _chat_cache_lock:
+        if _chat_fuzzy_index is not None:
+            _chat_fuzzy_index.pop(key, None)
+    return None
+
+
+def chat_cache_get(question, context_tag=""):
+    """Cached {"reply", "sources"} for a question (exact after normalization, then fuzzy), or None."""
+    now = time.time()
+    normalized = normalize_question(question)
+    tag = chat_cache_tag(context_tag)
+    cached = _chat_cache_fetch(chat_cache_key(normalized, tag), now)
+    if cached:
+        _bump_chat_cache_stat("hits")
+        return cached
+    if CHAT_CACHE_FUZZY:
+        key = _nearest_cached_question(normalized, tag)
+        cached = _chat_cache_fetch(key, now) if key else None
+        if cached:
+            _bump_chat_cache_stat("fuzzy_hits")
+            return cached
+    _bump_chat_cache_stat("misses")
+    return None
+
+
+@timed_queries
+def chat_cache_put(question, reply, sources, context_tag=""):
+    """Store an answer and evict least-recently-used entries beyond CHAT_CACHE_MAX_ENTRIES."""
+    now = time.time()
+    normalized = normalize_question(question)
+    tag = chat_cache_tag(context_tag)
+    key = chat_cache_key(normalized, tag)
+    with transaction() as c:
+        c.execute("""
+            INSERT OR REPLACE INTO chat_cache (key, tag, question, reply, sources, created_at, accessed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (key, tag, normalized, reply, json.dumps(sources), now, now))
+        evicted = [r[0] for r in c.execute(
+            "SELECT key FROM chat_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?", (CHAT_CACHE_MAX_ENTRIES,)
+        )]
+        c.executemany("DELETE FROM chat_cache WHERE key=?", [(k,) for k in evicted])
+    with _chat_cache_lock:
+        if _chat_fuzzy_index is not None:
+            _chat_fuzzy_index[key] = (tag, _question_terms(normalized))
+            for k in evicted:
+                _chat_fuzzy_index.pop(k, None)
+    _bump_chat_cache_stat("stores")
+    if evicted:
+        _bump_chat_cache_stat("evictions", len(evicted))
+
+
+@timed_queries
+def clear_chat_cache():
+    global _chat_fuzzy_index
+    with transaction() as c:
+        c.execute("DELETE FROM chat_cache")
+    with _chat_cache_lock:
+        _chat_fuzzy_index = None
+    return True
+
+
+@timed_queries
+def get_chat_cache_stats():
+    """Hit/miss counters for this process plus the current on-disk entry count."""
+    with _chat_cache_lock:
+        stats = dict(chat_cache_stats)
+    hits = stats["hits"] + stats["fuzzy_hits"]
+    lookups = hits + stats["misses"]
+    stats["hit_ratio"] = round(hits / lookups, 4) if lookups else None
+    stats["entries"] = get_conn().execute("SELECT COUNT(*) FROM chat_cache").fetchone()[0]
+    stats["max_entries"] = CHAT_CACHE_MAX_ENTRIES
+    stats["ttl_seconds"] = CHAT_CACHE_TTL
+    stats["fuzzy"] = CHAT_CACHE_FUZZY
+    return stats
+
+
+@metrics.register_collector
+def _cache_metrics():
+    """Hit/miss counters of both caches for /metrics (no DB access, unlike get_*_cache_stats)."""
+    with _ai_cache_stats_lock:
+        ai = dict(ai_cache_stats)
+    with _chat_cache_lock:
+        chat = dict(chat_cache_stats)
+    ai_lookups = ai["hits"] + ai["misses"]
+    chat_hits = chat["hits"] + chat["fuzzy_hits"]
+    chat_lookups = chat_hits + chat["misses"]
+    return [
+        ("cmat_cache_events_total", "counter", "Cache lookups and maintenance events in this process",
+         ("cache", "event"),
+         [(("ai_extraction", event), n) for event, n in ai.items()] +
+         [(("chat", event), n) for event, n in chat.items()]),
+        ("cmat_cache_hit_ratio", "gauge", "Share of lookups answered from cache since start", ("cache",),
+         [(("ai_extraction",), ai["hits"] / ai_lookups if ai_lookups else None),
+          (("chat",), chat_hits / chat_lookups if chat_lookups else None)]),
+    ]
+
+
+# ---- Chunked (Map-Reduce) Extraction ----
+# Large documents (e.g. the national Yellow Book) are split on page boundaries
+# into token-bounded chunks, extracted concurrently, then merged in chunk order.
+LLM_CHUNK_TOKENS = int(os.getenv("CMAT_LLM_CHUNK_TOKENS", "12000"))
+LLM_MAX_WORKERS = int(os.getenv("CMAT_LLM_MAX_WORKERS", "4"))
+CHARS_PER_TOKEN = 4  # rough estimate for English prose + numbers
+
+
+def estimate_tokens(text: str):
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+def _split_line(line, max_chars):
+    """Pieces of at most max_chars, cut at the last space of each window so figures stay whole."""
+    pieces = []
+    while len(line) > max_chars:
+        cut = line.rfind(" ", max_chars // 2, max_chars)
+        cut = cut + 1 if cut != -1 else max_chars
+        pieces.append(line[:cut])
+        line = line[cut:]
+    pieces.append(line)
+    return pieces
+
+
+def chunk_pages(pages, max_tokens=None):
+    """
+    Group page texts into chunks of at most max_tokens (estimated).
+    Pages are never merged across a chunk boundary; a single oversized page
+    is split on line breaks, and a line longer than a chunk (PyMuPDF often
+    emits whole tables as one line) is split into chunk-sized pieces.
+    """
+    max_chars = (max_tokens or LLM_CHUNK_TOKENS) * CHARS_PER_TOKEN
+    chunks, current, size = [], [], 0
+
+    def flush():
+        nonlocal current, size
+        if current:
+            chunks.append("\n".join(current))
+        current, size = [], 0
+
+    for page in pages:
+        page = page or ""
+        if len(page) > max_chars:
+            flush()
+            for line in page.splitlines():
+                for piece in _split_line(line, max_chars):
+                    if size + len(piece) + 1 > max_chars:
+                        flush()
+                    current.append(piece)
+                    size += len(piece) + 1
+            flush()
+            continue
+        if size + len(page) + 1 > max_chars:
+            flush()
+        current.append(page)
+        size += len(page) + 1
+    flush()
+    return chunks
+
+
+def _programme_key(name):
+    return re.sub(r"\s+", " ", str(name or "")).strip().lower()
+
+
+def merge_budget_results(results):
+    """
+    Deterministically merge per-chunk extraction dicts (in chunk order).
+    - Total Budget / Sectors: largest figure seen (chunk totals overlap, so never summed)
+    - Climate Projects: de-duplicated by programme name; first non-null value per year wins
+    - other keys: first non-null value wins
+    """
+    merged = {"Total Budget": None, "Sectors": {}, "Climate Projects": []}
+    projects = {}
+
+    for result in results:
+        if not isinstance(result, dict):
+            continue
+        for key, value in result.items():
+            if key == "Total Budget":
+                num = clean_numeric_value(value)
+                if num is not None and (merged["Total Budget"] is None or num > merged["Total Budget"]):
+                    merged["Total Budget"] = num
+            elif key == "Sectors" and isinstance(value, dict):
+                for sector, amount in value.items():
+                    num = clean_numeric_value(amount)
+                    prev = merged["Sectors"].get(sector)
+                    if prev is None or (num is not None and num > prev):
+                        merged["Sectors"][sector] = num
+            elif key == "Climate Projects" and isinstance(value, list):
+                for project in value:
+                    if not isinstance(project, dict) or not project.get("Programme"):
+                        continue
+                    pkey = _programme_key(project["Programme"])
+                    if pkey not in projects:
+                        projects[pkey] = dict(project)
+                        merged["Climate Projects"].append(projects[pkey])
+                        continue
+                    for field, v in project.items():
+                        if projects[pkey].get(field) is None and v is not None:
+                            projects[pkey][field] = v
+            elif key != "raw_reply" and merged.get(key) is None:
+                merged[key] = value
+
+    return merged
+
+
+def _extract_chunk(chunk):
+    try:
+        return ai_extract_budget_info(chunk)
+    finally:
+        release_conn()  # pool threads must hand back their SQLite connection
+
+
+def ai_extract_budget_info_chunked(pages, max_tokens=None, max_workers=None):
+    """
+    Map-reduce variant of ai_extract_budget_info over a list of page texts.
+    Chunks run on a bounded thread pool; each chunk is cached independently.
+    """
+    chunks = chunk_pages(pages, max_tokens)
+    if not chunks:
+        return {}
+    workers = max(1, min(max_workers or LLM_MAX_WORKERS, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_extract_chunk, chunks))
+    return merge_budget_results(results)
+
+
+def extract_budget_info_from_pages(pages):
+    """
+    Single prompt for documents that fit in one chunk, map-reduce for larger ones.
+    No model call at all when there is no text (e.g. the prefilter kept no pages).
+    """
+    text = "\n".join(pages)
+    if not text.strip():
         return {}
+    if estimate_tokens(text) <= LLM_CHUNK_TOKENS:
+        return ai_extract_budget_info(text)
+    return ai_extract_budget_info_chunked(pages)
 
 
+async def ai_extract_budget_info_chunked_async(pages, max_tokens=None, max_workers=None):
+    """ai_extract_budget_info_chunked() on the event loop: at most max_workers chunks in flight."""
+    chunks = chunk_pages(pages, max_tokens)
+    if not chunks:
+        return {}
+    slots = asyncio.Semaphore(max(1, max_workers or LLM_MAX_WORKERS))
+
+    async def extract(chunk):
+        async with slots:
+            return await ai_extract_budget_info_async(chunk)
+
+    return merge_budget_results(await asyncio.gather(*(extract(c) for c in chunks)))
+
+
+async def extract_budget_info_from_pages_async(pages):
+    text = "\n".join(pages)
+    if not text.strip():
+        return {}
+    if estimate_tokens(text) <= LLM_CHUNK_TOKENS:
+        return await ai_extract_budget_info_async(text)
+    return await ai_extract_budget_info_chunked_async(pages)
+
+
+# ---- Page Prefilter ----
+# Scores pages locally by budget-keyword hits and numeric/table density so only
+# the most relevant pages (within PREFILTER_TOKEN_BUDGET) are sent to the model.
+# The budget is its own small cap of a couple of chunks: it has to bite on typical
+# 50-100 page plans, and only the surviving pages are chunked for map-reduce.
+PREFILTER_MAX_CHUNKS = int(os.getenv("CMAT_PREFILTER_MAX_CHUNKS", "2"))
+PREFILTER_TOKEN_BUDGET = int(os.getenv("CMAT_PREFILTER_TOKENS", str(PREFILTER_MAX_CHUNKS * LLM_CHUNK_TOKENS)))  # 0 disables
+
+_PREFILTER_TERMS = sorted(
+    {kw.lower() for kws in CMAT_INDICATORS.values() for kw in kws} | set(BUDGET_KEYWORDS)
+    | {"budget", "allocation", "allocated", "expenditure", "programme", "kwacha", "zmw", "usd", "million", "billion"},
+    key=len, reverse=True,
+)
+_PREFILTER_KEYWORD_RE = re.compile(r"\b(?:" + "|".join(re.escape(t) for t in _PREFILTER_TERMS) + r")\b", re.IGNORECASE)
+_PREFILTER_NUMBER_RE = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d{4,}(?:\.\d+)?")
+_PREFILTER_TABLE_LINE_RE = re.compile(r"^[\s\d,\.\-%()]+$")
+
+
+def score_page(text: str):
+    """Relevance score: keyword hits weigh most, then table-like lines and large figures."""
+    if not text:
+        return 0.0
+    keyword_hits = len(_PREFILTER_KEYWORD_RE.findall(text))
+    numbers = len(_PREFILTER_NUMBER_RE.findall(text))
+    table_lines = sum(1 for line in text.splitlines() if line.strip() and _PREFILTER_TABLE_LINE_RE.match(line))
+    return 3.0 * keyword_hits + 1.0 * numbers + 0.5 * table_lines
+
+
+def select_relevant_pages(pages, token_budget=None):
+    """
+    Keep the highest-scoring pages that fit in token_budget, in document order.
+    Documents within budget are kept whole; above it, pages scoring 0 are
+    always dropped, so the result may be empty.
+    Returns (selected_pages, report) where report summarises tokens saved.
+    """
+    budget = PREFILTER_TOKEN_BUDGET if token_budget is None else token_budget
+    tokens = [estimate_tokens(p) for p in pages]
+    if not budget or sum(tokens) <= budget:
+        keep = list(range(len(pages)))
+    else:
+        keep = _rank_pages(tokens, [score_page(p) for p in pages], budget)
+    return [pages[i] for i in keep], _prefilter_report(tokens, keep)
+
+
+def select_relevant_pdf_pages(path, token_budget=None):
+    """
+    select_relevant_pages() for a PDF on disk, without building its full page list.
+    Pages are scored as pdf_pages.iter_pages() yields them and their text is held
+    only while the document still fits the budget; past that, just the kept pages
+    are read again by index, so memory follows the budget, not the document.
+    Extraction is sequential here (no process pool).
+    """
+    budget = PREFILTER_TOKEN_BUDGET if token_budget is None else token_budget
+    start = time.perf_counter()
+    tokens, scores, texts, total = [], [], [], 0
+    for text in pdf_pages.iter_pages(path):
+        tokens.append(estimate_tokens(text))
+        scores.append(score_page(text))
+        total += tokens[-1]
+        if texts is not None:
+            texts.append(text)
+            if budget and total > budget:
+                texts = None
+    observe_pdf_extraction("upload", time.perf_counter() - start, len(tokens))
+
+    if texts is not None:
+        keep = list(range(len(tokens)))
+    else:
+        keep = _rank_pages(tokens, scores, budget)
+        texts = pdf_pages.extract_selected(path, keep)
+    return texts, _prefilter_report(tokens, keep)
+
+
+def _rank_pages(tokens, scores, budget):
+    """Indices of the highest-scoring pages (score > 0) that fit in budget, in document order."""
+    ranked = sorted(range(len(tokens)), key=lambda i: (-scores[i], i))
+    keep, used = [], 0
+    for i in ranked:
+        if scores[i] <= 0:
+            break
+        if used + tokens[i] <= budget:
+            keep.append(i)
+            used += tokens[i]
+    return sorted(keep)
+
+
+def _prefilter_report(tokens, keep):
+    total_tokens = sum(tokens)
+    kept_tokens = sum(tokens[i] for i in keep)
+    report = {
+        "pages_total": len(tokens),
+        "pages_kept": len(keep),
+        "kept_pages": [i + 1 for i in keep],
+        "tokens_total": total_tokens,
+        "tokens_kept": kept_tokens,
+        "tokens_saved": total_tokens - kept_tokens,
+    }
+    if len(keep) < len(tokens):
+        print(f"📉 Prefilter kept {len(keep)}/{len(tokens)} pages, ~{report['tokens_saved']} tokens saved")
+    return report
+
 
 # ---- Helper: Clean numbers ----
 def clean_numeric_value(val):
@@ -580,19 +1763,7 @@ def extract_combined_budget_info(text: str):
     ai_results = ai_extract_budget_info(text) or {}
     keyword_results = extract_numbers_from_text(
         text,
-        keywords=[
-            "total budget",
-            "total public investment in climate initiatives",
-            "percentage of national budget allocated to climate adaptation",
-            "private sector investment mobilized",
-            "adaptation",
-            "mitigation",
-            "energy",
-            "agriculture",
-            "health",
-            "transport",
-            "water"
-        ]
+        keywords=BUDGET_KEYWORDS
     )
 
     # Start with AI results (may be nested)
@@ -633,6 +1804,154 @@ def extract_combined_budget_info(text: str):
     return merged
 
 
+# ---- Budget Table Extraction ----
+# Rebuilds budget tables from PyMuPDF word coordinates instead of flattened
+# text: words are grouped into rows by vertical position, year columns are
+# located from header rows ("2022 2023 2024"), and each figure is assigned to
+# the nearest year column. Amounts are parsed in one vectorized NumPy pass.
+DEFAULT_BUDGET_YEARS = ("2024", "2023", "2022")  # column order when no header is found
+_TABLE_NUMBER_RE = re.compile(r"^\(?-?\d[\d,]*(?:\.\d+)?\)?$")
+_TABLE_YEAR_RE = re.compile(r"^(?:19|20)\d\d$")
+_TABLE_SECTOR_RE = re.compile(r"\b(" + "|".join(map(re.escape, CMAT_INDICATORS["Sectors"])) + r")\b", re.IGNORECASE)
+_TABLE_SECTORS = {s.lower(): s for s in CMAT_INDICATORS["Sectors"]}
+
+
+def _group_rows(words):
+    """Cluster (x0, y0, x1, y1, text, ...) words into rows, top to bottom, each sorted left to right."""
+    if not words:
+        return []
+    words = sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0]))
+    heights = sorted(w[3] - w[1] for w in words)
+    tolerance = max(heights[len(heights) // 2] * 0.5, 1.0)
+
+    rows, current, row_y = [], [], None
+    for w in words:
+        y = (w[1] + w[3]) / 2
+        if row_y is not None and abs(y - row_y) > tolerance:
+            rows.append(sorted(current, key=lambda w: w[0]))
+            current = []
+        if not current:
+            row_y = y
+        current.append(w)
+    rows.append(sorted(current, key=lambda w: w[0]))
+    return rows
+
+
+def _parse_amounts(raw):
+    """Vectorized amount parsing: '' -> NaN, '1,234' -> 1234.0, '(56)' -> -56.0."""
+    arr = np.asarray(raw, dtype=str)
+    out = np.full(arr.shape, np.nan)
+    if not arr.size:
+        return out
+    cleaned = np.char.strip(np.char.replace(arr, ",", ""), "()")
+    # "(56)" is negative; "(-56)" already carries its sign
+    negative = np.char.startswith(arr, "(") & ~np.char.startswith(cleaned, "-")
+    present = np.char.str_len(cleaned) > 0
+    out[present] = cleaned[present].astype(float)
+    out[negative] *= -1
+    return out
+
+
+def extract_budget_tables(pdf, max_pages=None):
+    """
+    Extract budget line items (programme, code, one column per year) from a PDF
+    path or file object. Returns a columnar dict: lists for page/sector/programme/code
+    and a float64 NumPy array (NaN when blank) for each year column.
+    """
+    if not isinstance(pdf, (str, os.PathLike)):
+        path = pdf_pages.spool_to_tempfile(pdf)
+        try:
+            return extract_budget_tables(path, max_pages)
+        finally:
+            os.remove(path)
+
+    items = []  # (page, sector, programme, code, {year: raw})
+    years_seen = []
+    sector = None
+    with fitz.open(pdf) as doc:
+        for page_num, page in enumerate(doc):
+            if max_pages and page_num >= max_pages:
+                break
+            columns = None  # {year: x-centre} from this page's header row
+            for row in _group_rows(page.get_text("words")):
+                tokens = [(w[4], (w[0] + w[2]) / 2) for w in row]
+                years = [(t, x) for t, x in tokens if _TABLE_YEAR_RE.match(t)]
+                if len(dict(years)) >= 2 and len(years) >= len(tokens) - 3:
+                    columns = dict(years)
+                    years_seen.extend(y for y, _ in years if y not in years_seen)
+                    continue
+
+                text = " ".join(t for t, _ in tokens if not _TABLE_NUMBER_RE.match(t)).strip()
+                numbers = [(t, x) for t, x in tokens if _TABLE_NUMBER_RE.match(t)]
+                heading = _TABLE_SECTOR_RE.search(text) if not numbers else None
+                if heading:
+                    sector = _TABLE_SECTORS[heading.group(1).lower()]
+                if not text or len(numbers) < 2:
+                    continue
+
+                values, code = {}, None
+                if columns:
+                    width = min(abs(a - b) for a in columns.values() for b in columns.values() if a != b)
+                    for t, x in numbers:
+                        year, cx = min(columns.items(), key=lambda c: abs(c[1] - x))
+                        if abs(cx - x) <= width / 2:
+                            values[year] = t
+                        elif x < min(columns.values()) and code is None:
+                            code = t
+                else:
+                    # no header: like the old regex, need a run of trailing figures
+                    run = 0
+                    while run < len(tokens) and _TABLE_NUMBER_RE.match(tokens[-run - 1][0]):
+                        run += 1
+                    if run < len(DEFAULT_BUDGET_YEARS):
+                        continue
+                    trailing = numbers[-len(DEFAULT_BUDGET_YEARS):]
+                    values = dict(zip(DEFAULT_BUDGET_YEARS, (t for t, _ in trailing)))
+                    if len(numbers) > len(DEFAULT_BUDGET_YEARS):
+                        code = numbers[-len(DEFAULT_BUDGET_YEARS) - 1][0]
+                    for y in DEFAULT_BUDGET_YEARS:
+                        if y not in years_seen:
+                            years_seen.append(y)
+                if values:
+                    items.append((page_num + 1, sector, text, code, values))
+
+    table = {
+        "page": [i[0] for i in items],
+        "sector": [i[1] for i in items],
+        "programme": [i[2] for i in items],
+        "code": [i[3] for i in items],
+    }
+    for year in sorted(years_seen):
+        table[year] = _parse_amounts([i[4].get(year, "") for i in items])
+    return table
+
+
+def budget_table_totals(table, by="sector"):
+    """Sum every year column per group (default: sector). Returns {group: {year: total}}."""
+    years = [k for k in table if _TABLE_YEAR_RE.match(k)]
+    groups = np.asarray([g or "Unassigned" for g in table.get(by, [])], dtype=object)
+    totals = {}
+    for group in dict.fromkeys(groups):
+        mask = groups == group
+        totals[group] = {y: float(np.nansum(table[y][mask])) for y in years}
+    return totals
+
+
+def budget_table_records(table):
+    """Row dicts for JSON: page/sector/programme/code plus one key per year (None when blank)."""
+    years = [k for k in table if _TABLE_YEAR_RE.match(k)]
+    return [
+        {
+            "page": table["page"][i],
+            "sector": table["sector"][i],
+            "programme": table["programme"][i],
+            "code": table["code"][i],
+            **{y: None if np.isnan(table[y][i]) else float(table[y][i]) for y in years},
+        }
+        for i in range(len(table["page"]))
+    ]
+
+
 # ---- Agriculture Budget ----
 def extract_agriculture_budget(text: str):
     rows = []
@@ -670,8 +1989,101 @@ def extract_total_budget(text: str):
     return max(numbers) if numbers else None
 
 
+# ---- Single-Pass Keyword Scanner ----
+# All keywords are compiled into one trie-shaped regex, so each text position
+# is tested against at most one branch per character: scanning stays linear in
+# document length however many indicators are configured. The trie sits in a
+# lookahead, so the scan is tried at every position and overlapping keywords
+# ("climate finance" / "finance ministry") are all found. Numbers are located
+# in a second linear pass and paired with keywords by bisection.
+_SCAN_NUMBER_RE = re.compile(r"\d[\d,\.]*")
+
+
+def _trie_pattern(words):
+    trie = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # a keyword ends here: the rest is optional, greedy so the longest keyword wins
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+@lru_cache(maxsize=32)
+def _compile_scanner(keywords):
+    """Compile (regex, prefixes) for a tuple of lowercase keywords; cached per keyword set."""
+    # zero-width, so finditer moves on one character at a time; group 1 is the
+    # longest keyword starting at each position
+    regex = re.compile("(?=(" + _trie_pattern(keywords) + "))", re.IGNORECASE)
+    # keywords that are prefixes of longer ones ("climate" of "climate adaptation")
+    # start at the same position, so the long match also counts for them
+    prefixes = {}
+    for outer in keywords:
+        for inner in keywords:
+            if inner != outer and outer.startswith(inner):
+                prefixes.setdefault(outer, []).append(inner)
+    return regex, prefixes
+
+
+def scan_keyword_numbers(text_or_pages, keywords=None):
+    """
+    Find every keyword occurrence and the first number following it, in one sweep.
+    Accepts a string or a list of page texts. Returns a list of dicts
+    {keyword, value, raw, start, end, page} ordered by position; page is
+    1-based when pages were given, otherwise None.
+    """
+    if isinstance(text_or_pages, (list, tuple)):
+        text = "\n".join(text_or_pages)
+        page_starts, pos = [], 0
+        for page in text_or_pages:
+            page_starts.append(pos)
+            pos += len(page) + 1
+    else:
+        text, page_starts = text_or_pages or "", None
+    if not text:
+        return []
+
+    keywords = tuple(sorted({k.lower() for k in (keywords or BUDGET_KEYWORDS)}))
+    regex, prefixes = _compile_scanner(keywords)
+
+    numbers = [(m.start(), m.group(0)) for m in _SCAN_NUMBER_RE.finditer(text)]
+    number_starts = [start for start, _ in numbers]
+
+    occurrences = []
+    for m in regex.finditer(text):
+        found, start = m.group(1).lower(), m.start()
+        for keyword in [found] + prefixes.get(found, []):
+            end = start + len(keyword)
+            i = bisect.bisect_left(number_starts, end)
+            raw = numbers[i][1] if i < len(numbers) else None
+            try:
+                value = float(raw.replace(",", "")) if raw else None
+            except ValueError:
+                value = None
+            occurrences.append({
+                "keyword": keyword,
+                "value": value,
+                "raw": raw,
+                "start": start,
+                "end": end,
+                "page": bisect.bisect_right(page_starts, start) if page_starts else None
+            })
+    occurrences.sort(key=lambda o: (o["start"], -len(o["keyword"])))
+    return occurrences
+
+
 # ---- Simple Number Extractor ----
 def extract_numbers_from_text(text, keywords=None):
+    """First number after each keyword (keyword -> float, or None if unparsable)."""
     results = {}
     if not text:
         return results
@@ -679,18 +2091,16 @@ def extract_numbers_from_text(text, keywords=None):
     if not keywords:
         keywords = ["total budget", "public", "adaptation", "mitigation"]
 
-    clean_text = text.lower()
+    first = {}
+    for occ in scan_keyword_numbers(text, keywords):
+        if occ["raw"] is not None:
+            first.setdefault(occ["keyword"], occ["value"])
     for key in keywords:
-        pattern = rf"{key}[^0-9]*([\d,\.]+)"
-        match = re.search(pattern, clean_text)
-        if match:
-            num_str = match.group(1).replace(",", "")
-            try:
-                results[key] = float(num_str)
-            except ValueError:
-                results[key] = None
+        if key.lower() in first:
+            results[key] = first[key.lower()]
     return results
 
 # Initialize DB on startup
 init_db()
+release_conn()
 
@@ -0,0 +1,109 @@
+"""
+Cheap-route latency while chat traffic saturates a fixed pool of workers.
+
+The app is served from a WSGI server with --workers threads (standing in for
+gunicorn's thread count) and a local mock LLM answering in --latency seconds.
+--chats clients hit /api/chat at once with distinct questions while a probe
+keeps requesting /about; run once with admission control effectively off and
+once with the configured limits (all clients share 127.0.0.1, so the per-user
+quota is lifted for the run).
+
+    python benchmarks/bench_admission.py [--workers 32] [--chats 60] [--latency 2.0]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ["CMAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="cmat-bench-"), "cmat.db")
+
+import mock_llm  # noqa: E402
+
+
+class PooledWSGIServer(ThreadingMixIn, WSGIServer):
+    """WSGI server that handles connections on a bounded thread pool."""
+    request_queue_size = 1024
+    workers = 32
+
+    def process_request(self, request, client_address):
+        if not hasattr(self, "pool"):
+            self.pool = ThreadPoolExecutor(max_workers=self.workers)
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def run(base, chats, label):
+    probes, stop = [], threading.Event()
+
+    def probe():
+        while not stop.is_set():
+            start = time.perf_counter()
+            requests.get(f"{base}/about", timeout=60)
+            probes.append(time.perf_counter() - start)
+            time.sleep(0.05)
+
+    def chat(i):
+        r = requests.post(f"{base}/api/chat", json={"message": f"{label} benchmark question {i}"}, timeout=120)
+        return r.status_code
+
+    prober = threading.Thread(target=probe)
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=chats) as pool:
+        statuses = list(pool.map(chat, range(chats)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    prober.join()
+    probes.sort()
+    counts = {s: statuses.count(s) for s in sorted(set(statuses))}
+    print(f"    chats {counts} in {elapsed:5.2f}s")
+    print(f"    /about p50={probes[len(probes) // 2] * 1000:6.0f}ms max={probes[-1] * 1000:6.0f}ms "
+          f"({len(probes)} probes)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=32)
+    parser.add_argument("--chats", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=2.0)
+    args = parser.parse_args()
+
+    server = mock_llm.start(latency=args.latency)
+    os.environ.update({"OPENAI_API_KEY_1": "bench", "OPENAI_BASE_URL": server.base_url})
+    os.environ.pop("DEEPSEEK_API_KEY", None)
+    import app as cmat
+
+    PooledWSGIServer.workers = args.workers
+    httpd = make_server("127.0.0.1", 0, cmat.app, server_class=PooledWSGIServer, handler_class=QuietHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{httpd.server_port}"
+    requests.get(f"{base}/about", timeout=60)  # warm up templates and the startup doc index
+    time.sleep(2)
+
+    controller = cmat.chat_admission
+    controller.per_user = args.chats
+    limits = (controller.max_concurrent, controller.max_queue)
+    print(f"{args.chats} concurrent chats, {args.workers} workers, provider latency {args.latency}s")
+    for label, (concurrent, queue) in (("admission off", (10 ** 6, 10 ** 6)), ("admission on", limits)):
+        controller.max_concurrent, controller.max_queue = concurrent, queue
+        print(f"  {label} (max_concurrent={concurrent}, max_queue={queue})")
+        run(base, args.chats, label)
+    print(f"  {controller.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Sync (WSGI thread pool) vs async (ASGI, asgi.py) serving of /api/chat under load.
+
+A local mock provider answers every completion in --latency seconds. Each
+server runs in its own process on a pre-built docs index; --concurrency
+clients send distinct questions at once (so neither the chat cache nor
+single-flight helps), admission limits are lifted so only the serving model
+bounds concurrency, and the server's RSS and thread count are sampled from
+/proc (Linux) while the burst runs.
+
+    python benchmarks/bench_async.py [--concurrency 300] [--latency 2.0] [--sync-workers 32,256]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, BENCH_DIR)
+
+UNLIMITED = "1000000"
+
+
+def serve(mode, port, workers):
+    """Server process: the Flask app on a fixed thread pool, or asgi.app under uvicorn."""
+    db_path = os.environ["CMAT_DB_PATH"]
+    from bench_admission import PooledWSGIServer, QuietHandler  # noqa: E402
+    os.environ["CMAT_DB_PATH"] = db_path  # bench_admission points it at a scratch DB on import
+    if mode == "sync":
+        from wsgiref.simple_server import make_server
+        import app as cmat
+        PooledWSGIServer.workers = workers
+        make_server("127.0.0.1", port, cmat.app, server_class=PooledWSGIServer,
+                    handler_class=QuietHandler).serve_forever()
+    else:
+        import uvicorn
+        uvicorn.run("asgi:app", host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+def cpu_seconds(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")  # utime + stime
+
+
+def proc_status(pid):
+    fields = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            fields[name] = value.split()[0] if value.split() else ""
+    return int(fields["VmRSS"]) / 1024, int(fields["Threads"])
+
+
+async def post_json(port, path, body):
+    """Bare HTTP/1.1 POST over its own connection; returns the status code.
+
+    (One httpx pool juggling hundreds of connections spends more CPU than the
+    servers under test, so the load generator stays minimal.)
+    """
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = json.dumps(body).encode()
+    writer.write(f"POST {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+                 f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+    try:
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()  # rest of the response, until the server closes
+        return int(status_line.split()[1])
+    finally:
+        writer.close()
+
+
+async def burst(port, concurrency, label):
+    async def one(i):
+        start = time.perf_counter()
+        try:
+            status = await post_json(port, "/api/chat", {"message": f"{label} question {i} about adaptation finance"})
+        except (OSError, ValueError, IndexError):
+            status = None
+        return status == 200, time.perf_counter() - start
+
+    return await asyncio.gather(*(one(i) for i in range(concurrency)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run(label, mode, workers, args, env):
+    port = free_port()
+    server = subprocess.Popen([sys.executable, __file__, "--serve", mode, "--port", str(port), "--workers", str(workers)],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        for _ in range(300):
+            try:
+                httpx.get(f"{base}/about", timeout=5)
+                break
+            except httpx.HTTPError:
+                time.sleep(0.2)
+        time.sleep(2)  # startup indexing sees nothing to do; let it finish
+        idle_rss, idle_threads = proc_status(server.pid)
+
+        peak, stop = [idle_rss, idle_threads], threading.Event()
+
+        def sample():
+            while not stop.is_set():
+                rss, threads = proc_status(server.pid)
+                peak[0], peak[1] = max(peak[0], rss), max(peak[1], threads)
+                time.sleep(0.05)
+
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        cpu_before, start = cpu_seconds(server.pid), time.perf_counter()
+        results = asyncio.run(burst(port, args.concurrency, label))
+        elapsed = time.perf_counter() - start
+        cpu = cpu_seconds(server.pid) - cpu_before
+        stop.set()
+        sampler.join()
+    finally:
+        server.terminate()
+        server.wait()
+
+    times = sorted(t for ok, t in results if ok)
+    ok = len(times)
+    print(f"  {label:14s} ok={ok:4d}/{args.concurrency} elapsed={elapsed:6.2f}s throughput={ok / elapsed:6.1f}/s "
+          f"p50={times[len(times) // 2]:5.2f}s p99={times[int(len(times) * 0.99) - 1]:5.2f}s "
+          f"cpu/req={cpu / args.concurrency * 1000:5.1f}ms "
+          f"rss idle/peak={idle_rss:5.0f}/{peak[0]:5.0f}MB threads idle/peak={idle_threads:3d}/{peak[1]:3d}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=2.0)
+    parser.add_argument("--sync-workers", default="32,256")
+    parser.add_argument("--serve", choices=("sync", "async"))
+    parser.add_argument("--port", type=int)
+    parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args()
+    if args.serve:
+        serve(args.serve, args.port, args.workers)
+        return
+
+    import mock_llm
+    provider = mock_llm.start(latency=args.latency)
+    env = dict(os.environ, PYTHONPATH=ROOT, OPENAI_API_KEY_1="bench", OPENAI_BASE_URL=provider.base_url,
+               CMAT_DB_PATH=os.path.join(tempfile.mkdtemp(prefix="cmat-bench-"), "cmat.db"),
+               CMAT_CHAT_CONCURRENCY=UNLIMITED, CMAT_CHAT_QUEUE=UNLIMITED, CMAT_CHAT_PER_USER=UNLIMITED,
+               CMAT_ASYNC_CHAT_CONCURRENCY=UNLIMITED, CMAT_ASYNC_CHAT_QUEUE=UNLIMITED)
+    env.pop("DEEPSEEK_API_KEY", None)
+
+    # build the docs and retrieval indexes once, so servers start warm
+    os.environ["CMAT_DB_PATH"] = env["CMAT_DB_PATH"]
+    os.chdir(ROOT)
+    import backend
+    import doc_index
+    import retrieval
+    backend.init_db()
+    doc_index.reindex_docs()
+    retrieval.load_or_build()
+
+    print(f"{args.concurrency} concurrent chats, provider latency {args.latency}s")
+    for workers in (int(w) for w in args.sync_workers.split(",") if w):
+        run(f"sync x{workers}", "sync", workers, args, dict(env, CMAT_LLM_POOL_SIZE=str(workers)))
+    run("async", "async", 0, args, env)
+
+
+if __name__ == "__main__":
+    main()
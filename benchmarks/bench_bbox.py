@@ -0,0 +1,79 @@
+"""
+Viewport (bbox) project queries through the R*Tree vs a plain table scan.
+
+    python benchmarks/bench_bbox.py [--projects 100000] [--queries 500]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY_1", "bench")
+os.environ["CMAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="cmat-bench-"), "cmat.db")
+
+import backend  # noqa: E402
+
+# Zambia, roughly
+MIN_LON, MAX_LON, MIN_LAT, MAX_LAT = 22.0, 33.7, -18.1, -8.2
+
+
+def seed(n, rng):
+    rows = [(f"Project {i}", "Description " * 20, "images/default.jpg",
+             rng.uniform(MIN_LAT, MAX_LAT), rng.uniform(MIN_LON, MAX_LON),
+             "2024-01-01", "2026-01-01", rng.uniform(1e4, 1e7), "Ongoing", rng.uniform(0, 100))
+            for i in range(n)]
+    with backend.transaction() as c:
+        c.executemany("""
+            INSERT INTO projects (title, description, image, latitude, longitude, start_date, end_date, budget, status, completion_percentage)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+        c.execute("""
+            INSERT INTO projects_rtree (id, min_lat, max_lat, min_lon, max_lon)
+            SELECT id, latitude, latitude, longitude, longitude FROM projects
+        """)
+
+
+def scan_bbox(min_lon, min_lat, max_lon, max_lat):
+    return backend.get_conn().execute(
+        "SELECT id FROM projects WHERE latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?",
+        (min_lat, max_lat, min_lon, max_lon)
+    ).fetchall()
+
+
+def run(label, fn, boxes):
+    times, hits = [], 0
+    for box in boxes:
+        start = time.perf_counter()
+        hits += len(fn(*box))
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    p50, p99 = times[len(times) // 2], times[int(len(times) * 0.99) - 1]
+    print(f"{label:18s} p50={p50:7.2f}ms p99={p99:7.2f}ms avg_hits={hits / len(boxes):8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--projects", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    seed(args.projects, rng)
+
+    # city/district-sized viewports (~0.5 degree across)
+    boxes = []
+    for _ in range(args.queries):
+        lon, lat = rng.uniform(MIN_LON, MAX_LON - 0.5), rng.uniform(MIN_LAT, MAX_LAT - 0.5)
+        boxes.append((lon, lat, lon + 0.5, lat + 0.5))
+
+    print(f"{args.projects} projects, {args.queries} viewport queries")
+    run("table scan", scan_bbox, boxes)
+    run("rtree", backend.get_projects_in_bbox, boxes)
+
+
+if __name__ == "__main__":
+    main()
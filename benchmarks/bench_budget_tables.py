@@ -0,0 +1,50 @@
+"""
+Coordinate-aware budget table extraction over docs/*.pdf: pages per second,
+line items found and per-sector totals (the path behind /api/budget/tables).
+
+    python benchmarks/bench_budget_tables.py [--repeat 3]
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY_1", "bench")
+os.environ["CMAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="cmat-bench-"), "cmat.db")
+
+import backend  # noqa: E402
+import pdf_pages  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'document':60s} {'pages':>6s} {'items':>6s} {'pages/s':>8s}  years")
+    total_pages = total_seconds = 0
+    for path in sorted(glob.glob(os.path.join(ROOT, "docs", "*.pdf"))):
+        if not os.path.getsize(path):
+            continue
+        pages = pdf_pages.page_count(path)
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            table = backend.extract_budget_tables(path)
+        seconds = (time.perf_counter() - start) / args.repeat
+        total_pages += pages
+        total_seconds += seconds
+        years = [k for k in table if k.isdigit()]
+        print(f"{os.path.basename(path)[:60]:60s} {pages:6d} {len(table['page']):6d} "
+              f"{pages / seconds:8.0f}  {','.join(years) or '-'}")
+        for sector, totals in backend.budget_table_totals(table).items():
+            print(f"    {sector:20s} " + " ".join(f"{y}={v:,.0f}" for y, v in totals.items()))
+    if total_seconds:
+        print(f"overall: {total_pages} pages in {total_seconds:.2f}s ({total_pages / total_seconds:.0f} pages/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Requests/sec for DB-backed routes: per-call sqlite3.connect (old) vs pooled connections (new).
+
+    python benchmarks/bench_db.py [--requests 2000] [--threads 8]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY_1", "bench")
+os.environ["CMAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="cmat-bench-"), "cmat.db")
+
+import backend  # noqa: E402
+from app import app  # noqa: E402
+
+
+# ---- Baseline: connect-per-call versions of the functions the routes use ----
+# Same queries as backend.py, only the connection handling differs, so the
+# comparison isolates pooling from the later query changes. The ETag lookup
+# (backend.get_data_version) stays pooled in both runs.
+def legacy_get_news_page(limit=None, cursor=None):
+    limit = backend._page_limit(limit)
+    conn = sqlite3.connect(backend.DB_PATH)
+    c = conn.cursor()
+    c.execute(f"""
+        SELECT id, title, substr(content, 1, {backend.NEWS_EXCERPT_CHARS}), image, created_at, posted_by
+        FROM news ORDER BY created_at DESC, id DESC LIMIT ?
+    """, (limit + 1,))
+    rows = c.fetchall()
+    conn.close()
+    items = [{"id": r[0], "title": r[1], "excerpt": r[2], "image": r[3], "created_at": r[4], "posted_by": r[5]} for r in rows[:limit]]
+    next_cursor = backend.encode_cursor(rows[limit - 1][4], rows[limit - 1][0]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def legacy_count_news():
+    conn = sqlite3.connect(backend.DB_PATH)
+    count = conn.execute("SELECT COUNT(*) FROM news").fetchone()[0]
+    conn.close()
+    return count
+
+
+def legacy_get_projects():
+    conn = sqlite3.connect(backend.DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT * FROM projects")
+    rows = c.fetchall()
+    conn.close()
+    keys = ["id", "title", "description", "image", "latitude", "longitude",
+            "start_date", "end_date", "budget", "status", "completion_percentage"]
+    return [dict(zip(keys, r)) for r in rows]
+
+
+def seed(n_news=50, n_projects=50):
+    for i in range(n_news):
+        backend.add_news(f"News {i}", "Lorem ipsum " * 40, None, "admin")
+    for i in range(n_projects):
+        backend.add_project(f"Project {i}", "Description " * 20, "images/default.jpg",
+                            -15.4 + i * 0.01, 28.3 + i * 0.01, "2024-01-01", "2025-01-01",
+                            1000.0 * i, "Ongoing", 50.0)
+    backend.release_conn()
+
+
+def run(paths, total, threads):
+    def hit(i):
+        with app.test_client() as client:
+            client.get(paths[i % len(paths)])
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(hit, range(total)))
+    return total / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    seed()
+    paths = ["/", "/api/projects"]
+
+    # every backend function "/" and "/api/projects" call
+    patched = ("get_news_page", "count_news", "get_projects")
+    pooled = {name: getattr(backend, name) for name in patched}
+    legacy = {"get_news_page": legacy_get_news_page, "count_news": legacy_count_news,
+              "get_projects": legacy_get_projects}
+    for name in patched:
+        setattr(backend, name, legacy[name])
+    before = run(paths, args.requests, args.threads)
+    for name in patched:
+        setattr(backend, name, pooled[name])
+    after = run(paths, args.requests, args.threads)
+
+    print(f"requests={args.requests} threads={args.threads} db={backend.DB_PATH}")
+    print(f"before (connect per call): {before:8.1f} req/s")
+    print(f"after  (pooled + WAL):     {after:8.1f} req/s  ({after / before:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
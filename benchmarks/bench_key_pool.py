@@ -0,0 +1,70 @@
+"""
+Throughput with 1 vs N API keys when every key is rate limited upstream.
+
+A local mock provider allows --rate-limit requests per key per second and
+answers 429 (with x-ratelimit-* headers) beyond that; --workers threads push
+--calls distinct chat completions through llm_gateway.
+
+    python benchmarks/bench_key_pool.py [--keys 3] [--rate-limit 10] [--calls 150] [--workers 24]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import llm_gateway  # noqa: E402
+import mock_llm  # noqa: E402
+
+
+def run(server, keys, calls, workers):
+    for name in [n for n in os.environ if n.startswith(("OPENAI_API_KEY", "DEEPSEEK_API_KEY"))]:
+        del os.environ[name]
+    for i in range(keys):
+        os.environ[f"OPENAI_API_KEY_{i + 1}"] = f"sk-bench-key-{i + 1:04d}"
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    llm_gateway._providers = None
+
+    errors, lock = [0], threading.Lock()
+
+    def call(i):
+        try:
+            llm_gateway.chat_completion([{"role": "user", "content": f"question {i}"}])
+        except llm_gateway.LLMError:
+            with lock:
+                errors[0] += 1
+
+    throttled_before = server.throttled
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(call, range(calls)))
+    elapsed = time.perf_counter() - start
+    ok = calls - errors[0]
+    print(f"  keys={keys} ok={ok:4d} failed={errors[0]:3d} 429s={server.throttled - throttled_before:4d} "
+          f"elapsed={elapsed:6.2f}s throughput={ok / elapsed:6.1f}/s")
+    for key in llm_gateway.get_stats()["providers"][0]["keys"]:
+        print(f"    {key['key']}: requests={key['requests']} share={key['share']:.2f} throttled={key['throttled']}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--keys", type=int, default=3)
+    parser.add_argument("--rate-limit", type=int, default=10)
+    parser.add_argument("--calls", type=int, default=150)
+    parser.add_argument("--workers", type=int, default=24)
+    args = parser.parse_args()
+    llm_gateway.LLM_RETRIES = 8  # measure throughput, not give-up behaviour
+
+    server = mock_llm.start(latency=0.1, rate_limit=args.rate_limit)
+    print(f"{args.calls} calls, {args.workers} workers, {args.rate_limit} req/s per key")
+    run(server, 1, args.calls, args.workers)
+    run(server, args.keys, args.calls, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+LLM gateway vs the old sequential OpenAI -> DeepSeek fallback, against local mock providers.
+
+Scenarios:
+  slow-primary   OpenAI answers in 1.5s, DeepSeek in 0.3s (EWMA routing)
+  failing        OpenAI returns 503 for every call (circuit breaker)
+  tail-latency   OpenAI is usually fast but 10% of calls take 3s (hedged requests)
+
+    python benchmarks/bench_llm_gateway.py [--calls 40]
+"""
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import llm_gateway  # noqa: E402
+import mock_llm  # noqa: E402
+
+MESSAGES = [{"role": "user", "content": "What is Zambia's NDC target?"}]
+
+
+def legacy_call(openai_url, deepseek_url):
+    """The pre-gateway behaviour: new connection per call, OpenAI first, DeepSeek on any failure."""
+    for url in (openai_url, deepseek_url):
+        try:
+            r = requests.post(f"{url}/chat/completions", json={"messages": MESSAGES}, timeout=30)
+            r.raise_for_status()
+            return r.json()
+        except requests.RequestException:
+            continue
+    raise RuntimeError("both failed")
+
+
+def gateway_for(openai_url, deepseek_url):
+    os.environ.update({"OPENAI_API_KEY_1": "k1", "DEEPSEEK_API_KEY": "k2",
+                       "OPENAI_BASE_URL": openai_url, "DEEPSEEK_BASE_URL": deepseek_url})
+    llm_gateway._providers = None
+    return lambda: llm_gateway.chat_completion(MESSAGES)
+
+
+def measure(label, fn, calls):
+    times = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    ordered = sorted(times)
+    print(f"  {label:10s} total={sum(times):6.2f}s p50={ordered[len(ordered) // 2] * 1000:7.0f}ms "
+          f"p99={ordered[int(len(ordered) * 0.99) - 1] * 1000:7.0f}ms")
+
+
+class TailServer(mock_llm.MockLLMServer):
+    """Fast, except every tenth request stalls."""
+
+    def delay(self):
+        with self.lock:
+            return 3.0 if self.requests % 10 == 0 else self.latency
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=40)
+    args = parser.parse_args()
+    llm_gateway.LLM_RETRIES = 0  # isolate routing/breaker/hedging from retry behaviour
+
+    print("slow-primary: OpenAI 1.5s, DeepSeek 0.3s")
+    slow, fast = mock_llm.start(latency=1.5), mock_llm.start(latency=0.3)
+    measure("legacy", lambda: legacy_call(slow.base_url, fast.base_url), args.calls)
+    measure("gateway", gateway_for(slow.base_url, fast.base_url), args.calls)
+
+    print("failing: OpenAI always 503, DeepSeek 0.3s")
+    broken, fast = mock_llm.start(latency=1.0, fail_rate=1.0), mock_llm.start(latency=0.3)
+    measure("legacy", lambda: legacy_call(broken.base_url, fast.base_url), args.calls)
+    before = broken.requests
+    measure("gateway", gateway_for(broken.base_url, fast.base_url), args.calls)
+    print(f"  gateway sent {broken.requests - before} of {args.calls} calls to the failing provider")
+
+    print("tail-latency: OpenAI 0.2s with 10% at 3s, DeepSeek 0.4s")
+    tail = TailServer(("127.0.0.1", 0), latency=0.2)
+    mock_llm.threading.Thread(target=tail.serve_forever, daemon=True).start()
+    backup = mock_llm.start(latency=0.4)
+    measure("no hedge", gateway_for(tail.base_url, backup.base_url), args.calls)
+    llm_gateway.LLM_HEDGE_AFTER = 0.6
+    measure("hedged", gateway_for(tail.base_url, backup.base_url), args.calls)
+    print(f"  stats: {llm_gateway.get_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Peak RSS and wall time for PDF text extraction over docs/*.pdf.
+
+Each mode runs in a fresh subprocess so ru_maxrss reflects only that mode:
+  bytes    - the original path: read() the whole upload, fitz.open(stream=...)
+  stream   - spool to a temp file, open from disk, one page at a time
+  parallel - as stream, with page ranges fanned out to a process pool
+
+    python benchmarks/bench_pdf_extract.py [--repeat 3]
+"""
+import argparse
+import glob
+import os
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ("bytes", "stream", "parallel")
+
+
+def _run_mode(mode, paths, repeat):
+    import fitz
+    import pdf_pages
+
+    pages = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for path in paths:
+            with open(path, "rb") as f:
+                if mode == "bytes":
+                    with fitz.open(stream=f.read(), filetype="pdf") as doc:
+                        text = [page.get_text("text") or "" for page in doc]
+                else:
+                    tmp = pdf_pages.spool_to_tempfile(f)
+                    try:
+                        text = pdf_pages.extract_pages(tmp, parallel=(mode == "parallel"))
+                    finally:
+                        os.remove(tmp)
+            pages += len(text)
+    elapsed = time.perf_counter() - start
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode:9s} pages={pages:5d} time={elapsed:7.2f}s peak_rss={rss_mb:7.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--mode", choices=MODES)
+    args = parser.parse_args()
+
+    paths = [p for p in sorted(glob.glob(os.path.join(ROOT, "docs", "*.pdf"))) if os.path.getsize(p)]
+    if args.mode:
+        _run_mode(args.mode, paths, args.repeat)
+        return
+
+    total_mb = sum(os.path.getsize(p) for p in paths) / (1024 * 1024)
+    print(f"{len(paths)} PDFs, {total_mb:.1f} MB")
+    for mode in MODES:
+        subprocess.run([sys.executable, __file__, "--mode", mode, "--repeat", str(args.repeat)], check=True)
+
+
+if __name__ == "__main__":
+    main()
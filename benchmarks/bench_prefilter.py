@@ -0,0 +1,42 @@
+"""
+Tokens sent to the model with and without the page prefilter, per PDF in docs/.
+
+    python benchmarks/bench_prefilter.py [--budget 24000]
+"""
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY_1", "bench")
+os.environ["CMAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="cmat-bench-"), "cmat.db")
+
+import backend  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--budget", type=int, default=backend.PREFILTER_TOKEN_BUDGET)
+    args = parser.parse_args()
+
+    print(f"{'document':60s} {'pages':>11s} {'tokens':>15s} {'saved':>7s} {'ms':>6s}")
+    for path in sorted(glob.glob(os.path.join(ROOT, "docs", "*.pdf"))):
+        if not os.path.getsize(path):
+            continue
+        pages = backend.extract_pages_from_pdf(path)
+        start = time.perf_counter()
+        _, report = backend.select_relevant_pages(pages, args.budget)
+        ms = (time.perf_counter() - start) * 1000
+        saved = report["tokens_saved"] / report["tokens_total"] if report["tokens_total"] else 0
+        print(f"{os.path.basename(path)[:60]:60s} "
+              f"{report['pages_kept']:4d}/{report['pages_total']:<6d} "
+              f"{report['tokens_kept']:6d}/{report['tokens_total']:<8d} "
+              f"{saved:6.1%} {ms:6.1f}")
+
+
+if __name__ == "__main__":
+    main()
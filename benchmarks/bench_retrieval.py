@@ -0,0 +1,57 @@
+"""
+Chat retrieval: index build/load time, per-query latency and prompt size.
+
+    python benchmarks/bench_retrieval.py [--queries 1000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY_1", "bench")
+os.environ["CMAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="cmat-bench-"), "cmat.db")
+
+import backend  # noqa: E402
+import doc_index  # noqa: E402
+import retrieval  # noqa: E402
+
+QUESTIONS = [
+    "What is Zambia's NDC emission reduction target?",
+    "How is climate change adaptation integrated into the national budget?",
+    "What did the committee recommend on carbon markets and trading?",
+    "Which institutions coordinate climate change policy?",
+    "How will the national adaptation plan be financed?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    doc_index.reindex_docs()
+    start = time.perf_counter()
+    index = retrieval.build_index()
+    print(f"build: {len(index['passages'])} passages in {time.perf_counter() - start:.2f}s")
+    retrieval._index = None
+    start = time.perf_counter()
+    retrieval.load_or_build()
+    print(f"load (mmap): {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    times = []
+    for i in range(args.queries):
+        start = time.perf_counter()
+        retrieval.retrieve(QUESTIONS[i % len(QUESTIONS)])
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    print(f"retrieve: p50={times[len(times) // 2]:.2f}ms p99={times[int(len(times) * 0.99) - 1]:.2f}ms")
+
+    sizes = [backend.estimate_tokens(retrieval.build_context(retrieval.retrieve(q))[0]) for q in QUESTIONS]
+    print(f"context tokens per question: max={max(sizes)} avg={sum(sizes) / len(sizes):.0f}")
+
+
+if __name__ == "__main__":
+    main()
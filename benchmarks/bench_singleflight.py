@@ -0,0 +1,76 @@
+"""
+Burst of identical LLM requests with and without single-flight coalescing.
+
+N threads extract the same budget text at once (the "everyone uploads the
+circulated PDF" case) against a local mock provider; reports upstream calls
+and caller latency.
+
+    python benchmarks/bench_singleflight.py [--callers 50] [--latency 1.0]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ["CMAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="cmat-bench-"), "cmat.db")
+
+import mock_llm  # noqa: E402
+
+REPLY = json.dumps({"Total Budget": 1000000, "Sectors": {"Energy": 250000}})
+
+
+def burst(fn, callers):
+    times, barrier = [], threading.Barrier(callers)
+
+    def caller():
+        barrier.wait()
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=caller) for _ in range(callers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    times.sort()
+    return times[len(times) // 2], times[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--callers", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+
+    server = mock_llm.start(latency=args.latency, reply=REPLY)
+    os.environ.update({"OPENAI_API_KEY_1": "bench", "OPENAI_BASE_URL": server.base_url})
+    os.environ.pop("DEEPSEEK_API_KEY", None)
+    import backend
+    import llm_gateway
+
+    def extract():
+        try:
+            backend.ai_extract_budget_info("Ministry of Finance budget estimates 2025 ...")
+        finally:
+            backend.release_conn()
+
+    print(f"{args.callers} concurrent identical extractions, provider latency {args.latency}s")
+    for enabled in (False, True):
+        llm_gateway.SINGLEFLIGHT_ENABLED = enabled
+        backend.clear_ai_cache()
+        before = server.requests
+        p50, worst = burst(extract, args.callers)
+        print(f"  singleflight={'on ' if enabled else 'off'} upstream calls={server.requests - before:3d} "
+              f"p50={p50 * 1000:6.0f}ms max={worst * 1000:6.0f}ms")
+    print(f"  {llm_gateway.get_stats()['singleflight']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Survey persistence: per-user delete + re-insert (old) vs bulk diff UPSERT (new).
+
+Imports N users x M indicators, then re-imports with ~10% of values changed.
+
+    python benchmarks/bench_survey.py [--users 10000] [--indicators 50]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("OPENAI_API_KEY_1", "bench")
+os.environ["CMAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="cmat-bench-"), "cmat.db")
+
+import backend  # noqa: E402
+
+
+def legacy_save_survey_data(username, data):
+    """The original implementation: fresh connection, delete all rows, insert one at a time."""
+    conn = sqlite3.connect(backend.DB_PATH)
+    c = conn.cursor()
+    c.execute("SELECT id FROM users WHERE username = ?", (username,))
+    user_id = c.fetchone()[0]
+    c.execute("DELETE FROM survey_data WHERE user_id=?", (user_id,))
+    for indicator, value in data.items():
+        c.execute("INSERT INTO survey_data (user_id, indicator, value) VALUES (?, ?, ?)",
+                  (user_id, indicator, value))
+    conn.commit()
+    conn.close()
+
+
+def make_surveys(users, indicators, seed, changed=0.0, base=None):
+    rng = random.Random(seed)
+    if base is None:
+        return {f"mp{u}": {f"indicator_{i}": str(rng.randint(0, 10**9)) for i in range(indicators)}
+                for u in range(users)}
+    out = {}
+    for username, data in base.items():
+        out[username] = {k: (str(rng.randint(0, 10**9)) if rng.random() < changed else v) for k, v in data.items()}
+    return out
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:42s} {elapsed:8.2f}s {result or ''}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--indicators", type=int, default=50)
+    args = parser.parse_args()
+
+    with backend.transaction() as c:
+        c.executemany("INSERT INTO users (username, password) VALUES (?, 'x')",
+                      [(f"mp{u}",) for u in range(args.users)])
+    first = make_surveys(args.users, args.indicators, seed=1)
+    second = make_surveys(args.users, args.indicators, seed=2, changed=0.1, base=first)
+    print(f"{args.users} users x {args.indicators} indicators = {args.users * args.indicators} rows")
+
+    def clear():
+        with backend.transaction() as c:
+            c.execute("DELETE FROM survey_data")
+
+    def legacy_import(surveys):
+        for username, data in surveys.items():
+            legacy_save_survey_data(username, data)
+
+    # both paths start from an empty survey_data table
+    clear()
+    timed("old: initial import", lambda: legacy_import(first))
+    timed("old: re-import, 10% changed", lambda: legacy_import(second))
+
+    clear()
+    timed("new: initial import", lambda: backend.save_survey_data_bulk(first))
+    timed("new: re-import, 10% changed", lambda: backend.save_survey_data_bulk(second))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Local stand-in for an OpenAI-compatible chat-completions API.
+
+Used by the LLM benchmarks in place of OpenAI/DeepSeek. Latency, failure rate,
+streaming (with a closing usage chunk when stream_options.include_usage is
+set) and a per-API-key rate limit (with OpenAI-style x-ratelimit-* headers and
+429s) are configurable, and every server counts the requests it saw.
+
+    python benchmarks/mock_llm.py [--port 8700] [--latency 0.5] [--fail-rate 0.1]
+
+In-process:
+
+    server = mock_llm.start(latency=0.2)
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STREAM_TOKENS = 20
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, latency=0.2, jitter=0.0, fail_rate=0.0, fail_status=503, reply="mock reply",
+                 rate_limit=None):
+        super().__init__(address, MockLLMHandler)
+        self.rate_limit = rate_limit  # requests per key per 1s window
+        self.windows = {}  # key -> (window start, count)
+        self.throttled = 0
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.reply = reply
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.rng = random.Random(0)
+
+    def handle_error(self, request, client_address):
+        pass  # clients hanging up mid-stream are expected under load
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def delay(self):
+        with self.lock:
+            return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def take(self, key):
+        """Count a request against key's window; returns (allowed, rate-limit headers)."""
+        if not self.rate_limit:
+            return True, {}
+        with self.lock:
+            now = time.monotonic()
+            start, count = self.windows.get(key, (now, 0))
+            if now - start >= 1.0:
+                start, count = now, 0
+            allowed = count < self.rate_limit
+            if allowed:
+                count += 1
+            else:
+                self.throttled += 1
+            self.windows[key] = (start, count)
+            reset = max(0.0, 1.0 - (now - start))
+        headers = {
+            "x-ratelimit-limit-requests": str(self.rate_limit),
+            "x-ratelimit-remaining-requests": str(self.rate_limit - count),
+            "x-ratelimit-reset-requests": f"{int(reset * 1000)}ms",
+        }
+        if not allowed:
+            headers["Retry-After"] = f"{reset:.3f}"
+        return allowed, headers
+
+    def should_fail(self):
+        with self.lock:
+            return self.rng.random() < self.fail_rate
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _chunk(self, data):
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with server.lock:
+            server.requests += 1
+        delay = server.delay()
+
+        allowed, limit_headers = server.take(self.headers.get("Authorization", ""))
+        if not allowed:
+            self._json(429, {"error": {"message": "Rate limit reached"}}, limit_headers)
+            return
+
+        if server.should_fail():
+            time.sleep(delay / 4)
+            self._json(server.fail_status, {"error": {"message": "mock failure"}}, {"Retry-After": "0"})
+            return
+
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in body.get("messages", []))
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            for name, value in limit_headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            for i in range(STREAM_TOKENS):
+                time.sleep(delay / STREAM_TOKENS)
+                chunk = {"object": "chat.completion.chunk", "model": body.get("model"),
+                         "choices": [{"index": 0, "delta": {"content": f"tok{i} "}, "finish_reason": None}]}
+                self._chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage = {"object": "chat.completion.chunk", "model": body.get("model"), "choices": [],
+                         "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": STREAM_TOKENS,
+                                   "total_tokens": prompt_tokens + STREAM_TOKENS}}
+                self._chunk(f"data: {json.dumps(usage)}\n\n".encode())
+            self._chunk(b"data: [DONE]\n\n")
+            self._chunk(b"")
+            return
+
+        time.sleep(delay)
+        self._json(200, {
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": server.reply}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": 20, "total_tokens": prompt_tokens + 20},
+        }, limit_headers)
+
+
+def start(port=0, **options):
+    """Start a mock server on a background thread; returns it (see .base_url, .requests)."""
+    server = MockLLMServer(("127.0.0.1", port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8700)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--fail-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=None, help="requests per API key per second")
+    args = parser.parse_args()
+    server = MockLLMServer(("127.0.0.1", args.port), latency=args.latency, jitter=args.jitter,
+                           fail_rate=args.fail_rate, rate_limit=args.rate_limit)
+    print(f"mock LLM listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
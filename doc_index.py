@@ -0,0 +1,128 @@
+"""
+Full-text search over the policy document library in docs/.
+
+Page text comes from the same PyMuPDF path as uploads (pdf_pages) and is
+stored one row per page in the doc_pages FTS5 table. reindex_docs() is
+incremental: a file is re-read only when its mtime/size changed, and
+re-indexed only when its content hash changed too. search_docs() returns
+BM25-ranked pages with highlighted snippets.
+"""
+import hashlib
+import os
+import re
+import time
+
+from markupsafe import escape
+
+import backend
+import pdf_pages
+
+DOCS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "docs")
+SNIPPET_TOKENS = 16
+_MARK_START, _MARK_END = "\x02", "\x03"
+_QUERY_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+@backend.timed_queries
+def reindex_docs(folder=None, force=False):
+    """
+    Bring the index in line with the PDFs in folder (default docs/).
+    Returns {"indexed": [...], "unchanged": n, "removed": [...], "failed": [...]}.
+    """
+    folder = folder or DOCS_DIR
+    stats = {"indexed": [], "unchanged": 0, "removed": [], "failed": []}
+    conn = backend.get_conn()
+    known = {r[0]: r[1:] for r in conn.execute("SELECT path, mtime, size, sha256 FROM doc_files")}
+    present = set()
+
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if not name.lower().endswith(".pdf") or not os.path.isfile(path):
+            continue
+        present.add(name)
+        st = os.stat(path)
+        stored = known.get(name)
+        if not force and stored and stored[0] == st.st_mtime and stored[1] == st.st_size:
+            stats["unchanged"] += 1
+            continue
+
+        digest = _sha256(path)
+        if not force and stored and stored[2] == digest:
+            with backend.transaction() as c:  # touched but identical: just record the new stat
+                c.execute("UPDATE doc_files SET mtime=?, size=? WHERE path=?", (st.st_mtime, st.st_size, name))
+            stats["unchanged"] += 1
+            continue
+
+        try:
+            start = time.perf_counter()
+            rows = [(name, i + 1, text) for i, text in enumerate(pdf_pages.iter_pages(path)) if text.strip()]
+            elapsed = time.perf_counter() - start
+            page_count = pdf_pages.page_count(path)
+            backend.observe_pdf_extraction("docs", elapsed, page_count)
+        except Exception as e:
+            # recorded with no pages so an unreadable file is not retried until it changes
+            print(f"⚠️ Could not index {name}:", e)
+            stats["failed"].append(name)
+            rows, page_count = [], 0
+
+        with backend.transaction() as c:
+            c.execute("DELETE FROM doc_pages WHERE path=?", (name,))
+            c.executemany("INSERT INTO doc_pages (path, page, body) VALUES (?, ?, ?)", rows)
+            c.execute("""
+                INSERT OR REPLACE INTO doc_files (path, mtime, size, sha256, pages, indexed_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (name, st.st_mtime, st.st_size, digest, page_count, time.time()))
+        if page_count:
+            stats["indexed"].append(name)
+
+    for name in set(known) - present:
+        with backend.transaction() as c:
+            c.execute("DELETE FROM doc_pages WHERE path=?", (name,))
+            c.execute("DELETE FROM doc_files WHERE path=?", (name,))
+        stats["removed"].append(name)
+    return stats
+
+
+def _fts_query(q, any_term=False):
+    """Turn free text into a safe FTS5 query: quoted terms, AND-ed (or OR-ed)."""
+    terms = _QUERY_TERM_RE.findall(q or "")
+    return (" OR " if any_term else " ").join(f'"{t}"' for t in terms)
+
+
+@backend.timed_queries
+def search_docs(q, limit=10):
+    """
+    Ranked pages matching q: [{doc, page, snippet (HTML, <mark>ed), score}].
+    Falls back to matching any term when no page contains all of them.
+    """
+    limit = max(1, min(int(limit or 10), 50))
+    conn = backend.get_conn()
+    for any_term in (False, True):
+        match = _fts_query(q, any_term)
+        if not match:
+            return []
+        rows = conn.execute(f"""
+            SELECT path, page, snippet(doc_pages, 2, ?, ?, '…', {SNIPPET_TOKENS}), bm25(doc_pages)
+            FROM doc_pages WHERE doc_pages MATCH ?
+            ORDER BY bm25(doc_pages) LIMIT ?
+        """, (_MARK_START, _MARK_END, match, limit)).fetchall()
+        if rows:
+            break
+
+    return [
+        {
+            "doc": r[0],
+            "page": r[1],
+            "snippet": str(escape(" ".join(r[2].split()))).replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>"),
+            "score": round(-r[3], 4)  # bm25() is lower-is-better; flip so higher = more relevant
+        }
+        for r in rows
+    ]
@@ -0,0 +1,104 @@
+"""
+Resized WebP derivatives for uploaded and bundled images.
+
+Each source image under static/ gets re-encoded copies at IMAGE_WIDTHS (never
+upscaled) in static/images/derived/. Their paths are recorded in the
+image_variants table and templates emit them through image_srcset(), keeping
+the original as the <img src> fallback. New uploads are processed by
+process_image(); existing files by `flask --app app backfill-images`.
+"""
+import os
+import threading
+
+from flask import url_for
+from PIL import Image, ImageOps
+
+import backend
+
+STATIC_ROOT = "static"
+DERIVED_DIR = os.path.join("images", "derived")  # relative to STATIC_ROOT
+IMAGE_WIDTHS = (320, 640, 1280)
+IMAGE_FORMAT = "WEBP"
+IMAGE_QUALITY = 75
+SOURCE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif"}
+
+_variants = None  # {image path: [{"width", "path"}]}, loaded lazily from the DB
+_variants_lock = threading.Lock()
+
+
+def _load_variants():
+    global _variants
+    with _variants_lock:
+        if _variants is None:
+            _variants = backend.get_image_variants()
+        return _variants
+
+
+def process_image(image, force=False):
+    """
+    Build derivatives for a static-relative path (e.g. "images/barotse.jpg").
+    Skips work when derivatives already exist for the file's current mtime.
+    Returns the list of variants, or [] if the file is missing.
+    """
+    source = os.path.join(STATIC_ROOT, image)
+    if not os.path.isfile(source):
+        return []
+    mtime = os.path.getmtime(source)
+    if not force:
+        stored = backend.get_image_variants(image)
+        if stored and stored["source_mtime"] == mtime and all(
+            os.path.exists(os.path.join(STATIC_ROOT, v["path"])) for v in stored["variants"]
+        ):
+            return stored["variants"]
+
+    os.makedirs(os.path.join(STATIC_ROOT, DERIVED_DIR), exist_ok=True)
+    stem = os.path.basename(image).replace(".", "-")  # keep photo.jpg and photo.png apart
+    variants = []
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "transparency" in img.info or img.mode in ("LA", "P") else "RGB")
+        # never upscale: widths above the original collapse to the original width
+        widths = sorted({min(w, img.width) for w in IMAGE_WIDTHS})
+        for width in widths:
+            height = max(1, round(img.height * width / img.width))
+            resized = img if width == img.width else img.resize((width, height), Image.LANCZOS)
+            rel = os.path.join(DERIVED_DIR, f"{stem}-{width}.webp").replace(os.sep, "/")
+            resized.save(os.path.join(STATIC_ROOT, rel), IMAGE_FORMAT, quality=IMAGE_QUALITY, method=6)
+            variants.append({"width": width, "path": rel})
+
+    backend.save_image_variants(image, variants, mtime)
+    with _variants_lock:
+        if _variants is not None:
+            _variants[image] = variants
+    return variants
+
+
+def backfill(force=False):
+    """
+    Process every source image under static/images.
+    Returns (images processed, total original bytes, total bytes of the smallest variants).
+    """
+    processed, before, after = 0, 0, 0
+    folder = os.path.join(STATIC_ROOT, "images")
+    for name in sorted(os.listdir(folder)):
+        if os.path.splitext(name)[1].lower() not in SOURCE_EXTENSIONS:
+            continue
+        image = f"images/{name}"
+        variants = process_image(image, force)
+        if not variants:
+            continue
+        processed += 1
+        before += os.path.getsize(os.path.join(STATIC_ROOT, image))
+        after += os.path.getsize(os.path.join(STATIC_ROOT, variants[0]["path"]))
+    return processed, before, after
+
+
+def image_srcset(image):
+    """srcset attribute value for a static-relative image path ("" when no derivatives exist)."""
+    if not image:
+        return ""
+    variants = _load_variants().get(image)
+    if not variants:
+        return ""
+    return ", ".join(f"{url_for('static', filename=v['path'])} {v['width']}w" for v in variants)
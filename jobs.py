@@ -0,0 +1,439 @@
+"""
+Background analysis jobs for /upload/analyze.
+
+Uploaded PDFs are spooled to disk and recorded in the `jobs` table of cmat.db,
+then processed by a small local thread pool. Each job moves through STAGES and
+its row is updated as it goes, so /api/jobs/<id> can report progress and the
+final raw/graphs payload.
+
+A running job records its owner (host:pid:token) and the owning process
+refreshes its updated_at every JOB_HEARTBEAT_SECONDS. start() is a server-start
+hook (see app.start_background_services): it re-queues only running jobs whose
+owner process is gone or whose heartbeat is older than JOB_STALE_SECONDS, then
+schedules everything queued. Importing this module or app.py (e.g. for a
+`flask` CLI command) never touches jobs other processes are running.
+
+Submissions are admission-controlled: at most JOB_MAX_PENDING jobs may be
+queued or running overall and JOB_MAX_PER_USER per user; beyond that
+submit_analysis() raises admission.Rejected (503 / 429 with Retry-After).
+Workers take the oldest queued job of the user with the fewest running jobs,
+so one user's batch of uploads cannot hold back everyone else's.
+
+Under the ASGI entry point (asgi.py) attach_loop() moves scheduling onto the
+event loop: run_job_async() does the file and database steps in a worker
+thread and awaits the model call, so up to JOB_ASYNC_WORKERS jobs can wait on
+the provider without holding a thread each.
+"""
+import asyncio
+import json
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import admission
+import backend
+
+JOB_SPOOL_DIR = os.getenv("CMAT_JOB_SPOOL_DIR", os.path.join("uploads", "jobs"))
+JOB_WORKERS = int(os.getenv("CMAT_JOB_WORKERS", "2"))
+JOB_ASYNC_WORKERS = int(os.getenv("CMAT_JOB_ASYNC_WORKERS", "16"))  # concurrent jobs on the event loop
+JOB_MAX_PENDING = int(os.getenv("CMAT_JOB_MAX_PENDING", "20"))
+JOB_MAX_PER_USER = int(os.getenv("CMAT_JOB_MAX_PER_USER", "2"))
+JOB_HEARTBEAT_SECONDS = float(os.getenv("CMAT_JOB_HEARTBEAT_SECONDS", "30"))
+JOB_STALE_SECONDS = float(os.getenv("CMAT_JOB_STALE_SECONDS", "300"))  # several missed heartbeats
+
+HOSTNAME = socket.gethostname()
+
+STAGES = ("queued", "extracting", "calling model", "building graphs", "saving", "done")
+
+_executor = None
+_executor_lock = threading.Lock()
+_loop = None  # set by attach_loop() when jobs run on an asyncio event loop
+_async_slots = None
+_heartbeat = None
+_heartbeat_lock = threading.Lock()
+
+
+_instance = (None, None)  # (pid, random token) identifying this process run
+
+
+def _owner():
+    """
+    Owner tag for jobs claimed by this process: host:pid:token. The token tells a
+    restarted server apart from its predecessor when the pid is reused (e.g. pid 1
+    in a container); it is regenerated after a fork so workers get their own.
+    """
+    global _instance
+    if _instance[0] != os.getpid():
+        _instance = (os.getpid(), uuid.uuid4().hex[:8])
+    return f"{HOSTNAME}:{_instance[0]}:{_instance[1]}"
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="cmat-job")
+        return _executor
+
+
+def _workers():
+    return JOB_ASYNC_WORKERS if _loop is not None else JOB_WORKERS
+
+
+def attach_loop(loop):
+    """Run newly scheduled jobs on loop (None goes back to the thread pool). Call from inside the loop."""
+    global _loop, _async_slots
+    _async_slots = asyncio.Semaphore(JOB_ASYNC_WORKERS) if loop is not None else None
+    _loop = loop
+
+
+def _schedule():
+    """Queue one run of the next job, on the event loop if one is attached."""
+    if _loop is not None:
+        asyncio.run_coroutine_threadsafe(run_next_job_async(), _loop)
+    else:
+        _get_executor().submit(run_next_job)
+
+
+def _spool_path(job_id):
+    return os.path.join(JOB_SPOOL_DIR, f"{job_id}.pdf")
+
+
+@backend.timed_queries
+def _set_stage(job_id, stage):
+    progress = int(100 * STAGES.index(stage) / (len(STAGES) - 1))
+    with backend.transaction() as c:
+        c.execute("UPDATE jobs SET stage=?, progress=?, updated_at=? WHERE id=? AND owner=?",
+                  (stage, progress, time.time(), job_id, _owner()))
+
+
+@backend.timed_queries
+def _pending_counts(username):
+    total, mine = backend.get_conn().execute(
+        "SELECT COUNT(*), COALESCE(SUM(username = ?), 0) FROM jobs WHERE status IN ('queued', 'running')",
+        (username,)
+    ).fetchone()
+    return total, mine
+
+
+@backend.timed_queries
+def _retry_after(pending):
+    """Seconds until a worker is likely free, from the duration of recent finished jobs."""
+    avg = backend.get_conn().execute("""
+        SELECT AVG(updated_at - created_at) FROM (
+            SELECT created_at, updated_at FROM jobs WHERE status IN ('done', 'failed')
+            ORDER BY updated_at DESC LIMIT 20
+        )
+    """).fetchone()[0]
+    return max(1, math.ceil((avg or 30) * (pending + 1) / _workers()))
+
+
+def admit(username):
+    """
+    Raise admission.Rejected if username may not queue another analysis right now.
+    Only advisory outside backend.transaction(immediate=True): submit_analysis() re-checks
+    under the write lock so concurrent uploads cannot both slip under the quota.
+    """
+    total, mine = _pending_counts(username)
+    if mine >= JOB_MAX_PER_USER:
+        raise admission.Rejected(
+            f"You already have {mine} analyses in progress; wait for one to finish", 429, _retry_after(mine)
+        )
+    if total >= JOB_MAX_PENDING:
+        raise admission.Rejected("The analysis queue is full, please retry shortly", 503, _retry_after(total))
+
+
+@backend.timed_queries
+def submit_analysis(username, uploaded_file):
+    """
+    Spool an uploaded PDF to disk, record a queued job and schedule it. Returns the job id.
+    Raises admission.Rejected when the queue or user quota is full; a request that is plainly
+    over quota is turned away before the upload is saved, a racing one after (and its file removed).
+    """
+    admit(username)
+    job_id = uuid.uuid4().hex
+    path = _spool_path(job_id)
+    os.makedirs(JOB_SPOOL_DIR, exist_ok=True)
+    uploaded_file.save(path)
+
+    now = time.time()
+    try:
+        with backend.transaction(immediate=True) as c:
+            admit(username)
+            c.execute("""
+                INSERT INTO jobs (id, username, filename, status, stage, progress, created_at, updated_at)
+                VALUES (?, ?, ?, 'queued', 'queued', 0, ?, ?)
+            """, (job_id, username, uploaded_file.filename, now, now))
+    except admission.Rejected:
+        os.remove(path)
+        raise
+
+    _schedule()
+    return job_id
+
+
+@backend.timed_queries
+def get_job(job_id):
+    row = backend.get_conn().execute("""
+        SELECT id, username, filename, status, stage, progress, result, error, created_at, updated_at
+        FROM jobs WHERE id=?
+    """, (job_id,)).fetchone()
+    if not row:
+        return None
+    return {
+        "id": row[0],
+        "username": row[1],
+        "filename": row[2],
+        "status": row[3],
+        "stage": row[4],
+        "progress": row[5],
+        "result": json.loads(row[6]) if row[6] else None,
+        "error": row[7],
+        "created_at": row[8],
+        "updated_at": row[9]
+    }
+
+
+@backend.timed_queries
+def _next_queued():
+    """Id of the next job in fair order: the oldest queued job of the user with the fewest running jobs."""
+    row = backend.get_conn().execute("""
+        SELECT id FROM jobs AS q WHERE status = 'queued'
+        ORDER BY (SELECT COUNT(*) FROM jobs AS r WHERE r.username = q.username AND r.status = 'running'),
+                 created_at
+        LIMIT 1
+    """).fetchone()
+    return row[0] if row else None
+
+
+def run_next_job():
+    """Run the next job in fair order. One is scheduled per submitted job, so every job runs."""
+    try:
+        while True:
+            job_id = _next_queued()
+            if job_id is None:
+                return
+            if run_job(job_id):
+                return
+            # another worker claimed it first; look again
+    finally:
+        backend.release_conn()
+
+
+async def run_next_job_async():
+    async with _async_slots:
+        while True:
+            job_id = await backend.run_blocking(_next_queued)
+            if job_id is None:
+                return
+            if await run_job_async(job_id):
+                return
+
+
+@backend.timed_queries
+def _beat():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        try:
+            with backend.transaction() as c:
+                c.execute("UPDATE jobs SET updated_at=? WHERE owner=? AND status='running'",
+                          (time.time(), _owner()))
+        except Exception as e:
+            print("⚠️ Job heartbeat failed:", e)
+        finally:
+            backend.release_conn()
+
+
+def _ensure_heartbeat():
+    """Start this process's heartbeat thread (once per pid, so forked workers start their own)."""
+    global _heartbeat
+    with _heartbeat_lock:
+        if _heartbeat is None or _heartbeat[0] != os.getpid():
+            thread = threading.Thread(target=_beat, name="cmat-job-heartbeat", daemon=True)
+            thread.start()
+            _heartbeat = (os.getpid(), thread)
+
+
+@backend.timed_queries
+def _claim(job_id):
+    """Mark a queued job running under this process; returns its username, or None if another worker got it first."""
+    _ensure_heartbeat()
+    with backend.transaction() as c:
+        claimed = c.execute(
+            "UPDATE jobs SET status='running', owner=?, updated_at=? WHERE id=? AND status='queued'",
+            (_owner(), time.time(), job_id)
+        ).rowcount
+    if not claimed:
+        return None
+    return backend.get_conn().execute("SELECT username FROM jobs WHERE id=?", (job_id,)).fetchone()[0]
+
+
+def _read_pages(job_id, path):
+    _set_stage(job_id, "extracting")
+    return backend.select_relevant_pdf_pages(path)
+
+
+@backend.timed_queries
+def _finish(job_id, username, data, prefilter):
+    _set_stage(job_id, "building graphs")
+    graph_data = backend.prepare_graph_data(data)
+
+    _set_stage(job_id, "saving")
+    if data:
+        backend.save_survey_data(username, data)
+
+    result = {"success": True, "raw": data, "graphs": graph_data, "prefilter": prefilter}
+    with backend.transaction() as c:
+        c.execute("""
+            UPDATE jobs SET status='done', stage='done', progress=100, result=?, updated_at=?
+            WHERE id=? AND owner=?
+        """, (json.dumps(result), time.time(), job_id, _owner()))
+
+
+@backend.timed_queries
+def _fail(job_id, error):
+    print(f"❌ Job {job_id} failed:", error)
+    with backend.transaction() as c:
+        c.execute("UPDATE jobs SET status='failed', error=?, updated_at=? WHERE id=? AND owner=?",
+                  (str(error), time.time(), job_id, _owner()))
+
+
+@backend.timed_queries
+def _discard_upload(job_id, path):
+    """Delete the spooled PDF, unless the job was re-queued and now belongs to another worker."""
+    row = backend.get_conn().execute("SELECT owner FROM jobs WHERE id=?", (job_id,)).fetchone()
+    if row and row[0] != _owner():
+        return
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def run_job(job_id):
+    """
+    Process one job end to end. Safe to call for a job another worker already claimed.
+    Returns True if this call claimed and ran the job.
+    """
+    try:
+        username = _claim(job_id)
+        if username is None:
+            return False
+
+        path = _spool_path(job_id)
+        try:
+            pages, prefilter = _read_pages(job_id, path)
+            _set_stage(job_id, "calling model")
+            data = backend.extract_budget_info_from_pages(pages)
+            _finish(job_id, username, data, prefilter)
+        except Exception as e:
+            _fail(job_id, e)
+        finally:
+            _discard_upload(job_id, path)
+        return True
+    finally:
+        backend.release_conn()
+
+
+async def run_job_async(job_id):
+    """run_job() on the event loop: PDF and database steps in a worker thread, the model call awaited."""
+    username = await backend.run_blocking(_claim, job_id)
+    if username is None:
+        return False
+
+    path = _spool_path(job_id)
+    try:
+        pages, prefilter = await backend.run_blocking(_read_pages, job_id, path)
+        await backend.run_blocking(_set_stage, job_id, "calling model")
+        data = await backend.extract_budget_info_from_pages_async(pages)
+        await backend.run_blocking(_finish, job_id, username, data, prefilter)
+    except Exception as e:
+        await backend.run_blocking(_fail, job_id, e)
+    finally:
+        await backend.run_blocking(_discard_upload, job_id, path)
+    return True
+
+
+def _owner_alive(owner):
+    """False only when owner is a process on this host that no longer exists."""
+    host, pid, _token = ((owner or "").split(":") + ["", ""])[:3]
+    if host != HOSTNAME or not pid.isdigit():
+        return True  # another machine (or no owner): only the heartbeat can tell
+    if int(pid) == os.getpid():
+        return owner == _owner()
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@backend.timed_queries
+def requeue_stale(now=None):
+    """
+    Put running jobs whose owner has died back in the queue. A job is stale when
+    its owner process on this host is gone, or its heartbeat is older than
+    JOB_STALE_SECONDS. Returns the number of jobs re-queued.
+    """
+    now = now or time.time()
+    running = backend.get_conn().execute(
+        "SELECT id, owner, updated_at FROM jobs WHERE status='running'"
+    ).fetchall()
+    requeued = 0
+    for job_id, owner, updated_at in running:
+        if _owner_alive(owner) and now - updated_at < JOB_STALE_SECONDS:
+            continue
+        with backend.transaction() as c:
+            # only if nobody claimed or heartbeated it since we looked
+            requeued += c.execute("""
+                UPDATE jobs SET status='queued', stage='queued', progress=0, owner=NULL, updated_at=?
+                WHERE id=? AND status='running' AND owner IS ? AND updated_at=?
+            """, (now, job_id, owner, updated_at)).rowcount
+    return requeued
+
+
+@backend.timed_queries
+def start():
+    """
+    Server-start hook: re-queue stale running jobs and hand queued ones to the
+    worker pool. Jobs still owned by a live process are left alone.
+    """
+    try:
+        requeue_stale()
+        pending = backend.get_conn().execute(
+            "SELECT id FROM jobs WHERE status='queued' ORDER BY created_at"
+        ).fetchall()
+
+        runnable = 0
+        for (job_id,) in pending:
+            if os.path.exists(_spool_path(job_id)):
+                runnable += 1
+            else:
+                with backend.transaction() as c:
+                    c.execute("UPDATE jobs SET status='failed', error=?, updated_at=? WHERE id=? AND status='queued'",
+                              ("Uploaded file missing after restart", time.time(), job_id))
+    finally:
+        backend.release_conn()
+    # workers pick jobs in fair order, so schedule one run per runnable job
+    for _ in range(runnable):
+        _schedule()
+    return len(pending)
+
+
+@backend.timed_queries
+def get_admission_stats():
+    conn = backend.get_conn()
+    counts = dict(conn.execute(
+        "SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') GROUP BY status"
+    ).fetchall())
+    return {
+        "queued": counts.get("queued", 0),
+        "running": counts.get("running", 0),
+        "workers": _workers(),
+        "max_pending": JOB_MAX_PENDING,
+        "per_user": JOB_MAX_PER_USER,
+    }
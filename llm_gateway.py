@@ -0,0 +1,948 @@
+"""
+Shared gateway for upstream LLM calls (OpenAI, DeepSeek).
+
+Both providers speak the OpenAI chat-completions protocol, so one code path
+serves them over pooled keep-alive requests.Sessions. Every provider has a
+circuit breaker and an EWMA of its response latency: calls go to the fastest
+healthy provider first, transient failures (429, 5xx, timeouts) are retried
+with jittered exponential backoff, and with LLM_HEDGE_AFTER set a request that
+has not answered in time is raced against the next provider. Identical calls
+already in flight are coalesced (SingleFlight) instead of sent again. Each
+provider spreads calls over all of its API keys (KeyPool), steering by the
+x-ratelimit-* headers and resting throttled keys. Base URLs come
+from the environment, so the whole path runs against local stand-in servers
+(see benchmarks/mock_llm.py).
+
+achat_completion() and astream_chat() are the asyncio counterparts used by
+the ASGI entry point (asgi.py): they share the providers' key pools, breakers
+and latency EWMAs, but talk to the API over httpx.AsyncClient, so a call
+waiting on the model holds no thread.
+
+Per-attempt latency, token usage and estimated spend (MODEL_PRICES) are
+exported through metrics.py.
+"""
+import asyncio
+import copy
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+try:
+    import httpx
+except ImportError:  # only the async path (asgi.py) needs it
+    httpx = None
+
+OPENAI_MODEL = "gpt-4o-mini"
+DEEPSEEK_MODEL = "deepseek-chat"
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
+
+LLM_TIMEOUT = float(os.getenv("CMAT_LLM_TIMEOUT", "30"))  # seconds per attempt
+LLM_RETRIES = int(os.getenv("CMAT_LLM_RETRIES", "2"))  # extra attempts per provider
+LLM_BACKOFF_BASE = 0.5
+LLM_BACKOFF_MAX = 8.0
+LLM_HEDGE_AFTER = float(os.getenv("CMAT_LLM_HEDGE_AFTER", "0"))  # seconds; 0 disables hedging
+LLM_POOL_SIZE = int(os.getenv("CMAT_LLM_POOL_SIZE", "32"))  # keep-alive connections per provider
+LLM_ASYNC_MAX_CONNECTIONS = int(os.getenv("CMAT_LLM_ASYNC_CONNECTIONS", "512"))  # per provider, async path
+EWMA_ALPHA = 0.2
+LLM_EXPLORE_RATE = 0.02  # share of calls sent to a random healthy provider to keep its EWMA fresh
+BREAKER_FAILURES = 5  # consecutive failures before a provider is skipped
+BREAKER_RESET = 30.0  # seconds before an open breaker lets a probe through
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+SINGLEFLIGHT_ENABLED = os.getenv("CMAT_LLM_SINGLEFLIGHT", "1") == "1"
+KEY_COOLDOWN = 20.0  # seconds a key rests after a 429 that carries no Retry-After/reset hint
+KEY_AUTH_COOLDOWN = 600.0  # seconds a key is parked after 401/403
+KEY_WAIT = 8.0  # seconds a call may wait for a usable key before failing with 429
+KEY_POLL = 0.05  # seconds between key checks for async callers waiting on the pool
+# USD per 1M (prompt, completion) tokens; CMAT_LLM_PRICES='{"model": [in, out]}' adds or overrides
+MODEL_PRICES = {"gpt-4o-mini": (0.15, 0.60), "deepseek-chat": (0.27, 1.10)}
+MODEL_PRICES.update({m: tuple(p) for m, p in json.loads(os.getenv("CMAT_LLM_PRICES") or "{}").items()})
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+LLM_REQUEST_SECONDS = metrics.histogram(
+    "cmat_llm_request_duration_seconds",
+    "Upstream chat-completions attempts: until the full reply, or the response headers for streams",
+    ("provider", "model", "kind", "status"))
+LLM_TOKENS = metrics.counter("cmat_llm_tokens_total", "Tokens reported by the provider",
+                             ("provider", "model", "type"))
+LLM_COST = metrics.counter("cmat_llm_cost_usd_total", "Estimated spend from reported usage and MODEL_PRICES",
+                           ("provider", "model"))
+
+
+class LLMError(Exception):
+    def __init__(self, message, status=None, retryable=False, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """closed -> open after BREAKER_FAILURES straight failures -> half_open (one probe) after BREAKER_RESET."""
+
+    def __init__(self, failures=BREAKER_FAILURES, reset_after=BREAKER_RESET):
+        self.max_failures = failures
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.probing or time.monotonic() - self.opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def available(self):
+        """Would a call be let through right now? (does not claim the half-open probe)"""
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def allow(self):
+        """
+        False if the call must not go ahead. A call that claims the half-open probe
+        gets "probe" (truthy) and must end in record_success, record_failure or release_probe.
+        """
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.probing:
+                self.probing = True
+                return "probe"
+            return False
+
+    def release_probe(self):
+        """The probe ended without a verdict (cancelled, unexpected error): let the next call probe."""
+        with self._lock:
+            self.probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures, self.opened_at, self.probing = 0, None, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.max_failures:
+                self.opened_at, self.probing = time.monotonic(), False
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key: the first caller runs fn(),
+    everyone who arrives while it is running waits and gets (a copy of) its
+    result or exception. Nothing is cached once the call finishes.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stats = {"leaders": 0, "shared": 0}
+        self._flights = {}
+        self._async_flights = {}  # key -> asyncio.Future of the leading coroutine
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        if not SINGLEFLIGHT_ENABLED:
+            return fn()
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            self.stats["leaders" if leader else "shared"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return copy.deepcopy(flight.result)  # callers may mutate what they get back
+
+        try:
+            flight.result = fn()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def do_async(self, key, fn):
+        """do() for coroutines: fn() returns an awaitable, waiters await the leader's future."""
+        if not SINGLEFLIGHT_ENABLED:
+            return await fn()
+        with self._lock:
+            future = self._async_flights.get(key)
+            leader = future is None
+            if leader:
+                future = self._async_flights[key] = asyncio.get_running_loop().create_future()
+            self.stats["leaders" if leader else "shared"] += 1
+
+        if not leader:
+            try:
+                return copy.deepcopy(await asyncio.shield(future))
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise  # this waiter was cancelled
+                return await fn()  # the leader's client went away; do the work here
+
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # retrieved: nobody may be waiting on it
+            raise
+        finally:
+            with self._lock:
+                del self._async_flights[key]
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats, in_flight=len(self._flights) + len(self._async_flights))
+        calls = stats["leaders"] + stats["shared"]
+        stats["shared_ratio"] = round(stats["shared"] / calls, 4) if calls else None
+        return stats
+
+
+def register_flight(flight):
+    """Include another module's SingleFlight in get_stats()."""
+    _flights.append(flight)
+    return flight
+
+
+def request_fingerprint(*parts):
+    """Stable hash of JSON-serialisable request parts (messages, temperature, ...)."""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def parse_duration(value):
+    """Seconds from a rate-limit reset header: "20ms", "1s", "6m0s", "1h2m3.5s" or a bare number."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        parts = _DURATION_RE.findall(value)
+        return sum(float(n) * _DURATION_UNITS[unit] for n, unit in parts) if parts else None
+
+
+def _parse_count(value):
+    """Non-negative integer from a rate-limit header; None when absent or malformed."""
+    try:
+        count = int(value)
+    except (TypeError, ValueError):
+        return None
+    return count if count >= 0 else None
+
+
+class ApiKey:
+    def __init__(self, key, label):
+        self.key = key
+        self.label = label
+        self.in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.limits = {}  # "requests"/"tokens" -> {"limit", "remaining", "reset_at"}
+        self.cooldown_until = 0.0
+
+    def _windows(self, now):
+        """Rate-limit windows as of now; one past its reset has rolled over to a full allowance."""
+        return [
+            {"limit": lim["limit"], "remaining": lim["limit"], "reset_at": None}
+            if lim["reset_at"] and now >= lim["reset_at"] else lim
+            for lim in self.limits.values()
+            if lim["limit"] or not (lim["reset_at"] and now >= lim["reset_at"])
+        ]
+
+    def headroom(self, now):
+        """Smallest share of a window still unspent, counting calls in flight (1.0 if unknown)."""
+        fractions = [(lim["remaining"] - self.in_flight) / lim["limit"] for lim in self._windows(now) if lim["limit"]]
+        return max(0.0, min(fractions, default=1.0))
+
+    def usable(self, now):
+        return self.cooldown_until <= now and all(
+            lim["remaining"] - self.in_flight > 0 for lim in self._windows(now)
+        )
+
+    def next_change(self, now):
+        """When a cooldown ends or an exhausted window resets (None if only a release can help)."""
+        times = [self.cooldown_until] if self.cooldown_until > now else []
+        times += [lim["reset_at"] for lim in self._windows(now) if lim["reset_at"] and lim["remaining"] - self.in_flight <= 0]
+        return min(times, default=None)
+
+
+class KeyPool:
+    """
+    Load-balances concurrent calls over a provider's API keys: each call takes
+    the key with the most rate-limit headroom (x-ratelimit-* headers minus calls
+    in flight). Keys that are exhausted until their window resets, throttled
+    (429) or rejected (401/403) sit out; when no key is usable a call waits up
+    to KEY_WAIT seconds for one instead of sending a request bound to fail.
+    """
+
+    def __init__(self, name, keys):
+        self.name = name
+        self.keys = [ApiKey(k, f"#{i + 1}") for i, k in enumerate(keys)]  # labels are public: no key material
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _best(self, now):
+        usable = [k for k in self.keys if k.usable(now)]
+        if not usable:
+            return None
+        return max(usable, key=lambda k: (k.headroom(now) / (1 + k.in_flight), -k.requests))
+
+    def _take(self, now):
+        """Claim the best usable key; otherwise (None, times at which a key may become usable)."""
+        best = self._best(now)
+        if best is not None:
+            best.in_flight += 1
+            best.requests += 1
+            return best, None
+        return None, [t for t in (k.next_change(now) for k in self.keys) if t is not None]
+
+    def _exhausted(self, changes, now):
+        return LLMError(f"{self.name}: all {len(self.keys)} API keys are rate limited", status=429,
+                        retryable=True, retry_after=max(0.0, min(changes, default=now) - now))
+
+    def acquire(self, wait=None):
+        wait = KEY_WAIT if wait is None else wait
+        with self._cond:
+            deadline = time.monotonic() + wait
+            while True:
+                now = time.monotonic()
+                best, changes = self._take(now)
+                if best is not None:
+                    return best
+                if now >= deadline:
+                    raise self._exhausted(changes, now)
+                self._cond.wait(min([deadline] + changes) - now)
+
+    async def acquire_async(self, wait=None):
+        """acquire() for the event loop: re-checks every KEY_POLL seconds instead of blocking."""
+        deadline = time.monotonic() + (KEY_WAIT if wait is None else wait)
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                best, changes = self._take(now)
+            if best is not None:
+                return best
+            if now >= deadline:
+                raise self._exhausted(changes, now)
+            await asyncio.sleep(min([deadline, now + KEY_POLL] + changes) - now)
+
+    def release(self, api_key, status=None, headers=None):
+        with self._cond:
+            now = time.monotonic()
+            api_key.in_flight -= 1
+            for kind in ("requests", "tokens"):
+                remaining = _parse_count((headers or {}).get(f"x-ratelimit-remaining-{kind}"))
+                if remaining is None:
+                    continue
+                reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+                api_key.limits[kind] = {
+                    "limit": _parse_count(headers.get(f"x-ratelimit-limit-{kind}")) or 0,
+                    "remaining": remaining,
+                    "reset_at": now + reset if reset is not None else None,
+                }
+            if status == 429:
+                api_key.throttled += 1
+                rest = parse_duration((headers or {}).get("Retry-After"))
+                if rest is None and api_key.next_change(now) is None:
+                    rest = KEY_COOLDOWN
+                api_key.cooldown_until = max(api_key.cooldown_until, now + (rest or 0))
+            elif status in (401, 403):
+                api_key.cooldown_until = now + KEY_AUTH_COOLDOWN
+                print(f"⚠️ {self.name}: API key {api_key.label} rejected ({status}), parked for {KEY_AUTH_COOLDOWN:.0f}s")
+            self._cond.notify_all()
+
+    def get_stats(self):
+        with self._cond:
+            now = time.monotonic()
+            total = sum(k.requests for k in self.keys) or 1
+            return [
+                {
+                    "key": k.label,
+                    "in_flight": k.in_flight,
+                    "requests": k.requests,
+                    "share": round(k.requests / total, 4),
+                    "throttled": k.throttled,
+                    "headroom": round(k.headroom(now), 4),
+                    "remaining_requests": k.limits.get("requests", {}).get("remaining"),
+                    "remaining_tokens": k.limits.get("tokens", {}).get("remaining"),
+                    "cooldown_seconds": round(max(0.0, (k.next_change(now) or now) - now), 2),
+                }
+                for k in self.keys
+            ]
+
+
+class Provider:
+    def __init__(self, name, base_url, keys, model):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.pool = KeyPool(name, [k for k in keys if k])
+        self.model = model
+        self.breaker = CircuitBreaker()
+        self.ewma_latency = None
+        self.stats = {"calls": 0, "failures": 0, "retries": 0, "hedges": 0}
+        self._lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._async_client = None
+        self._async_loop = None
+        self._async_slots = None
+
+    def bump(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def observe(self, latency):
+        with self._lock:
+            if self.ewma_latency is None:
+                self.ewma_latency = latency
+            else:
+                self.ewma_latency = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma_latency
+
+    def expected_latency(self):
+        return 0.0 if self.ewma_latency is None else self.ewma_latency  # untried providers get one call
+
+    def _headers(self, api_key):
+        return {"Authorization": f"Bearer {api_key.key}", "Content-Type": "application/json"}
+
+    def _http_error(self, status, body, headers):
+        retryable = status in RETRYABLE_STATUS or (status in (401, 403) and len(self.pool) > 1)
+        return LLMError(
+            f"{self.name}: HTTP {status}: {body}", status=status, retryable=retryable,
+            # a 429 cools that key down; another key in the pool may be usable right away
+            retry_after=None if status == 429 and len(self.pool) > 1 else parse_duration(headers.get("Retry-After")),
+        )
+
+    def _observe_request(self, kind, status, start):
+        LLM_REQUEST_SECONDS.observe(time.perf_counter() - start, provider=self.name, model=self.model,
+                                    kind=kind, status=str(status))
+
+    def record_usage(self, usage):
+        """Count the tokens a reply reports and what they cost at MODEL_PRICES."""
+        if not usage:
+            return
+        prompt, completion = usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0
+        LLM_TOKENS.inc(prompt, provider=self.name, model=self.model, type="prompt")
+        LLM_TOKENS.inc(completion, provider=self.name, model=self.model, type="completion")
+        price = MODEL_PRICES.get(self.model)
+        if price:
+            LLM_COST.inc((prompt * price[0] + completion * price[1]) / 1e6, provider=self.name, model=self.model)
+
+    def _post(self, payload, timeout, stream=False):
+        api_key = self.pool.acquire()
+        self.bump("calls")
+        kind, start = "stream" if stream else "completion", time.perf_counter()
+        try:
+            r = self.session.post(
+                f"{self.base_url}/chat/completions",
+                headers=self._headers(api_key), json=payload, timeout=timeout, stream=stream,
+            )
+        except requests.RequestException as e:
+            self.pool.release(api_key)
+            self._observe_request(kind, "error", start)
+            raise LLMError(f"{self.name}: {e.__class__.__name__}: {e}", retryable=True)
+        # streams release at the headers; the key's rate-limit state is known by then
+        self.pool.release(api_key, r.status_code, r.headers)
+        self._observe_request(kind, r.status_code, start)
+
+        if r.status_code < 400:
+            return r
+        body = r.text[:200]
+        r.close()
+        raise self._http_error(r.status_code, body, r.headers)
+
+    def async_client(self):
+        """httpx.AsyncClient for the running event loop (a client cannot move between loops)."""
+        loop = asyncio.get_running_loop()
+        if self._async_loop is not loop:
+            if httpx is None:
+                raise LLMError("httpx is required for async LLM calls")
+            self._async_client = httpx.AsyncClient(limits=httpx.Limits(
+                max_connections=LLM_ASYNC_MAX_CONNECTIONS, max_keepalive_connections=LLM_POOL_SIZE))
+            # httpx's pool does work per queued request on every connection event, so
+            # excess calls wait here (FIFO, O(1)) and never queue inside the client
+            self._async_slots = asyncio.Semaphore(LLM_ASYNC_MAX_CONNECTIONS)
+            self._async_loop = loop
+        return self._async_client
+
+    async def _apost(self, payload, timeout, stream=False):
+        """POST on the async client. A streamed response keeps its connection slot until aiter_deltas() ends."""
+        client = self.async_client()
+        slots = self._async_slots
+        await slots.acquire()
+        try:
+            api_key = await self.pool.acquire_async()
+        except BaseException:
+            slots.release()
+            raise
+        self.bump("calls")
+        request = client.build_request("POST", f"{self.base_url}/chat/completions",
+                                       headers=self._headers(api_key), json=payload, timeout=timeout)
+        kind, start = "stream" if stream else "completion", time.perf_counter()
+        try:
+            r = await client.send(request, stream=stream)
+        except httpx.HTTPError as e:
+            self.pool.release(api_key)
+            slots.release()
+            self._observe_request(kind, "error", start)
+            raise LLMError(f"{self.name}: {e.__class__.__name__}: {e}", retryable=True)
+        except BaseException:  # cancelled: the client went away
+            self.pool.release(api_key)
+            slots.release()
+            self._observe_request(kind, "cancelled", start)
+            raise
+        self.pool.release(api_key, r.status_code, r.headers)
+        self._observe_request(kind, r.status_code, start)
+
+        if r.status_code < 400:
+            if not stream:
+                slots.release()
+            return r
+        try:
+            await r.aread()
+            await r.aclose()
+        finally:
+            slots.release()
+        raise self._http_error(r.status_code, r.text[:200], r.headers)
+
+    def _result(self, data, latency):
+        self.record_usage(data.get("usage"))
+        choices = data.get("choices") or [{}]
+        return {
+            "content": (choices[0].get("message") or {}).get("content"),
+            "provider": self.name,
+            "model": data.get("model", self.model),
+            "usage": data.get("usage") or {},
+            "latency": latency,
+        }
+
+    def complete(self, messages, temperature, timeout):
+        payload = {"model": self.model, "messages": messages, "temperature": temperature}
+        start = time.monotonic()
+        try:
+            r = self._post(payload, timeout)
+            data = r.json()
+        except LLMError as e:
+            if e.status is None:  # timeouts/connection errors are a latency signal too
+                self.observe(time.monotonic() - start)
+            raise
+        except ValueError as e:
+            raise LLMError(f"{self.name}: invalid JSON response: {e}", retryable=True)
+        latency = time.monotonic() - start
+        self.observe(latency)
+        return self._result(data, latency)
+
+    async def acomplete(self, messages, temperature, timeout):
+        payload = {"model": self.model, "messages": messages, "temperature": temperature}
+        start = time.monotonic()
+        try:
+            r = await self._apost(payload, timeout)
+            data = r.json()
+        except LLMError as e:
+            if e.status is None:
+                self.observe(time.monotonic() - start)
+            raise
+        except ValueError as e:
+            raise LLMError(f"{self.name}: invalid JSON response: {e}", retryable=True)
+        latency = time.monotonic() - start
+        self.observe(latency)
+        return self._result(data, latency)
+
+    def open_stream(self, messages, temperature, timeout):
+        payload = {"model": self.model, "messages": messages, "temperature": temperature, "stream": True,
+                   "stream_options": {"include_usage": True}}
+        return self._post(payload, timeout, stream=True)
+
+    async def aopen_stream(self, messages, temperature, timeout):
+        payload = {"model": self.model, "messages": messages, "temperature": temperature, "stream": True,
+                   "stream_options": {"include_usage": True}}
+        return await self._apost(payload, timeout, stream=True)
+
+    @staticmethod
+    def _sse_data(line):
+        """Payload of an SSE "data:" line; None for blank separators and ": keep-alive" comments."""
+        return line[5:].strip() if line and line.startswith("data:") else None
+
+    def _delta(self, data):
+        """Text of one stream chunk; the closing chunk carries the usage instead (stream_options)."""
+        chunk = json.loads(data)
+        self.record_usage(chunk.get("usage"))
+        choices = chunk.get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content")
+
+    def iter_deltas(self, response):
+        """Text deltas from an SSE chat-completions stream."""
+        with response:
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    data = self._sse_data(line)
+                    if data is None:
+                        continue
+                    if data == "[DONE]":
+                        break
+                    delta = self._delta(data)
+                    if delta:
+                        yield delta
+            except (requests.RequestException, ValueError) as e:
+                raise LLMError(f"{self.name}: stream broken: {e}", retryable=False)
+
+    async def aiter_deltas(self, response):
+        try:
+            async for line in response.aiter_lines():
+                data = self._sse_data(line)
+                if data is None:
+                    continue
+                if data == "[DONE]":
+                    break
+                delta = self._delta(data)
+                if delta:
+                    yield delta
+        except (httpx.HTTPError, ValueError) as e:
+            raise LLMError(f"{self.name}: stream broken: {e}", retryable=False)
+        finally:
+            try:
+                await response.aclose()
+            finally:
+                self._async_slots.release()
+
+
+_providers = None
+_providers_lock = threading.Lock()
+_hedge_executor = None
+_completion_flight = SingleFlight("chat_completion")
+_flights = [_completion_flight]  # reported by get_stats(); see register_flight()
+
+
+def env_keys(prefix):
+    """PREFIX plus PREFIX_1, PREFIX_2, ... from the environment, in numeric order, de-duplicated."""
+    numbered = sorted(
+        (int(name[len(prefix) + 1:]), value) for name, value in os.environ.items()
+        if name.startswith(prefix + "_") and name[len(prefix) + 1:].isdigit()
+    )
+    keys = [os.getenv(prefix)] + [value for _, value in numbered]
+    return list(dict.fromkeys(k for k in keys if k))
+
+
+def get_providers():
+    """Configured providers in preference order (built on first use, after .env is loaded)."""
+    global _providers
+    with _providers_lock:
+        if _providers is None:
+            candidates = [
+                Provider("openai", os.getenv("OPENAI_BASE_URL", OPENAI_BASE_URL), env_keys("OPENAI_API_KEY"), OPENAI_MODEL),
+                Provider("deepseek", os.getenv("DEEPSEEK_BASE_URL", DEEPSEEK_BASE_URL), env_keys("DEEPSEEK_API_KEY"),
+                         DEEPSEEK_MODEL),
+            ]
+            _providers = [p for p in candidates if len(p.pool)]
+        return _providers
+
+
+def get_provider(name):
+    return next((p for p in get_providers() if p.name == name), None)
+
+
+def ranked_providers(exclude=()):
+    """Healthy providers, fastest (by EWMA latency) first; configured order breaks ties."""
+    providers = [p for p in get_providers() if p.name not in exclude and p.breaker.available()]
+    providers.sort(key=lambda p: p.expected_latency())
+    if len(providers) > 1 and random.random() < LLM_EXPLORE_RATE:
+        providers.insert(0, providers.pop(random.randrange(1, len(providers))))
+    return providers
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full-jitter exponential backoff, honouring (but capping) a server Retry-After."""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    return min(max(delay, retry_after or 0), LLM_BACKOFF_MAX)
+
+
+def _failed_attempt(provider, e, attempt):
+    """Breaker bookkeeping for a failed attempt; re-raises e when out of retries, else returns the backoff."""
+    if e.status == 429:
+        provider.breaker.record_success()  # throttled, not unhealthy: the key pool handles it
+    else:
+        provider.breaker.record_failure()
+    provider.bump("failures")
+    if not e.retryable or attempt == LLM_RETRIES:
+        raise e
+    provider.bump("retries")
+    return backoff_delay(attempt, e.retry_after)
+
+
+def _with_retries(provider, call):
+    """Run call() against one provider with breaker bookkeeping and jittered retries."""
+    for attempt in range(LLM_RETRIES + 1):
+        allowed = provider.breaker.allow()
+        if not allowed:
+            raise LLMError(f"{provider.name}: circuit open")
+        try:
+            result = call()
+        except LLMError as e:
+            time.sleep(_failed_attempt(provider, e, attempt))
+            continue
+        except BaseException:
+            if allowed == "probe":
+                provider.breaker.release_probe()
+            raise
+        provider.breaker.record_success()
+        return result
+
+
+def _complete_on(provider, messages, temperature, timeout):
+    return _with_retries(provider, lambda: provider.complete(messages, temperature, timeout))
+
+
+def _hedged(providers, messages, temperature, timeout, hedge_after):
+    global _hedge_executor
+    with _providers_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=LLM_POOL_SIZE, thread_name_prefix="llm-hedge")
+    remaining, errors = list(providers), []
+
+    def launch():
+        provider = remaining.pop(0)
+        return _hedge_executor.submit(_complete_on, provider, messages, temperature, timeout), provider
+
+    pending = {launch()[0]}
+    while pending:
+        done, pending = wait(pending, timeout=hedge_after if remaining else None, return_when=FIRST_COMPLETED)
+        if not done:
+            # the leader is slow: race the next provider against it (the loser still feeds its EWMA)
+            future, provider = launch()
+            provider.bump("hedges")
+            pending.add(future)
+            continue
+        for future in done:
+            try:
+                return future.result()
+            except LLMError as e:
+                errors.append(str(e))
+        if remaining and not pending:
+            pending = {launch()[0]}
+    raise LLMError("All LLM providers failed: " + "; ".join(errors))
+
+
+def chat_completion(messages, temperature=0, timeout=None, hedge_after=None, exclude=()):
+    """
+    One chat completion through the fastest healthy provider, failing over in order.
+    Identical concurrent requests share a single upstream call.
+    Returns {"content", "provider", "model", "usage", "latency"}; raises LLMError if all fail.
+    """
+    key = request_fingerprint(messages, temperature, sorted(exclude))
+    return _completion_flight.do(key, lambda: _chat_completion(messages, temperature, timeout, hedge_after, exclude))
+
+
+def _chat_completion(messages, temperature, timeout, hedge_after, exclude):
+    timeout = timeout or LLM_TIMEOUT
+    hedge_after = LLM_HEDGE_AFTER if hedge_after is None else hedge_after
+    providers = ranked_providers(exclude)
+    if not providers:
+        raise LLMError("No LLM provider available")
+    if hedge_after and len(providers) > 1:
+        return _hedged(providers, messages, temperature, timeout, hedge_after)
+
+    errors = []
+    for provider in providers:
+        try:
+            return _complete_on(provider, messages, temperature, timeout)
+        except LLMError as e:
+            print(f"⚠️ {provider.name} failed, trying next provider:", e)
+            errors.append(str(e))
+    raise LLMError("All LLM providers failed: " + "; ".join(errors))
+
+
+def stream_chat(messages, temperature=0.4, timeout=None):
+    """
+    Yield (provider, text delta) pairs as tokens arrive. Fails over to the next
+    provider only before the first token; a failure mid-reply is raised.
+    """
+    timeout = timeout or LLM_TIMEOUT
+    errors = []
+    for provider in ranked_providers():
+        try:
+            response = _with_retries(provider, lambda: provider.open_stream(messages, temperature, timeout))
+        except LLMError as e:
+            print(f"⚠️ {provider.name} stream failed, trying next provider:", e)
+            errors.append(str(e))
+            continue
+        try:
+            for delta in provider.iter_deltas(response):
+                yield provider.name, delta
+        except LLMError:
+            provider.breaker.record_failure()
+            provider.bump("failures")
+            raise
+        return
+    raise LLMError("All LLM providers failed: " + ("; ".join(errors) or "none available"))
+
+
+# ---- Async (asyncio) path ----
+
+async def _awith_retries(provider, call):
+    """_with_retries() for a coroutine factory: backoff sleeps on the event loop."""
+    for attempt in range(LLM_RETRIES + 1):
+        allowed = provider.breaker.allow()
+        if not allowed:
+            raise LLMError(f"{provider.name}: circuit open")
+        try:
+            result = await call()
+        except LLMError as e:
+            await asyncio.sleep(_failed_attempt(provider, e, attempt))
+            continue
+        except BaseException:  # includes cancellation (e.g. a hedge loser)
+            if allowed == "probe":
+                provider.breaker.release_probe()
+            raise
+        provider.breaker.record_success()
+        return result
+
+
+def _acomplete_on(provider, messages, temperature, timeout):
+    return _awith_retries(provider, lambda: provider.acomplete(messages, temperature, timeout))
+
+
+def _observe_task(task):
+    if not task.cancelled():
+        task.exception()  # a hedge loser's failure is already counted; don't log it as unretrieved
+
+
+async def _ahedged(providers, messages, temperature, timeout, hedge_after):
+    remaining, errors = list(providers), []
+
+    def launch():
+        provider = remaining.pop(0)
+        task = asyncio.ensure_future(_acomplete_on(provider, messages, temperature, timeout))
+        task.add_done_callback(_observe_task)
+        return task, provider
+
+    pending = {launch()[0]}
+    while pending:
+        done, pending = await asyncio.wait(pending, timeout=hedge_after if remaining else None,
+                                           return_when=asyncio.FIRST_COMPLETED)
+        if not done:
+            task, provider = launch()
+            provider.bump("hedges")
+            pending.add(task)
+            continue
+        for task in done:
+            try:
+                return task.result()
+            except LLMError as e:
+                errors.append(str(e))
+        if remaining and not pending:
+            pending = {launch()[0]}
+    raise LLMError("All LLM providers failed: " + "; ".join(errors))
+
+
+async def achat_completion(messages, temperature=0, timeout=None, hedge_after=None, exclude=()):
+    """chat_completion() for asyncio callers; no thread is held while the provider answers."""
+    key = request_fingerprint(messages, temperature, sorted(exclude))
+    return await _completion_flight.do_async(
+        key, lambda: _achat_completion(messages, temperature, timeout, hedge_after, exclude))
+
+
+async def _achat_completion(messages, temperature, timeout, hedge_after, exclude):
+    timeout = timeout or LLM_TIMEOUT
+    hedge_after = LLM_HEDGE_AFTER if hedge_after is None else hedge_after
+    providers = ranked_providers(exclude)
+    if not providers:
+        raise LLMError("No LLM provider available")
+    if hedge_after and len(providers) > 1:
+        return await _ahedged(providers, messages, temperature, timeout, hedge_after)
+
+    errors = []
+    for provider in providers:
+        try:
+            return await _acomplete_on(provider, messages, temperature, timeout)
+        except LLMError as e:
+            print(f"⚠️ {provider.name} failed, trying next provider:", e)
+            errors.append(str(e))
+    raise LLMError("All LLM providers failed: " + "; ".join(errors))
+
+
+async def astream_chat(messages, temperature=0.4, timeout=None):
+    """stream_chat() as an async generator of (provider, text delta) pairs."""
+    timeout = timeout or LLM_TIMEOUT
+    errors = []
+    for provider in ranked_providers():
+        try:
+            response = await _awith_retries(provider, lambda: provider.aopen_stream(messages, temperature, timeout))
+        except LLMError as e:
+            print(f"⚠️ {provider.name} stream failed, trying next provider:", e)
+            errors.append(str(e))
+            continue
+        deltas = provider.aiter_deltas(response)
+        try:
+            async for delta in deltas:
+                yield provider.name, delta
+        except LLMError:
+            provider.breaker.record_failure()
+            provider.bump("failures")
+            raise
+        finally:
+            await deltas.aclose()  # hands the connection back even if our caller stopped early
+        return
+    raise LLMError("All LLM providers failed: " + ("; ".join(errors) or "none available"))
+
+
+async def aclose():
+    """Close the async HTTP clients opened on the running loop (ASGI shutdown)."""
+    loop = asyncio.get_running_loop()
+    for provider in get_providers():
+        if provider._async_client is not None and provider._async_loop is loop:
+            await provider._async_client.aclose()
+            provider._async_client = provider._async_loop = provider._async_slots = None
+
+
+def get_stats():
+    """Per-provider breaker state, EWMA latency and call counters, plus coalescing counters."""
+    providers = [
+        {
+            "provider": p.name,
+            "model": p.model,
+            "state": p.breaker.state,
+            "ewma_latency": round(p.ewma_latency, 4) if p.ewma_latency is not None else None,
+            **p.stats,
+            "keys": p.pool.get_stats(),
+        }
+        for p in get_providers()
+    ]
+    return {"providers": providers, "singleflight": {f.name: f.get_stats() for f in _flights}}
@@ -0,0 +1,157 @@
+"""
+In-process metrics, rendered in the Prometheus text exposition format at /metrics.
+
+Modules declare what they measure next to the code that measures it:
+
+    REQUEST_SECONDS = metrics.histogram("cmat_http_request_duration_seconds", "...", ("method", "route"))
+    REQUEST_SECONDS.observe(elapsed, method="GET", route="/api/news")
+
+Counters and histograms live in memory, per process (scrape every worker, or
+run one). Numbers that other modules already keep -- cache hit counters,
+single-flight and admission stats -- are read at scrape time through
+register_collector() instead of being counted twice.
+"""
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# seconds; upstream LLM calls and PDF jobs need the long tail, SQLite the short one
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple([labels[n] for n in self.labels])
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, count=1, **labels):
+        """Record value; count > 1 records that many observations of it (e.g. a per-page average)."""
+        key = tuple([labels[n] for n in self.labels])
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[i] += count
+            series[-1] += value * count
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), series):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+_metrics = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    with _registry_lock:
+        if any(m.name == metric.name for m in _metrics):
+            raise ValueError(f"metric {metric.name} already registered")
+        _metrics.append(metric)
+    return metric
+
+
+def counter(name, help_text, labels=()):
+    return _register(Counter(name, help_text, labels))
+
+
+def histogram(name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, help_text, labels, buckets))
+
+
+def register_collector(fn):
+    """
+    fn() is called on every scrape and returns (name, kind, help, label_names, samples),
+    or a list of them, where samples is [(label values tuple, value), ...].
+    """
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    """All registered metrics and collector output as Prometheus text."""
+    lines = []
+    for metric in list(_metrics):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    for collect in list(_collectors):
+        try:
+            families = collect()
+        except Exception as e:  # a broken collector must not take the endpoint down
+            print("⚠️ Metrics collector failed:", e)
+            continue
+        if families and isinstance(families[0], str):
+            families = [families]
+        for name, kind, help_text, label_names, samples in families or []:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(f"{name}{_format_labels(label_names, key)} {_format_value(value)}"
+                         for key, value in samples if value is not None)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,108 @@
+"""
+Disk-backed, page-at-a-time PDF text extraction.
+
+Uploads are spooled to a temp file in fixed-size chunks and opened by PyMuPDF
+from disk, so the raw PDF bytes never sit in Python memory. iter_pages() yields
+one page's text at a time; extract_pages() returns the whole list, so its
+memory grows with the document's text (typically a few percent of the PDF's
+size), not with its images or fonts.
+
+Large documents can fan page ranges out to one long-lived process pool. Its
+workers come from forkserver (spawn where unavailable), never a bare fork of
+the serving process: that process runs Flask, job, asyncio and LLM hedge
+threads, and a lock held by any of them at fork time could deadlock the
+child. This module deliberately imports nothing from the app so pool workers
+start cheaply.
+"""
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF
+
+SPOOL_CHUNK_SIZE = 1024 * 1024
+PARALLEL_PAGE_THRESHOLD = int(os.getenv("CMAT_PDF_PARALLEL_PAGES", "200"))
+PDF_PAGE_WORKERS = int(os.getenv("CMAT_PDF_PAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def spool_to_tempfile(fileobj, directory=None):
+    """Copy a file-like object to a named temp file in 1 MB chunks. Caller removes it."""
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=directory)
+    with os.fdopen(fd, "wb") as out:
+        shutil.copyfileobj(fileobj, out, SPOOL_CHUNK_SIZE)
+    return path
+
+
+def page_count(path):
+    with fitz.open(path) as doc:
+        return doc.page_count
+
+
+def iter_pages(path, max_pages=None):
+    """Yield the text of each page in order, loading one page at a time."""
+    with fitz.open(path) as doc:
+        for page_num, page in enumerate(doc):
+            if max_pages and page_num >= max_pages:
+                break
+            yield page.get_text("text") or ""
+
+
+def extract_selected(path, indices):
+    """Text of just the given 0-based pages, in the order given."""
+    with fitz.open(path) as doc:
+        return [(doc[i].get_text("text") or "") for i in indices]
+
+
+def _extract_range(path, start, stop):
+    return extract_selected(path, range(start, stop))
+
+
+def _get_pool():
+    """The shared page-extraction pool, created on first use and kept for the life of the process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=PDF_PAGE_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _pool
+
+
+def extract_pages_parallel(path, max_pages=None, workers=None):
+    """
+    Extract pages on the shared process pool; each task opens the file and
+    handles a contiguous range. workers sets how many ranges to split into.
+    """
+    total = page_count(path)
+    if max_pages:
+        total = min(total, max_pages)
+    if not total:
+        return []
+    workers = max(1, min(workers or PDF_PAGE_WORKERS, total))
+    step = -(-total // workers)  # ceil division
+    ranges = [(start, min(start + step, total)) for start in range(0, total, step)]
+
+    pool = _get_pool()
+    futures = [pool.submit(_extract_range, path, start, stop) for start, stop in ranges]
+    pages = []
+    for future in futures:
+        pages.extend(future.result())
+    return pages
+
+
+def extract_pages(path, max_pages=None, parallel=None):
+    """
+    Extract every page's text from a PDF on disk into a list (use iter_pages()
+    to hold one page at a time). parallel=None picks the process pool only for
+    documents of at least PARALLEL_PAGE_THRESHOLD pages.
+    """
+    if parallel is None:
+        parallel = PDF_PAGE_WORKERS > 1 and page_count(path) >= PARALLEL_PAGE_THRESHOLD
+    if parallel:
+        return extract_pages_parallel(path, max_pages)
+    return list(iter_pages(path, max_pages))
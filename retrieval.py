@@ -0,0 +1,139 @@
+"""
+Passage retrieval over the docs/ library for grounding /api/chat.
+
+Pages already extracted into the doc_pages FTS table (doc_index.py) are split
+into overlapping word windows and embedded with TF-IDF. The fitted vectorizer
+and the sparse passage matrix are written to build/retrieval/ and loaded back
+with memory-mapped arrays, so startup is cheap and the matrix pages in lazily.
+The index is tagged with the doc_files content hashes and rebuilt when the
+library changes. retrieve() is a single sparse dot product: ~1 ms per query.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+
+import joblib
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import backend
+
+INDEX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "build", "retrieval")
+INDEX_PATH = os.path.join(INDEX_DIR, "index.joblib")
+CHUNK_WORDS = 180
+CHUNK_OVERLAP = 40
+TOP_K = int(os.getenv("CMAT_RETRIEVAL_TOP_K", "4"))
+MIN_SCORE = 0.08  # cosine similarity below this is noise, not context
+PRUNE_MIN_PASSAGES = 20  # below this, keep rare and common terms (document frequency says little)
+MAX_CONTEXT_TOKENS = int(os.getenv("CMAT_RETRIEVAL_CONTEXT_TOKENS", "1200"))
+
+_index = None  # {"signature", "vectorizer", "matrix", "passages"}
+_lock = threading.Lock()
+
+
+@backend.timed_queries
+def _library_signature():
+    """Hash of the indexed documents' content hashes; changes whenever docs/ does."""
+    rows = backend.get_conn().execute("SELECT path, sha256 FROM doc_files WHERE pages > 0 ORDER BY path").fetchall()
+    return hashlib.sha256(repr(rows).encode()).hexdigest()
+
+
+def chunk_text(text, words=CHUNK_WORDS, overlap=CHUNK_OVERLAP):
+    tokens = text.split()
+    step = words - overlap
+    return [" ".join(tokens[i:i + words]) for i in range(0, max(len(tokens) - overlap, 1), step)]
+
+
+@backend.timed_queries
+def build_index():
+    """Chunk every indexed page, fit TF-IDF and persist to INDEX_PATH. Returns the index."""
+    passages = []  # [doc, page, text]
+    for path, page, body in backend.get_conn().execute("SELECT path, page, body FROM doc_pages ORDER BY path, page"):
+        for chunk in chunk_text(body):
+            passages.append([path, page, chunk])
+
+    prune = len(passages) >= PRUNE_MIN_PASSAGES
+    vectorizer = TfidfVectorizer(stop_words="english", sublinear_tf=True, ngram_range=(1, 2),
+                                 min_df=2 if prune else 1, max_df=0.5 if prune else 1.0, dtype=np.float32)
+    index = {"signature": _library_signature(), "vectorizer": vectorizer, "passages": passages, "matrix": None}
+    if passages:
+        try:
+            index["matrix"] = vectorizer.fit_transform([p[2] for p in passages]).tocsr()
+        except ValueError as e:  # no usable terms (e.g. only stop words)
+            print("⚠️ Retrieval index is empty:", e)
+
+    # unique temp name: another process (CLI, second worker) may be building at the same time
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=INDEX_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            joblib.dump(index, f)
+        os.replace(tmp, INDEX_PATH)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return index
+
+
+def load_or_build():
+    """Load the persisted index (memory-mapped), rebuilding it if docs/ changed since it was built."""
+    global _index
+    signature = _library_signature()
+    index = None
+    if os.path.exists(INDEX_PATH):
+        try:
+            index = joblib.load(INDEX_PATH, mmap_mode="r")
+        except Exception as e:
+            print("⚠️ Could not load retrieval index, rebuilding:", e)
+    if index is None or index.get("signature") != signature:
+        index = build_index()
+        print(f"🔎 Retrieval index built: {len(index['passages'])} passages")
+    with _lock:
+        _index = index
+    return index
+
+
+def index_signature():
+    """Identifies the loaded index ("" before load); cached chat answers are tagged with it."""
+    index = _index
+    return index["signature"] if index else ""
+
+
+def retrieve(query, k=None):
+    """
+    Top-k passages for query: [{doc, page, text, score}], best first.
+    Returns [] until the index has been loaded, so chat never blocks on it.
+    """
+    index = _index
+    if index is None or index["matrix"] is None or not (query or "").strip():
+        return []
+    k = k or TOP_K
+    q = index["vectorizer"].transform([query])
+    if not q.nnz:
+        return []
+    scores = (index["matrix"] @ q.T).toarray().ravel()
+    top = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+    top = top[np.argsort(-scores[top])]
+    return [
+        {"doc": index["passages"][i][0], "page": index["passages"][i][1],
+         "text": index["passages"][i][2], "score": float(scores[i])}
+        for i in top if scores[i] >= MIN_SCORE
+    ]
+
+
+def build_context(passages, max_tokens=None):
+    """
+    Numbered source excerpts for the system prompt, capped at max_tokens (estimated).
+    Returns (context text, the passages that fit).
+    """
+    max_tokens = max_tokens or MAX_CONTEXT_TOKENS
+    blocks, used = [], 0
+    for n, p in enumerate(passages, 1):
+        block = f"[{n}] {p['doc']}, page {p['page']}:\n{p['text']}"
+        cost = backend.estimate_tokens(block)
+        if used + cost > max_tokens:
+            break
+        blocks.append(block)
+        used += cost
+    return "\n\n".join(blocks), passages[:len(blocks)]
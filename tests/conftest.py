@@ -0,0 +1,36 @@
+"""
+Shared test setup. backend.py creates its SQLite schema on import, so point it
+at a throwaway database before any test module imports the app. LLM tests talk
+to benchmarks/mock_llm.py servers from the mock_llm_server fixture.
+
+    python -m pytest -q
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+os.environ.setdefault("OPENAI_API_KEY_1", "test")
+os.environ["CMAT_DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="cmat-test-"), "cmat.db")
+
+
+@pytest.fixture
+def mock_llm_server():
+    """Factory for local chat-completions servers (mock_llm.start options), shut down after the test."""
+    import mock_llm
+
+    servers = []
+
+    def start(**options):
+        server = mock_llm.start(**options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
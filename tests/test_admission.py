@@ -0,0 +1,128 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import admission
+import llm_gateway
+
+MESSAGES = [{"role": "user", "content": "What is the mitigation budget?"}]
+
+
+def controller(**limits):
+    options = {"max_concurrent": 1, "max_queue": 10, "queue_timeout": 5.0, "per_user": 3}
+    options.update(limits)
+    return admission.AdmissionController("test", **options)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+def test_freed_slots_go_round_robin_by_user():
+    gate = controller()
+    held = gate.acquire("alice")
+    granted, tickets = [], {}
+
+    def waiter(name, user):
+        tickets[name] = gate.acquire(user)
+        granted.append(name)
+
+    threads = []
+    for name, user in [("alice-2", "alice"), ("alice-3", "alice"), ("bob-1", "bob")]:
+        queued = gate.get_stats()["queued_now"]
+        threads.append(threading.Thread(target=waiter, args=(name, user)))
+        threads[-1].start()
+        wait_until(lambda: gate.get_stats()["queued_now"] == queued + 1)
+
+    # alice queued first, but bob is served before alice's second waiter
+    gate.release(held)
+    for expected in ("alice-2", "bob-1", "alice-3"):
+        wait_until(lambda: expected in granted)
+        assert granted[-1] == expected and gate.get_stats()["active"] == 1
+        gate.release(tickets[expected])
+    for t in threads:
+        t.join(5)
+    assert gate.get_stats()["active"] == 0 and gate.get_stats()["queued_now"] == 0
+
+
+def test_queue_wait_times_out_with_503():
+    gate = controller(queue_timeout=0.05)
+    held = gate.acquire("alice")
+    with pytest.raises(admission.Rejected) as rejected:
+        gate.acquire("bob")
+    assert rejected.value.status == 503 and rejected.value.retry_after >= 1
+    stats = gate.get_stats()
+    assert stats["timed_out"] == 1 and stats["queued_now"] == 0 and stats["users_waiting"] == 0
+
+    gate.release(held)
+    gate.release(gate.acquire("bob"))  # the timed-out waiter left no trace behind
+    assert gate.get_stats()["active"] == 0
+
+
+def test_per_user_quota_and_full_queue_fail_fast():
+    gate = controller(max_queue=1, per_user=1)
+    held = gate.acquire("alice")
+    with pytest.raises(admission.Rejected) as rejected:
+        gate.acquire("alice")
+    assert rejected.value.status == 429
+
+    waiter = threading.Thread(target=lambda: gate.release(gate.acquire("bob")))
+    waiter.start()
+    wait_until(lambda: gate.get_stats()["queued_now"] == 1)
+    with pytest.raises(admission.Rejected) as rejected:
+        gate.acquire("carol")
+    assert rejected.value.status == 503
+    gate.release(held)
+    waiter.join(5)
+    assert gate.get_stats()["rejected_user"] == 1 and gate.get_stats()["rejected_full"] == 1
+
+
+def test_async_waiters_time_out_and_cancel_cleanly():
+    gate = controller(queue_timeout=0.05)
+
+    async def scenario():
+        held = await gate.acquire_async("alice")
+        with pytest.raises(admission.Rejected):
+            await gate.acquire_async("bob")
+        task = asyncio.ensure_future(gate.acquire_async("carol"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        gate.release(held)
+
+    asyncio.run(scenario())
+    stats = gate.get_stats()
+    assert stats["active"] == 0 and stats["queued_now"] == 0 and stats["users_waiting"] == 0
+
+
+def test_upstream_concurrency_stays_within_the_limit(mock_llm_server):
+    server = mock_llm_server(latency=0.05)
+    provider = llm_gateway.Provider("openai", server.base_url, ["sk-test-aaaa"], llm_gateway.OPENAI_MODEL)
+    gate = controller(max_concurrent=2, max_queue=20, per_user=5)
+    in_flight, peak, lock = [0], [0], threading.Lock()
+
+    def call(user):
+        ticket = gate.acquire(user)
+        try:
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            provider.complete(MESSAGES, 0, 5)
+            with lock:
+                in_flight[0] -= 1
+        finally:
+            gate.release(ticket)
+
+    threads = [threading.Thread(target=call, args=(f"user-{i % 4}",)) for i in range(12)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert server.requests == 12 and peak[0] == 2
+    assert gate.get_stats()["admitted"] == 12
@@ -0,0 +1,112 @@
+import asyncio
+import json
+
+import pytest
+
+import asgi
+import backend
+import llm_gateway
+import mock_llm
+import retrieval
+
+
+@pytest.fixture
+def provider(mock_llm_server, monkeypatch):
+    def start(**options):
+        server = mock_llm_server(**options)
+        provider = llm_gateway.Provider("openai", server.base_url, ["sk-test-aaaa"], llm_gateway.OPENAI_MODEL)
+        monkeypatch.setattr(llm_gateway, "_providers", [provider])
+        return server
+
+    monkeypatch.setattr(llm_gateway, "LLM_RETRIES", 0)
+    monkeypatch.setattr(retrieval, "_index", None)  # no grounding passages: sources are []
+    with backend.transaction() as c:
+        c.execute("DELETE FROM chat_cache")
+    return start
+
+
+def post_chat(body, accept=b"application/json", disconnect_after=None):
+    """Drive asgi.app like a server would; disconnect_after hangs up after that many token events."""
+    sent, tokens = [], 0
+
+    async def run():
+        hung_up = asyncio.Event()
+        requested = False
+
+        async def receive():
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}
+            await hung_up.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal tokens
+            sent.append(message)
+            tokens += message.get("body", b"").count(b"event: token")
+            if disconnect_after and tokens >= disconnect_after:
+                hung_up.set()
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+            "path": "/api/chat", "raw_path": b"/api/chat", "query_string": b"", "root_path": "",
+            "headers": [(b"host", b"testserver"), (b"content-type", b"application/json"), (b"accept", accept)],
+            "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+        }
+        try:
+            await asgi.app(scope, receive, send)
+        finally:
+            await llm_gateway.aclose()
+
+    asyncio.run(run())
+    return sent[0], b"".join(m.get("body", b"") for m in sent[1:])
+
+
+def sse_events(body):
+    events = []
+    for frame in body.decode().split("\n\n"):
+        if frame:
+            name, data = frame.split("\n")
+            events.append((name[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_stream_relays_tokens_then_serves_the_cached_reply(provider):
+    provider(latency=0.05)
+    start, body = post_chat({"message": "What is the adaptation budget?", "stream": True})
+    assert start["status"] == 200
+    assert (b"content-type", b"text/event-stream; charset=utf-8") in start["headers"]
+
+    events = sse_events(body)
+    assert events[0] == ("sources", [])
+    assert [name for name, _ in events[1:-1]] == ["token"] * mock_llm.STREAM_TOKENS
+    assert events[-1] == ("done", {"provider": "openai"})
+    reply = "".join(data["text"] for name, data in events if name == "token")
+
+    _, body = post_chat({"message": "What is the adaptation budget?"}, accept=b"text/event-stream")
+    assert sse_events(body) == [("sources", []), ("token", {"text": reply}), ("done", {"provider": "cache"})]
+
+
+def test_json_reply(provider):
+    server = provider(latency=0.01)
+    start, body = post_chat({"message": "Which sectors get the most funding?"})
+    assert start["status"] == 200
+    assert json.loads(body) == {"reply": "mock reply", "sources": []}
+    assert server.requests == 1
+
+
+def test_client_hanging_up_stops_the_stream(provider):
+    provider(latency=1.0)
+    _, body = post_chat({"message": "Summarise the energy plan", "stream": True}, disconnect_after=2)
+
+    names = [name for name, _ in sse_events(body)]
+    assert "done" not in names and names.count("token") < mock_llm.STREAM_TOKENS
+    assert asgi.chat_admission.get_stats()["active"] == 0
+    assert backend.chat_cache_get("Summarise the energy plan") is None  # partial replies are not cached
+
+
+def test_provider_failure_ends_the_stream_with_an_error_event(provider):
+    provider(latency=0.01, fail_rate=1.0, fail_status=503)
+    _, body = post_chat({"message": "Any news on water projects?", "stream": True})
+    assert sse_events(body) == [("sources", []), ("error", {"error": "Both OpenAI and DeepSeek failed"})]
@@ -0,0 +1,55 @@
+import gzip
+import os
+
+import pytest
+
+import app as cmat
+import assets
+
+CSS = "body { color: #123456; }\n" * 200
+
+
+@pytest.fixture
+def built(tmp_path, monkeypatch):
+    static = tmp_path / "static"
+    static.mkdir()
+    (static / "site.css").write_text(CSS)
+    build_dir = tmp_path / "build"
+    monkeypatch.setattr(assets, "ASSET_ROOTS", {"static": str(static)})
+    monkeypatch.setattr(assets, "BUILD_DIR", str(build_dir))
+    monkeypatch.setattr(assets, "MANIFEST_PATH", str(build_dir / "manifest.json"))
+    monkeypatch.setattr(assets, "_manifest", None)
+    monkeypatch.setattr(assets, "_lazy_hashes", {})
+    assets.build()
+    return static / "site.css"
+
+
+def static_url():
+    with cmat.app.test_request_context():
+        return cmat.url_for("static", filename="site.css")
+
+
+def test_built_asset_is_precompressed_and_immutable(built):
+    url = static_url()
+    response = cmat.app.test_client().get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data).decode() == CSS
+    assert "immutable" in response.headers["Cache-Control"]
+
+
+def test_file_changed_after_build_gets_new_hash_and_no_stale_copy(built):
+    old_url = static_url()
+    with open(built, "a") as f:
+        f.write("p { margin: 0; }\n")
+    stat = os.stat(built)
+    os.utime(built, (stat.st_atime, stat.st_mtime + 5))
+
+    new_url = static_url()
+    assert new_url != old_url
+    response = cmat.app.test_client().get(new_url, headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+    assert response.data.decode().endswith("p { margin: 0; }\n")
+    assert "immutable" in response.headers["Cache-Control"]
+
+    stale = cmat.app.test_client().get(old_url, headers={"Accept-Encoding": "gzip"})
+    assert "immutable" not in stale.headers["Cache-Control"]
@@ -0,0 +1,88 @@
+import io
+import math
+
+import fitz
+import pytest
+
+import app as cmat
+import backend
+
+ROWS = [
+    ("Programme", None, ("2022", "2023", "2024")),
+    ("Agriculture Development", None, None),
+    ("Crop diversification", "1101", ("1,000", "1,500", "2,000")),
+    ("Irrigation schemes", "1102", ("(250)", "", "400")),
+    ("Water Resources", None, None),
+    ("Borehole drilling", "2101", ("300", "(-20)", "350")),
+]
+
+
+def budget_pdf(rows=ROWS):
+    doc = fitz.open()
+    page = doc.new_page()
+    for row, (label, code, figures) in enumerate(rows):
+        y = 72 + row * 20
+        page.insert_text((50, y), label, fontsize=10)
+        if code:
+            page.insert_text((230, y), code, fontsize=10)
+        for col, figure in enumerate(figures or ()):
+            if figure:
+                page.insert_text((300 + col * 80, y), figure, fontsize=10)
+    data = doc.tobytes()
+    doc.close()
+    return data
+
+
+def test_parse_amounts_handles_blanks_and_negatives():
+    parsed = backend._parse_amounts(["1,234", "", "(56)", "(-7)", "-8.5"])
+    assert parsed[0] == 1234.0 and math.isnan(parsed[1])
+    assert list(parsed[2:]) == [-56.0, -7.0, -8.5]
+
+
+def test_extract_budget_tables_reads_year_columns(tmp_path):
+    path = tmp_path / "budget.pdf"
+    path.write_bytes(budget_pdf())
+    table = backend.extract_budget_tables(str(path))
+
+    assert table["programme"] == ["Crop diversification", "Irrigation schemes", "Borehole drilling"]
+    assert table["code"] == ["1101", "1102", "2101"]
+    assert table["sector"] == ["Agriculture", "Agriculture", "Water"]
+    assert backend.budget_table_totals(table) == {
+        "Agriculture": {"2022": 750.0, "2023": 1500.0, "2024": 2400.0},
+        "Water": {"2022": 300.0, "2023": -20.0, "2024": 350.0},
+    }
+
+
+def test_sector_changes_only_on_whole_word_headings(tmp_path):
+    path = tmp_path / "budget.pdf"
+    path.write_bytes(budget_pdf([
+        ("Programme", None, ("2022", "2023", "2024")),
+        ("Agriculture Development", None, None),
+        ("Irrigation water supply", "1103", ("100", "200", "300")),
+        ("Transfers to farmer groups", "1104", ("10", "20", "30")),
+        ("Transport", None, None),
+        ("Feeder roads", "3101", ("500", "600", "700")),
+    ]))
+    table = backend.extract_budget_tables(str(path))
+
+    assert table["programme"] == ["Irrigation water supply", "Transfers to farmer groups", "Feeder roads"]
+    assert table["sector"] == ["Agriculture", "Agriculture", "Transport"]
+
+
+@pytest.fixture
+def client():
+    cmat.app.config["TESTING"] = True
+    with cmat.app.test_client() as client:
+        with client.session_transaction() as session:
+            session["user"] = "tester"
+        yield client
+
+
+def test_budget_tables_endpoint(client):
+    response = client.post("/api/budget/tables", data={"pdf": (io.BytesIO(budget_pdf()), "budget.pdf")})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["years"] == ["2022", "2023", "2024"]
+    assert body["items"][1] == {"page": 1, "sector": "Agriculture", "programme": "Irrigation schemes",
+                                "code": "1102", "2022": -250.0, "2023": None, "2024": 400.0}
+    assert body["totals"]["Water"]["2023"] == -20.0
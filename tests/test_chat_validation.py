@@ -0,0 +1,30 @@
+import asyncio
+import json
+
+import pytest
+
+import app as cmat
+import asgi
+
+
+@pytest.mark.parametrize("body", [{"message": 5}, {"message": ["hi"]}, {"message": ""}, ["hi"], "hi"])
+def test_flask_chat_rejects_non_string_message(body):
+    response = cmat.app.test_client().post("/api/chat", json=body)
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Message required"}
+
+
+@pytest.mark.parametrize("body", [{"message": 5}, {"message": {"text": "hi"}}, [1]])
+def test_asgi_chat_rejects_non_string_message(body):
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": "/api/chat", "headers": [], "query_string": b""}
+    asyncio.run(asgi.app(scope, receive, send))
+    assert sent[0]["status"] == 400
+    assert json.loads(sent[1]["body"]) == {"error": "Message required"}
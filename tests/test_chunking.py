@@ -0,0 +1,16 @@
+import backend
+
+
+def test_small_pages_share_a_chunk():
+    assert backend.chunk_pages(["page one", "page two"], max_tokens=100) == ["page one\npage two"]
+
+
+def test_long_single_line_is_split_not_truncated():
+    figures = " ".join(f"Programme {i} 1,{i:03d},000" for i in range(400))  # a table PyMuPDF gave as one line
+    chunks = backend.chunk_pages([figures], max_tokens=100)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 100 * backend.CHARS_PER_TOKEN for chunk in chunks)
+    assert "".join(chunks) == figures
+    # cuts fall on spaces, so no figure is split across two chunks
+    assert all(any(f"1,{i:03d},000" in chunk for chunk in chunks) for i in range(400))
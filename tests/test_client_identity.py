@@ -0,0 +1,21 @@
+import app as cmat
+
+FORWARDED = {"X-Forwarded-For": "6.6.6.6, 203.0.113.7, 10.0.0.2"}
+
+
+def identity(headers, remote_addr="127.0.0.1"):
+    with cmat.app.test_request_context(headers=headers, environ_base={"REMOTE_ADDR": remote_addr}):
+        return cmat.client_identity()
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies(monkeypatch):
+    monkeypatch.setattr(cmat, "PROXY_HOPS", 0)
+    assert identity(FORWARDED) == "127.0.0.1"
+
+
+def test_trusted_proxy_hops_pick_the_client_address(monkeypatch):
+    monkeypatch.setattr(cmat, "PROXY_HOPS", 1)
+    assert identity(FORWARDED) == "10.0.0.2"
+    monkeypatch.setattr(cmat, "PROXY_HOPS", 2)
+    assert identity(FORWARDED) == "203.0.113.7"  # the spoofed first entry is never used
+    assert identity({}) == "127.0.0.1"
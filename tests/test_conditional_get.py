@@ -0,0 +1,17 @@
+import app as cmat
+
+
+def test_page_etag_is_stable_and_revalidates():
+    client = cmat.app.test_client()
+    first = client.get("/")
+    assert first.status_code == 200 and first.headers["ETag"]
+    assert client.get("/").headers["ETag"] == first.headers["ETag"]
+    assert client.get("/", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+
+def test_api_etag_ignores_render_version(monkeypatch):
+    client = cmat.app.test_client()
+    api, page = client.get("/api/news").headers["ETag"], client.get("/").headers["ETag"]
+    monkeypatch.setattr(cmat, "RENDER_VERSION", "next-deploy")
+    assert client.get("/api/news").headers["ETag"] == api
+    assert client.get("/").headers["ETag"] != page
@@ -0,0 +1,78 @@
+import os
+
+import fitz
+import pytest
+
+import app as cmat
+import backend
+import doc_index
+
+
+def write_pdf(path, *pages):
+    doc = fitz.open()
+    for text in pages:
+        doc.new_page().insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=10)
+    doc.save(str(path))
+    doc.close()
+
+
+@pytest.fixture
+def library(tmp_path):
+    with backend.transaction() as c:
+        c.execute("DELETE FROM doc_pages")
+        c.execute("DELETE FROM doc_files")
+    write_pdf(tmp_path / "nap.pdf",
+              "National adaptation plan for drought resilience in the Southern Province.",
+              "Irrigation budget: smallholder farmers receive adaptation grants <2024>.")
+    write_pdf(tmp_path / "energy.pdf", "Solar mini-grids expand rural electricity access.")
+    (tmp_path / "notes.txt").write_text("adaptation notes, not a PDF")
+    return tmp_path
+
+
+def test_reindex_is_incremental(library):
+    first = doc_index.reindex_docs(str(library))
+    assert sorted(first["indexed"]) == ["energy.pdf", "nap.pdf"]
+    assert doc_index.reindex_docs(str(library))["unchanged"] == 2
+
+    os.utime(library / "energy.pdf", (1, 1))  # touched, same bytes: only the stat is refreshed
+    stats = doc_index.reindex_docs(str(library))
+    assert stats["indexed"] == [] and stats["unchanged"] == 2
+
+    write_pdf(library / "energy.pdf", "Wind farms along the escarpment.")
+    os.remove(library / "nap.pdf")
+    stats = doc_index.reindex_docs(str(library))
+    assert stats["indexed"] == ["energy.pdf"] and stats["removed"] == ["nap.pdf"]
+    assert [r["doc"] for r in doc_index.search_docs("wind")] == ["energy.pdf"]
+    assert doc_index.search_docs("drought") == []
+
+
+def test_unreadable_pdf_is_recorded_and_not_retried(library):
+    (library / "broken.pdf").write_bytes(b"not really a pdf")
+    assert doc_index.reindex_docs(str(library))["failed"] == ["broken.pdf"]
+    assert doc_index.reindex_docs(str(library))["failed"] == []
+
+
+def test_search_ranks_pages_with_stemming_and_snippets(library):
+    doc_index.reindex_docs(str(library))
+    (hit,) = doc_index.search_docs("adapting irrigation")
+    assert (hit["doc"], hit["page"]) == ("nap.pdf", 2)
+    assert "<mark>Irrigation</mark>" in hit["snippet"]
+    assert "&lt;2024&gt;" in hit["snippet"]
+    assert hit["score"] > 0
+
+
+def test_search_falls_back_to_any_term_and_ignores_fts_syntax(library):
+    doc_index.reindex_docs(str(library))
+    assert {r["doc"] for r in doc_index.search_docs("solar drought")} == {"nap.pdf", "energy.pdf"}
+    assert doc_index.search_docs('NEAR( "solar" OR*') != []
+    assert doc_index.search_docs("***") == []
+
+
+def test_search_endpoint(library):
+    doc_index.reindex_docs(str(library))
+    with cmat.app.test_client() as client:
+        assert client.get("/api/docs/search").status_code == 400
+        assert client.get("/api/docs/search?q=solar&limit=x").status_code == 400
+        body = client.get("/api/docs/search?q=solar").get_json()
+    assert body["query"] == "solar"
+    assert body["results"][0]["url"].endswith("/energy.pdf#page=1")
@@ -0,0 +1,99 @@
+import os
+
+import pytest
+from PIL import Image
+
+import app as cmat
+import backend
+import images
+
+
+@pytest.fixture
+def static(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, "STATIC_ROOT", str(tmp_path))
+    monkeypatch.setattr(images, "_variants", None)
+    with backend.transaction() as c:
+        c.execute("DELETE FROM image_variants")
+    (tmp_path / "images").mkdir()
+    return tmp_path
+
+
+def save(static, name, size, mode="RGB", **options):
+    Image.new(mode, size).save(static / "images" / name, **options)
+    return f"images/{name}"
+
+
+def test_variants_are_webp_at_each_width_without_upscaling(static):
+    image = save(static, "lake.jpg", (1000, 500))
+    variants = images.process_image(image)
+
+    assert [v["width"] for v in variants] == [320, 640, 1000]
+    for v in variants:
+        with Image.open(static / v["path"]) as out:
+            assert out.format == "WEBP"
+            assert out.size == (v["width"], v["width"] // 2)
+    assert backend.get_image_variants(image)["variants"] == variants
+
+
+def test_same_stem_different_extension_do_not_collide(static):
+    jpg = images.process_image(save(static, "photo.jpg", (400, 400)))
+    png = images.process_image(save(static, "photo.png", (400, 400)))
+    assert {v["path"] for v in jpg}.isdisjoint(v["path"] for v in png)
+
+
+def test_transparent_palette_image_keeps_alpha(static):
+    image = save(static, "logo.png", (200, 100), mode="P", transparency=0)
+    (variant, *_) = images.process_image(image)
+    with Image.open(static / variant["path"]) as out:
+        assert out.mode == "RGBA"
+
+
+def test_exif_rotation_is_applied(static):
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotated 90° clockwise
+    image = save(static, "portrait.jpg", (800, 400), exif=exif)
+    variants = images.process_image(image)
+    with Image.open(static / variants[-1]["path"]) as out:
+        assert out.size == (400, 800)
+
+
+def test_unchanged_image_is_not_reencoded(static, monkeypatch):
+    image = save(static, "field.jpg", (700, 300))
+    first = images.process_image(image)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("re-encoded an unchanged image")
+
+    monkeypatch.setattr(images.Image, "open", fail)
+    assert images.process_image(image) == first
+
+
+def test_changed_or_missing_derivative_is_rebuilt(static):
+    image = save(static, "river.jpg", (700, 300))
+    first = images.process_image(image)
+    os.remove(static / first[0]["path"])
+    assert images.process_image(image) == first
+    assert (static / first[0]["path"]).exists()
+
+    save(static, "river.jpg", (300, 300))
+    os.utime(static / "images" / "river.jpg", (1, 1))
+    assert [v["width"] for v in images.process_image(image)] == [300]
+
+
+def test_missing_source_and_srcset(static):
+    assert images.process_image("images/nope.jpg") == []
+    image = save(static, "dam.png", (700, 350))
+    images.process_image(image)
+    with cmat.app.test_request_context():
+        srcset = images.image_srcset(image)
+        assert images.image_srcset("images/nope.jpg") == ""
+    assert srcset == "/static/images/derived/dam-png-320.webp 320w, /static/images/derived/dam-png-640.webp 640w, " \
+                     "/static/images/derived/dam-png-700.webp 700w"
+
+
+def test_backfill_processes_each_source_image(static):
+    save(static, "a.jpg", (900, 600))
+    save(static, "b.png", (500, 500))
+    (static / "images" / "notes.txt").write_text("not an image")
+    processed, before, after = images.backfill()
+    assert processed == 2 and 0 < after < before
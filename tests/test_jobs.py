@@ -0,0 +1,64 @@
+import os
+import threading
+
+import pytest
+
+import admission
+import backend
+import jobs
+
+
+class Upload:
+    """Stand-in for werkzeug's FileStorage; save() waits so racing submissions overlap."""
+
+    def __init__(self, barrier=None):
+        self.filename = "budget.pdf"
+        self.barrier = barrier
+
+    def save(self, path):
+        if self.barrier:
+            self.barrier.wait(timeout=5)
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4\n")
+
+
+@pytest.fixture
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_SPOOL_DIR", str(tmp_path))
+    monkeypatch.setattr(jobs, "_schedule", lambda: None)
+    with backend.transaction() as c:
+        c.execute("DELETE FROM jobs")
+    return tmp_path
+
+
+def test_concurrent_submissions_cannot_exceed_user_quota(spool, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_PER_USER", 1)
+    barrier = threading.Barrier(2)
+    accepted, rejected = [], []
+
+    def submit():
+        try:
+            accepted.append(jobs.submit_analysis("alice", Upload(barrier)))
+        except admission.Rejected as e:
+            rejected.append(e)
+        finally:
+            backend.release_conn()
+
+    threads = [threading.Thread(target=submit) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(accepted) == 1
+    assert len(rejected) == 1 and rejected[0].status == 429
+    assert jobs._pending_counts("alice") == (1, 1)
+    assert os.listdir(spool) == [f"{accepted[0]}.pdf"]
+
+
+def test_over_quota_submission_is_rejected_before_saving(spool, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_PER_USER", 1)
+    jobs.submit_analysis("alice", Upload())
+    with pytest.raises(admission.Rejected):
+        jobs.submit_analysis("alice", Upload(threading.Barrier(2)))
+    assert len(os.listdir(spool)) == 1
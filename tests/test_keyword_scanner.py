@@ -0,0 +1,24 @@
+import backend
+
+
+def test_overlapping_keywords_are_all_found():
+    found = backend.extract_numbers_from_text("climate finance ministry 5", ["climate finance", "finance ministry"])
+    assert found == {"climate finance": 5.0, "finance ministry": 5.0}
+
+
+def test_nested_and_prefix_keywords_share_the_number():
+    text = "Total climate adaptation budget 1,200 and adaptation 30"
+    hits = [(o["keyword"], o["start"], o["value"]) for o in backend.scan_keyword_numbers(
+        text, ["climate", "adaptation", "climate adaptation", "budget"])]
+    assert hits == [
+        ("climate adaptation", 6, 1200.0),
+        ("climate", 6, 1200.0),
+        ("adaptation", 14, 1200.0),
+        ("budget", 25, 1200.0),
+        ("adaptation", 42, 30.0),
+    ]
+
+
+def test_pages_are_reported_one_based():
+    hits = backend.scan_keyword_numbers(["no figures here", "Mitigation 42"], ["mitigation"])
+    assert [(o["keyword"], o["page"], o["value"]) for o in hits] == [("mitigation", 2, 42.0)]
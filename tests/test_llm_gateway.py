@@ -0,0 +1,221 @@
+import asyncio
+import threading
+import time
+
+import pytest
+import requests
+
+import llm_gateway
+
+MESSAGES = [{"role": "user", "content": "What is the adaptation budget?"}]
+
+
+def provider_for(server, *keys):
+    return llm_gateway.Provider("openai", server.base_url, list(keys), llm_gateway.OPENAI_MODEL)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.005)
+
+
+# ---- SingleFlight ----
+def run_flight(flight, fn, waiters):
+    """Start a leader and `waiters` followers on one key; returns (threads, outcomes)."""
+    outcomes, lock = [], threading.Lock()
+
+    def call():
+        try:
+            result = flight.do("key", fn)
+        except Exception as e:
+            result = e
+        with lock:
+            outcomes.append(result)
+
+    threads = [threading.Thread(target=call) for _ in range(waiters + 1)]
+    for t in threads:
+        t.start()
+    return threads, outcomes
+
+
+def test_singleflight_shares_one_upstream_call(mock_llm_server):
+    server = mock_llm_server(latency=0.01)
+    provider = provider_for(server, "sk-test-aaaa")
+    flight, release = llm_gateway.SingleFlight("test"), threading.Event()
+
+    def leader():
+        release.wait(5)
+        return provider.complete(MESSAGES, 0, 5)
+
+    threads, outcomes = run_flight(flight, leader, waiters=7)
+    wait_until(lambda: flight.get_stats()["shared"] == 7)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert server.requests == 1
+    assert [o["content"] for o in outcomes] == ["mock reply"] * 8
+    assert len({id(o) for o in outcomes}) == 8  # waiters get copies, not the leader's dict
+    assert flight.get_stats()["in_flight"] == 0
+
+
+def test_singleflight_propagates_leader_error_to_waiters(mock_llm_server):
+    server = mock_llm_server(latency=0.01, fail_rate=1.0, fail_status=400)
+    provider = provider_for(server, "sk-test-aaaa")
+    flight, release = llm_gateway.SingleFlight("test"), threading.Event()
+
+    def leader():
+        release.wait(5)
+        return provider.complete(MESSAGES, 0, 5)
+
+    threads, outcomes = run_flight(flight, leader, waiters=3)
+    wait_until(lambda: flight.get_stats()["shared"] == 3)
+    release.set()
+    for t in threads:
+        t.join(5)
+
+    assert server.requests == 1
+    assert len(outcomes) == 4 and len({id(o) for o in outcomes}) == 1
+    assert isinstance(outcomes[0], llm_gateway.LLMError) and outcomes[0].status == 400
+
+    # nothing is cached: the next call goes upstream again
+    server.fail_rate = 0.0
+    assert flight.do("key", lambda: provider.complete(MESSAGES, 0, 5))["content"] == "mock reply"
+    assert server.requests == 2
+
+
+# ---- KeyPool ----
+def test_key_pool_rests_a_throttled_key_and_rotates(mock_llm_server):
+    server = mock_llm_server(latency=0.01, rate_limit=1)
+    provider = provider_for(server, "sk-test-aaaa", "sk-test-bbbb")
+    first, second = provider.pool.keys
+
+    # spend the first key's window behind the pool's back, so its next call gets a 429
+    requests.post(f"{server.base_url}/chat/completions", json={"messages": MESSAGES},
+                  headers={"Authorization": f"Bearer {first.key}"}, timeout=5)
+    with pytest.raises(llm_gateway.LLMError) as raised:
+        provider.complete(MESSAGES, 0, 5)
+    assert raised.value.status == 429 and raised.value.retryable
+    assert first.throttled == 1 and not first.usable(time.monotonic())
+
+    assert provider.complete(MESSAGES, 0, 5)["content"] == "mock reply"
+    assert (first.requests, second.requests) == (1, 1)
+    assert server.throttled == 1
+
+
+def test_key_pool_parks_rejected_keys(mock_llm_server):
+    server = mock_llm_server(latency=0.01, fail_rate=1.0, fail_status=401)
+    provider = provider_for(server, "sk-test-aaaa", "sk-test-bbbb")
+
+    for _ in provider.pool.keys:
+        with pytest.raises(llm_gateway.LLMError) as raised:
+            provider.complete(MESSAGES, 0, 5)
+        assert raised.value.status == 401 and raised.value.retryable  # another key may work
+    assert [k.requests for k in provider.pool.keys] == [1, 1]
+
+    # both parked: fail fast as rate limited instead of sending a doomed request
+    with pytest.raises(llm_gateway.LLMError) as raised:
+        provider.pool.acquire(wait=0)
+    assert raised.value.status == 429
+    assert raised.value.retry_after > llm_gateway.KEY_AUTH_COOLDOWN - 5
+    assert server.requests == 2
+
+
+def test_key_pool_skips_malformed_rate_limit_headers():
+    pool = llm_gateway.KeyPool("test", ["sk-test-aaaa"])
+    key = pool.acquire(wait=0)
+    pool.release(key, 200, {"x-ratelimit-remaining-requests": "lots", "x-ratelimit-limit-requests": "60",
+                            "x-ratelimit-remaining-tokens": "900", "x-ratelimit-limit-tokens": "1e3",
+                            "x-ratelimit-reset-tokens": "soon"})
+    assert key.in_flight == 0
+    assert key.limits == {"tokens": {"limit": 0, "remaining": 900, "reset_at": None}}
+    assert pool.acquire(wait=0) is key
+
+
+def test_key_stats_do_not_expose_key_material():
+    pool = llm_gateway.KeyPool("test", ["sk-test-aaaa", "sk-test-bbbb"])
+    assert [s["key"] for s in pool.get_stats()] == ["#1", "#2"]
+    assert "aaaa" not in repr(pool.get_stats())
+
+
+# ---- CircuitBreaker ----
+def test_breaker_half_open_lets_one_probe_through():
+    breaker = llm_gateway.CircuitBreaker(failures=2, reset_after=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.state == "half_open" and breaker.available()
+    assert breaker.allow()
+    assert not breaker.allow() and not breaker.available()  # the probe is in flight
+
+    breaker.record_failure()  # failed probe: open again for another reset period
+    assert breaker.state == "open"
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+
+
+def test_breaker_stops_calls_to_a_failing_provider(mock_llm_server, monkeypatch):
+    monkeypatch.setattr(llm_gateway, "LLM_RETRIES", 0)
+    server = mock_llm_server(latency=0.01, fail_rate=1.0, fail_status=503)
+    provider = provider_for(server, "sk-test-aaaa")
+    provider.breaker = llm_gateway.CircuitBreaker(failures=2, reset_after=0.1)
+
+    for _ in range(2):
+        with pytest.raises(llm_gateway.LLMError, match="HTTP 503"):
+            llm_gateway._complete_on(provider, MESSAGES, 0, 5)
+    with pytest.raises(llm_gateway.LLMError, match="circuit open"):
+        llm_gateway._complete_on(provider, MESSAGES, 0, 5)
+    assert server.requests == 2
+
+    server.fail_rate = 0.0
+    time.sleep(0.11)
+    assert llm_gateway._complete_on(provider, MESSAGES, 0, 5)["content"] == "mock reply"
+    assert provider.breaker.state == "closed" and server.requests == 3
+
+
+def half_open_breaker():
+    breaker = llm_gateway.CircuitBreaker(failures=1, reset_after=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_probe_ending_in_an_unexpected_error_is_released(mock_llm_server):
+    provider = provider_for(mock_llm_server(), "sk-test-aaaa")
+    provider.breaker = half_open_breaker()
+
+    def broken():
+        raise KeyError("choices")
+
+    with pytest.raises(KeyError):
+        llm_gateway._with_retries(provider, broken)
+    assert provider.breaker.available()
+    assert llm_gateway._complete_on(provider, MESSAGES, 0, 5)["content"] == "mock reply"
+    assert provider.breaker.state == "closed"
+
+
+def test_cancelled_probe_is_released(mock_llm_server):
+    server = mock_llm_server(latency=2.0)
+    provider = provider_for(server, "sk-test-aaaa")
+    provider.breaker = half_open_breaker()
+
+    async def cancel_probe():
+        probe = asyncio.ensure_future(llm_gateway._acomplete_on(provider, MESSAGES, 0, 5))
+        while not server.requests:
+            await asyncio.sleep(0.01)
+        assert not provider.breaker.available()  # the probe is in flight
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        await llm_gateway.aclose()
+
+    asyncio.run(cancel_probe())
+    assert provider.breaker.state == "half_open" and provider.breaker.available()
@@ -0,0 +1,25 @@
+import backend
+import metrics
+
+
+def query_counts():
+    prefix = "cmat_sqlite_query_duration_seconds_count"
+    return {line.split(" ")[0]: float(line.split(" ")[1]) for line in metrics.render().splitlines()
+            if line.startswith(prefix)}
+
+
+def test_queries_are_labelled_by_the_decorated_function():
+    before = query_counts()
+    backend.add_news("Title", "Body", None, "admin")
+    backend.count_news()
+    backend.get_conn().execute("SELECT 1")
+    after = query_counts()
+
+    def grew(function, op):
+        key = f'cmat_sqlite_query_duration_seconds_count{{function="{function}",op="{op}"}}'
+        return after.get(key, 0) - before.get(key, 0)
+
+    assert grew("backend.add_news", "execute") == 2  # the insert and its data-version bump
+    assert grew("backend.add_news", "commit") == 1
+    assert grew("backend.count_news", "execute") == 1
+    assert grew("other", "execute") == 1
@@ -0,0 +1,83 @@
+import base64
+import json
+
+import pytest
+
+import app as cmat
+import backend
+
+
+@pytest.fixture
+def client():
+    cmat.app.config["TESTING"] = True
+    with cmat.app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def rows():
+    with backend.transaction() as c:
+        c.execute("DELETE FROM news")
+        c.execute("DELETE FROM projects")
+        for i in range(7):
+            # equal timestamps in pairs so the id tie-breaker is exercised
+            c.execute("INSERT INTO news (title, content, created_at) VALUES (?, ?, ?)",
+                      (f"News {i}", "x" * 500, f"2024-01-0{1 + i // 2} 00:00:00"))
+            c.execute("INSERT INTO projects (title, description) VALUES (?, ?)", (f"Project {i}", "long text"))
+    news = [r[0] for r in backend.get_conn().execute("SELECT id FROM news ORDER BY created_at DESC, id DESC")]
+    projects = [r[0] for r in backend.get_conn().execute("SELECT id FROM projects ORDER BY id")]
+    return news, projects
+
+
+def walk(client, url):
+    ids, cursor = [], None
+    while True:
+        response = client.get(url + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        body = response.get_json()
+        assert len(body["items"]) <= 3
+        ids += [item["id"] for item in body["items"]]
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return ids
+
+
+def test_cursor_round_trip():
+    assert backend.decode_cursor(backend.encode_cursor("2024-01-01 00:00:00", 5), str, int) == ["2024-01-01 00:00:00", 5]
+
+
+def test_news_pages_walk_every_item_once(client, rows):
+    news, _ = rows
+    assert walk(client, "/api/news?limit=3") == news
+
+
+def test_project_pages_walk_every_item_once(client, rows):
+    _, projects = rows
+    assert walk(client, "/api/projects?limit=3") == projects
+
+
+def test_news_page_is_trimmed_to_excerpt(client, rows):
+    item = client.get("/api/news?limit=1").get_json()["items"][0]
+    assert len(item["excerpt"]) == backend.NEWS_EXCERPT_CHARS and "content" not in item
+
+
+def raw_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!", raw_cursor({"id": 1}), raw_cursor([]), raw_cursor([1, 2]),
+    raw_cursor([{"id": 1}]), raw_cursor([[1]]), raw_cursor(["1"]), raw_cursor([True]),
+])
+def test_bad_project_cursor_is_a_400(client, rows, cursor):
+    response = client.get(f"/api/projects?limit=3&cursor={cursor}")
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "Invalid cursor"}
+
+
+@pytest.mark.parametrize("cursor", [
+    raw_cursor([5]), raw_cursor(["2024-01-01", "5"]), raw_cursor([{"a": 1}, 5]), raw_cursor(["2024", 5, 6]),
+])
+def test_bad_news_cursor_is_a_400(client, rows, cursor):
+    response = client.get(f"/api/news?limit=3&cursor={cursor}")
+    assert response.status_code == 400
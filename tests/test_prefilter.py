@@ -0,0 +1,51 @@
+import fitz
+import pytest
+
+import backend
+import pdf_pages
+
+FILLER = "The committee met to review progress and agreed on next steps for the programme of work. " * 6
+BUDGET = "Climate adaptation budget allocation: irrigation 1,250,000 and resilience 3,400,000 kwacha. " * 6
+
+
+def report_pdf(tmp_path, pages=40, relevant=(3, 17, 31)):
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, 550, 800), BUDGET if i in relevant else FILLER, fontsize=9)
+    path = tmp_path / "report.pdf"
+    doc.save(str(path))
+    doc.close()
+    return str(path)
+
+
+@pytest.mark.parametrize("budget", [0, 100, 450, 10 ** 6])
+def test_streaming_prefilter_matches_list_prefilter(tmp_path, budget):
+    path = report_pdf(tmp_path)
+    expected = backend.select_relevant_pages(pdf_pages.extract_pages(path, parallel=False), budget)
+    assert backend.select_relevant_pdf_pages(path, budget) == expected
+
+
+def test_streaming_prefilter_rereads_only_kept_pages(tmp_path, monkeypatch):
+    path = report_pdf(tmp_path)
+    reread = []
+    extract_selected = pdf_pages.extract_selected
+    monkeypatch.setattr(pdf_pages, "extract_selected",
+                        lambda p, indices: reread.extend(indices) or extract_selected(p, indices))
+
+    pages, report = backend.select_relevant_pdf_pages(path, 450)
+    assert reread == [3, 17, 31]
+    assert report["kept_pages"] == [4, 18, 32]
+    assert all("budget allocation" in p for p in pages)
+
+
+def test_default_budget_reduces_a_large_document():
+    pages = [FILLER * 8] * 60
+    for i in (5, 25, 45):
+        pages[i] = BUDGET * 8
+    assert sum(map(backend.estimate_tokens, pages)) > 2 * backend.PREFILTER_TOKEN_BUDGET
+
+    kept, report = backend.select_relevant_pages(pages)
+    assert report["tokens_kept"] <= backend.PREFILTER_TOKEN_BUDGET
+    assert report["pages_kept"] < report["pages_total"]
+    assert {6, 26, 46} <= set(report["kept_pages"])
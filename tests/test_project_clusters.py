@@ -0,0 +1,73 @@
+import random
+
+import pytest
+
+import backend
+
+
+def project(latitude, longitude, budget=100.0, completion=50.0):
+    return ("Project", "", None, latitude, longitude, "2024-01-01", "2025-01-01", budget, "Ongoing", completion)
+
+
+@pytest.fixture(autouse=True)
+def empty_projects():
+    with backend.transaction() as c:
+        c.execute("DELETE FROM projects")
+        c.execute("DELETE FROM projects_rtree")
+        c.execute("DELETE FROM project_clusters")
+
+
+def clusters():
+    rows = backend.get_conn().execute("""
+        SELECT zoom, cell_x, cell_y, count, lat_sum, lon_sum, budget_sum, completion_sum, completion_count
+        FROM project_clusters ORDER BY zoom, cell_x, cell_y
+    """).fetchall()
+    return [r[:4] + tuple(round(v, 6) for v in r[4:8]) + r[8:] for r in rows]
+
+
+def rebuilt():
+    with backend.transaction() as c:
+        c.execute("SAVEPOINT rebuild")
+        backend._rebuild_project_clusters(c)
+        result = clusters()
+        c.execute("ROLLBACK TO rebuild")
+    return result
+
+
+def ids():
+    return [r[0] for r in backend.get_conn().execute("SELECT id FROM projects ORDER BY id")]
+
+
+def test_incremental_clusters_match_rebuild_after_add_update_delete():
+    rng = random.Random(7)
+    for _ in range(30):
+        backend.add_project(*project(rng.uniform(-18, -8), rng.uniform(22, 34), rng.uniform(0, 1e6),
+                                     rng.choice([None, rng.uniform(0, 100)])))
+    backend.add_project(*project(None, None))
+    for project_id in ids()[:10]:
+        backend.update_project(project_id, *project(rng.uniform(-18, -8), rng.uniform(22, 34)))
+    backend.update_project(ids()[10], *project(None, None))
+    for project_id in ids()[-8:]:
+        backend.delete_project(project_id)
+
+    assert clusters() == rebuilt()
+    assert sum(r[3] for r in clusters() if r[0] == 0) == len(ids()) - 1
+
+
+def test_boundary_coordinates_land_in_the_same_cell(monkeypatch):
+    # with 7 cells per tile, x // size and CAST(x / size AS INTEGER) disagree for this longitude
+    monkeypatch.setattr(backend, "CLUSTER_CELLS_PER_TILE", 7)
+    backend.add_project(*project(-15.0, -170.595703125))
+    backend.add_project(*project(0.0, 0.0))
+    assert clusters() == rebuilt()
+
+    for project_id in ids():
+        backend.delete_project(project_id)
+    assert clusters() == []
+
+
+def test_clusters_report_counts_and_means():
+    backend.add_project(*project(-15.40, 28.30, 100.0, 40.0))
+    backend.add_project(*project(-15.41, 28.31, 300.0, None))
+    (cell,) = backend.get_project_clusters(0)
+    assert cell["count"] == 2 and cell["budget"] == 400.0 and cell["completion"] == 40.0
@@ -0,0 +1,62 @@
+import pytest
+
+import backend
+
+
+def project(title, latitude, longitude, budget=100.0, completion=50.0):
+    return (title, "", None, latitude, longitude, "2024-01-01", "2025-01-01", budget, "Ongoing", completion)
+
+
+@pytest.fixture(autouse=True)
+def empty_projects():
+    with backend.transaction() as c:
+        c.execute("DELETE FROM projects")
+        c.execute("DELETE FROM projects_rtree")
+        c.execute("DELETE FROM project_clusters")
+
+
+def rtree_rows():
+    return {r[0]: r[1:] for r in backend.get_conn().execute(
+        "SELECT id, min_lat, max_lat, min_lon, max_lon FROM projects_rtree")}
+
+
+def project_id(title):
+    return backend.get_conn().execute("SELECT id FROM projects WHERE title=?", (title,)).fetchone()[0]
+
+
+def in_bbox(*bbox):
+    return [p["title"] for p in backend.get_projects_in_bbox(*bbox)]
+
+
+def test_rtree_follows_add_update_and_delete():
+    backend.add_project(*project("Lusaka solar", -15.4, 28.3))
+    backend.add_project(*project("Unmapped", None, None))
+    lusaka = project_id("Lusaka solar")
+    assert rtree_rows() == {lusaka: pytest.approx((-15.4, -15.4, 28.3, 28.3))}
+
+    backend.update_project(lusaka, *project("Lusaka solar", -12.8, 28.2))
+    assert rtree_rows() == {lusaka: pytest.approx((-12.8, -12.8, 28.2, 28.2))}
+    assert in_bbox(28.0, -13.0, 28.5, -12.5) == ["Lusaka solar"]
+    assert in_bbox(28.0, -16.0, 28.5, -15.0) == []
+
+    backend.update_project(lusaka, *project("Lusaka solar", None, None))
+    assert rtree_rows() == {}
+
+    backend.update_project(lusaka, *project("Lusaka solar", -15.4, 28.3))
+    backend.delete_project(lusaka)
+    assert rtree_rows() == {}
+
+
+def test_bbox_query_rechecks_exact_coordinates():
+    # R*Tree rounds to 32-bit floats; a point just outside the box must not leak in
+    backend.add_project(*project("Edge", -15.0000001, 28.0))
+    assert in_bbox(27.0, -15.0, 29.0, -14.0) == []
+    assert in_bbox(27.0, -15.0000002, 29.0, -14.0) == ["Edge"]
+
+
+def test_init_db_backfills_missing_rtree_rows():
+    backend.add_project(*project("Kitwe water", -12.8, 28.2))
+    with backend.transaction() as c:
+        c.execute("DELETE FROM projects_rtree")
+    backend.init_db()
+    assert list(rtree_rows()) == [project_id("Kitwe water")]
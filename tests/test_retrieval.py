@@ -0,0 +1,54 @@
+import os
+
+import pytest
+
+import backend
+import retrieval
+
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    monkeypatch.setattr(retrieval, "INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(retrieval, "INDEX_PATH", str(tmp_path / "index.joblib"))
+    monkeypatch.setattr(retrieval, "_index", None)
+
+    def add(*pages):
+        with backend.transaction() as c:
+            c.execute("DELETE FROM doc_pages")
+            c.execute("DELETE FROM doc_files")
+            for i, body in enumerate(pages):
+                c.execute("INSERT INTO doc_pages (path, page, body) VALUES (?, ?, ?)", ("nap.pdf", i + 1, body))
+            c.execute("INSERT INTO doc_files VALUES ('nap.pdf', 0, 0, 'hash', ?, 0)", (len(pages),))
+    return add
+
+
+def test_single_page_library_is_searchable(library):
+    library("Drought resilience grants for smallholder irrigation in the Southern Province.")
+    index = retrieval.load_or_build()
+    assert index["matrix"] is not None
+    (hit,) = retrieval.retrieve("irrigation grants")
+    assert hit["doc"] == "nap.pdf" and hit["page"] == 1
+
+
+def test_large_library_prunes_rare_and_ubiquitous_terms(library):
+    library(*[f"Climate allocation for district {i} {'irrigation' if i % 2 else 'roads'}."
+              for i in range(retrieval.PRUNE_MIN_PASSAGES)])
+    vocabulary = retrieval.build_index()["vectorizer"].vocabulary_
+    assert "irrigation" in vocabulary
+    assert "allocation" not in vocabulary  # in every passage
+    assert "district 12" not in vocabulary  # in one passage only
+
+
+def test_stop_word_only_library_builds_an_empty_index(library):
+    library("the and of", "it is")
+    assert retrieval.load_or_build()["matrix"] is None
+    assert retrieval.retrieve("anything") == []
+
+
+def test_index_is_written_atomically_and_reloaded(library, tmp_path):
+    library("Solar mini-grids for rural health centres.")
+    retrieval.build_index()
+    assert os.listdir(tmp_path) == ["index.joblib"]
+
+    retrieval._index = None
+    assert retrieval.load_or_build()["passages"] == [["nap.pdf", 1, "Solar mini-grids for rural health centres."]]
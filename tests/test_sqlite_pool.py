@@ -0,0 +1,77 @@
+import threading
+
+import backend
+
+
+def in_thread(fn):
+    result = []
+    thread = threading.Thread(target=lambda: result.append(fn()))
+    thread.start()
+    thread.join()
+    return result[0]
+
+
+def test_thread_keeps_its_connection_until_released():
+    backend.close_all_connections()
+    conn = backend.get_conn()
+    assert backend.get_conn() is conn
+    assert in_thread(backend.get_conn) is not conn
+
+    backend.release_conn()
+    backend.release_conn()  # repeated release is a no-op
+    assert in_thread(backend.get_conn) is conn
+
+
+def test_connections_are_configured_once_opened():
+    backend.close_all_connections()
+    conn = backend.get_conn()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+    backend.release_conn()
+
+
+def test_release_rolls_back_an_open_transaction():
+    backend.close_all_connections()
+    conn = backend.get_conn()
+    conn.execute("CREATE TABLE IF NOT EXISTS pool_probe (x INTEGER)")
+    conn.commit()
+    conn.execute("INSERT INTO pool_probe VALUES (1)")
+    backend.release_conn()
+
+    assert not conn.in_transaction
+    assert backend.get_conn().execute("SELECT COUNT(*) FROM pool_probe").fetchone()[0] == 0
+    backend.release_conn()
+
+
+def test_pool_keeps_at_most_pool_size_connections(monkeypatch):
+    backend.close_all_connections()
+    monkeypatch.setattr(backend, "SQLITE_POOL_SIZE", 2)
+    barrier = threading.Barrier(4)
+    opened = []
+
+    def borrow():
+        opened.append(backend.get_conn())
+        barrier.wait(timeout=5)
+        backend.release_conn()
+
+    threads = [threading.Thread(target=borrow) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(set(map(id, opened))) == 4
+    assert backend._pool.qsize() == 2
+    backend.close_all_connections()
+
+
+def test_repointed_db_path_drops_stale_connections(tmp_path, monkeypatch):
+    backend.close_all_connections()
+    old = backend.get_conn()
+    backend.release_conn()
+
+    monkeypatch.setattr(backend, "DB_PATH", str(tmp_path / "other.db"))
+    conn = backend.get_conn()
+    assert conn is not old
+    assert conn.execute("PRAGMA database_list").fetchone()[2] == str(tmp_path / "other.db")
+    backend.close_all_connections()